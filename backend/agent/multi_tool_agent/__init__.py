@@ -1 +1,6 @@
-from . import agent
\ No newline at end of file
+try:
+    from . import agent
+except ModuleNotFoundError as e:
+    # without google-adk installed the tools and the local runner still work (tests, benchmarks)
+    if not (e.name or "").startswith("google"):
+        raise
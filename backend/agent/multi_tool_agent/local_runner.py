@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import os
+import time
+
+# An offline stand-in for the ADK runner and the LLM, for testing how the tools behave under load
+# without a model or an API key.
+# StubModel plays the model's side of a conversation from a script: each turn is a list of tool calls, and once
+# the script runs out it answers with a short text. LocalRunner does what the real runner does with those turns:
+# all the tool calls of one turn run together with asyncio.gather, their results go back into the conversation,
+# and the model is asked for its next turn.
+#
+# benchmark, run from backend/ against whatever database the settings point to:
+#   python -m agent.multi_tool_agent.local_runner --conversations 200 --concurrency 50
+
+
+class ToolCall:
+    def __init__(self, name, **args):
+        self.name = name
+        self.args = args
+
+    def __repr__(self):
+        return f"ToolCall({self.name!r}, {self.args!r})"
+
+
+def recommendation_script(user_id, message):
+    # roughly what the model does for "what should I train today?": the user's history and the catalog
+    # for a muscle group in one turn, then the exercises for whatever it settles on.
+    return [
+        [ToolCall("get_user_training_context", user_id=user_id), ToolCall("get_exercises_by_musclegroup", muscle_group="Chest")],
+        [ToolCall("get_workout_musclegroups", user_id=user_id), ToolCall("get_exercises_by_musclegroup", muscle_group="Back")],
+    ]
+
+
+class StubModel:
+    # `script(user_id, message)` returns the turns for a conversation. `latency` is seconds of fake
+    # thinking per turn, spent in asyncio.sleep so it doesn't block other conversations, like a real API call.
+
+    def __init__(self, script=recommendation_script, latency=0.0):
+        self.script = script
+        self.latency = latency
+
+    async def generate(self, user_id, conversation):
+        # the next list of tool calls, or the final text once every scripted turn has been answered
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        turns = self.script(user_id, conversation[0]["content"])
+        answered = sum(1 for message in conversation if message["role"] == "tool")
+        if answered < len(turns):
+            return turns[answered]
+        results = [result for message in conversation if message["role"] == "tool" for result in message["results"]]
+        failed = sum(1 for result in results if isinstance(result, dict) and result.get("status") == "error")
+        return f"Looked at {len(results)} tool results ({failed} errors)."
+
+
+class LocalRunner:
+    def __init__(self, model, tools=None):
+        if tools is None:
+            from .tools import TOOLS
+            tools = TOOLS
+        self.model = model
+        self.tools = {tool.__name__: tool for tool in tools}
+
+    async def call(self, tool_call):
+        # like ADK, a tool that blows up gives the model an error instead of ending the conversation
+        tool = self.tools.get(tool_call.name)
+        if tool is None:
+            return {"status": "error", "error_message": f"Unknown tool {tool_call.name}"}
+        try:
+            return await tool(**tool_call.args)
+        except Exception as e:
+            return {"status": "error", "error_message": str(e)}
+
+    async def run(self, user_id, message):
+        # returns the whole conversation, the model's answer is the last message
+        conversation = [{"role": "user", "content": message}]
+        while True:
+            reply = await self.model.generate(user_id, conversation)
+            if isinstance(reply, str):
+                conversation.append({"role": "model", "content": reply})
+                return conversation
+            results = await asyncio.gather(*(self.call(tool_call) for tool_call in reply))
+            conversation.append({"role": "tool", "calls": reply, "results": list(results)})
+
+    async def run_many(self, user_ids, message, concurrency=10):
+        # one conversation per user id, at most `concurrency` at a time. Returns (conversations, seconds).
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(user_id):
+            async with semaphore:
+                return await self.run(user_id, message)
+
+        started = time.perf_counter()
+        conversations = await asyncio.gather(*(one(user_id) for user_id in user_ids))
+        return conversations, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run scripted agent conversations against the real tools, no LLM needed.")
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model latency per turn, in seconds")
+    args = parser.parse_args()
+
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ascend.settings')
+    django.setup()
+    from asgiref.sync import sync_to_async
+    from django.contrib.auth import get_user_model
+    from .tool_cache import tool_cache
+    from .tools import TOOLS
+
+    user_ids = list(get_user_model().objects.values_list('id', flat=True)[:args.conversations]) or [1]
+    user_ids = (user_ids * args.conversations)[:args.conversations]
+    model = StubModel(latency=args.latency)
+    # the same tools the old way, every call queued on the one thread sensitive thread, for comparison
+    serialized = []
+    for tool in TOOLS:
+        serialized_tool = sync_to_async(tool.func)
+        serialized_tool.__name__ = tool.__name__
+        serialized.append(serialized_tool)
+
+    for label, tools in [("thread sensitive", serialized), ("tool pool", TOOLS)]:
+        tool_cache.clear() # measure the queries, not the memo
+        conversations, seconds = asyncio.run(LocalRunner(model, tools).run_many(user_ids, "What should I train today?", args.concurrency))
+        calls = sum(len(message["calls"]) for conversation in conversations for message in conversation if message["role"] == "tool")
+        print(f"{label:17} {len(conversations)} conversations, {calls} tool calls in {seconds:.2f}s "
+              f"({len(conversations) / seconds:.1f} conversations/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import atexit
+import time
+import uuid
+
+from django.conf import settings
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+
+from .session_store import SessionStore, trim_events
+
+# ADK session service for the workout agent, instead of InMemorySessionService, which kept every conversation
+# in memory for as long as the process lived and lost all of them on restart.
+# hot sessions live in a bounded LRU and cold ones in sqlite (session_store.py). Every session also only keeps
+# its newest AGENT_SESSION_MAX_EVENTS events, cut at a user turn. The model only needs recent turns,
+# the user's history comes from the tools anyway.
+#
+# like the in-memory service, callers get copies and app:/user: state is shared between sessions.
+
+
+class BoundedSessionService(BaseSessionService):
+    def __init__(self, path=None, max_sessions=None, idle_seconds=None, max_events=None):
+        self.store = SessionStore(
+            path or settings.AGENT_SESSION_DB,
+            max_sessions or settings.AGENT_SESSION_MAX_IN_MEMORY,
+            idle_seconds or settings.AGENT_SESSION_IDLE_SECONDS,
+            dumps=lambda session: session.model_dump_json(),
+            loads=Session.model_validate_json,
+        )
+        self.max_events = max_events or settings.AGENT_SESSION_MAX_EVENTS
+        self.store.start_sweeping(settings.AGENT_SESSION_SWEEP_SECONDS)
+        atexit.register(self.store.flush)
+
+    def merged(self, session):
+        # a copy for the caller, with the shared app and user state added back under their prefixes
+        copy = session.model_copy(deep=True)
+        for key, value in self.store.app_state(session.app_name).items():
+            copy.state[State.APP_PREFIX + key] = value
+        for key, value in self.store.user_state(session.app_name, session.user_id).items():
+            copy.state[State.USER_PREFIX + key] = value
+        return copy
+
+    def apply_state(self, session, delta):
+        # app:/user: keys go to the shared state, temp: keys aren't kept, the rest belongs to the session
+        app_delta, user_delta = {}, {}
+        for key, value in delta.items():
+            if key.startswith(State.APP_PREFIX):
+                app_delta[key.removeprefix(State.APP_PREFIX)] = value
+            elif key.startswith(State.USER_PREFIX):
+                user_delta[key.removeprefix(State.USER_PREFIX)] = value
+            elif not key.startswith(State.TEMP_PREFIX):
+                session.state[key] = value
+        if app_delta:
+            self.store.update_app_state(session.app_name, app_delta)
+        if user_delta:
+            self.store.update_user_state(session.app_name, session.user_id, user_delta)
+
+    async def create_session(self, *, app_name, user_id, state=None, session_id=None):
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        key = (app_name, user_id, session_id)
+        if self.store.get(key) is not None:
+            raise ValueError(f"Session {session_id} already exists.")
+        session = Session(id=session_id, app_name=app_name, user_id=user_id, state={}, last_update_time=time.time())
+        self.apply_state(session, state or {})
+        self.store.put(key, session)
+        return self.merged(session)
+
+    async def get_session(self, *, app_name, user_id, session_id, config: GetSessionConfig | None = None):
+        session = self.store.get((app_name, user_id, session_id))
+        if session is None:
+            return None
+        copy = self.merged(session)
+        if config:
+            if config.num_recent_events:
+                copy.events = copy.events[-config.num_recent_events:]
+            if config.after_timestamp:
+                copy.events = [event for event in copy.events if event.timestamp >= config.after_timestamp]
+        return copy
+
+    async def list_sessions(self, *, app_name, user_id):
+        sessions = []
+        for session in self.store.sessions(app_name, user_id):
+            copy = self.merged(session)
+            copy.events = []
+            sessions.append(copy)
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name, user_id, session_id):
+        self.store.delete((app_name, user_id, session_id))
+
+    async def append_event(self, session, event):
+        if event.partial:
+            return event
+        await super().append_event(session=session, event=event) # updates the caller's copy
+        session.last_update_time = event.timestamp
+
+        key = (session.app_name, session.user_id, session.id)
+        stored = self.store.get(key)
+        if stored is None:
+            return event # deleted in the meantime
+        if event.actions and event.actions.state_delta:
+            self.apply_state(stored, event.actions.state_delta)
+        stored.events = trim_events(stored.events + [event], self.max_events, lambda e: e.author == "user")
+        stored.last_update_time = event.timestamp
+        self.store.put(key, stored)
+        return event
@@ -0,0 +1,166 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Storage behind the agent's session service (session_service.py), kept free of google-adk so it can be tested on its own.
+# sessions being talked to stay in memory, in an LRU of at most `max_sessions`. A session that hasn't been used for
+# `idle_seconds`, or is the least recently used one when the LRU is full, gets written to a sqlite file and dropped
+# from memory. Asking for it again loads it back. So memory is bounded by the number of live conversations, and
+# with flush() at shutdown (the service registers it with atexit) a restart doesn't lose anyone's conversation.
+# a crash still loses the newest turns of the sessions that were in memory, they're only written when they go cold.
+# get/put evict as they go, and start_sweeping() runs evict() in the background too, so idle sessions still go to
+# disk when no requests come in.
+#
+# sessions are opaque here: the service passes in `dumps`/`loads` to turn one into text and back.
+# app and user wide state (ADK's "app:" and "user:" keys) is small and rarely changes, so it's written through straight away.
+
+
+def trim_events(events, max_events, starts_turn):
+    # keeps the newest events, at most max_events of them. The cut always lands on the start of a turn
+    # (`starts_turn(event)`), so a tool call never loses its response and the model never sees half a turn.
+    # if the newest turn alone is longer than max_events it's kept whole.
+    if len(events) <= max_events:
+        return events
+    for start in range(len(events) - max_events, len(events)):
+        if starts_turn(events[start]):
+            return events[start:]
+    for start in range(len(events) - max_events - 1, 0, -1):
+        if starts_turn(events[start]):
+            return events[start:]
+    return events
+
+
+class SessionStore:
+    def __init__(self, path, max_sessions, idle_seconds, dumps, loads):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.dumps = dumps
+        self.loads = loads
+        self._hot = OrderedDict() # key -> [last used, session, changed since last written], least recently used first
+        self._lock = threading.RLock()
+        self._sweeper = None
+        self._stop_sweeping = threading.Event()
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                app_name TEXT, user_id TEXT, session_id TEXT, data TEXT, updated_at REAL,
+                PRIMARY KEY (app_name, user_id, session_id)
+            );
+            CREATE TABLE IF NOT EXISTS app_states (app_name TEXT PRIMARY KEY, data TEXT);
+            CREATE TABLE IF NOT EXISTS user_states (app_name TEXT, user_id TEXT, data TEXT, PRIMARY KEY (app_name, user_id));
+        """)
+        self.db.commit()
+
+    # ---- sessions, key is (app_name, user_id, session_id) ----
+
+    def get(self, key):
+        with self._lock:
+            entry = self._hot.get(key)
+            if entry is not None:
+                entry[0] = time.monotonic()
+                self._hot.move_to_end(key)
+                session = entry[1]
+            else:
+                session = self._read(key)
+                if session is not None:
+                    self._hot[key] = [time.monotonic(), session, False]
+            self.evict()
+            return session
+
+    def put(self, key, session):
+        with self._lock:
+            self._hot[key] = [time.monotonic(), session, True]
+            self._hot.move_to_end(key)
+            self.evict()
+
+    def delete(self, key):
+        with self._lock:
+            self._hot.pop(key, None)
+            self.db.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+            self.db.commit()
+
+    def sessions(self, app_name, user_id):
+        # every session of a user, in memory or not. The cold ones are read but not pulled into the LRU.
+        with self._lock:
+            found = {key[2]: entry[1] for key, entry in self._hot.items() if key[:2] == (app_name, user_id)}
+            rows = self.db.execute("SELECT session_id, data FROM sessions WHERE app_name = ? AND user_id = ?", (app_name, user_id))
+            for session_id, data in rows:
+                if session_id not in found:
+                    found[session_id] = self.loads(data)
+            return list(found.values())
+
+    def evict(self):
+        # oldest first: everything idle for too long, then whatever is over max_sessions
+        with self._lock:
+            cutoff = time.monotonic() - self.idle_seconds
+            while self._hot:
+                key, (last_used, _, _) = next(iter(self._hot.items()))
+                if last_used >= cutoff and len(self._hot) <= self.max_sessions:
+                    break
+                self._spill(key)
+
+    def start_sweeping(self, interval):
+        # a daemon thread that calls evict() every `interval` seconds until stop_sweeping()
+        def sweep():
+            while not self._stop_sweeping.wait(interval):
+                self.evict()
+
+        self._stop_sweeping.clear()
+        self._sweeper = threading.Thread(target=sweep, name="agent-session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeping(self):
+        if self._sweeper is not None:
+            self._stop_sweeping.set()
+            self._sweeper.join()
+            self._sweeper = None
+
+    def flush(self):
+        # writes every changed session that's in memory, they stay in memory
+        with self._lock:
+            for key, entry in self._hot.items():
+                if entry[2]:
+                    self._write(key, entry[1])
+                    entry[2] = False
+
+    def in_memory(self):
+        return len(self._hot)
+
+    def _spill(self, key):
+        _, session, changed = self._hot.pop(key)
+        if changed:
+            self._write(key, session)
+
+    def _write(self, key, session):
+        self.db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)", (*key, self.dumps(session), time.time()))
+        self.db.commit()
+
+    def _read(self, key):
+        row = self.db.execute("SELECT data FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", key).fetchone()
+        return self.loads(row[0]) if row else None
+
+    # ---- shared state ----
+
+    def app_state(self, app_name):
+        with self._lock:
+            row = self.db.execute("SELECT data FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+            return json.loads(row[0]) if row else {}
+
+    def update_app_state(self, app_name, delta):
+        with self._lock:
+            state = {**self.app_state(app_name), **delta}
+            self.db.execute("INSERT OR REPLACE INTO app_states VALUES (?, ?)", (app_name, json.dumps(state)))
+            self.db.commit()
+
+    def user_state(self, app_name, user_id):
+        with self._lock:
+            row = self.db.execute("SELECT data FROM user_states WHERE app_name = ? AND user_id = ?", (app_name, user_id)).fetchone()
+            return json.loads(row[0]) if row else {}
+
+    def update_user_state(self, app_name, user_id, delta):
+        with self._lock:
+            state = {**self.user_state(app_name, user_id), **delta}
+            self.db.execute("INSERT OR REPLACE INTO user_states VALUES (?, ?, ?)", (app_name, user_id, json.dumps(state)))
+            self.db.commit()
@@ -0,0 +1,225 @@
+import asyncio
+import inspect
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from agent.multi_tool_agent.local_runner import LocalRunner, StubModel, ToolCall
+from agent.multi_tool_agent.session_store import SessionStore, trim_events
+from agent.multi_tool_agent.tool_cache import Uncached, cached_user_tool, tool_cache
+from agent.multi_tool_agent.tools import db_tool, get_user_training_context
+from exercise.models import Exercise, ExerciseRecord, Tag
+from user.cache import bump_data_version
+from user.models import User
+from workout.models import WorkoutExercise, WorkoutSession
+
+
+class ToolCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tool_cache.clear()
+        self.calls = []
+
+        @cached_user_tool
+        def volume(user_id: int) -> dict:
+            self.calls.append(user_id)
+            return {"status": "success", "total_volume": 500.0}
+
+        self.volume = volume
+
+    def test_called_by_keyword_like_the_model_does(self):
+        self.assertEqual(self.volume(user_id=1), {"status": "success", "total_volume": 500.0})
+        self.assertEqual(self.volume(1), {"status": "success", "total_volume": 500.0}) # same entry by position
+        self.assertEqual(self.calls, [1])
+
+    def test_data_change_invalidates(self):
+        self.volume(user_id=1)
+        bump_data_version(1)
+        self.volume(user_id=1)
+        self.volume(user_id=2)
+        self.assertEqual(self.calls, [1, 1, 2])
+
+    def test_fallbacks_are_not_cached(self):
+        @cached_user_tool
+        def failing_volume(user_id: int) -> float:
+            self.calls.append(user_id)
+            return Uncached(0.0)
+
+        self.assertEqual(failing_volume(user_id=1), 0.0)
+        self.assertEqual(failing_volume(user_id=1), 0.0)
+        self.assertEqual(self.calls, [1, 1])
+        self.assertEqual(len(tool_cache), 0)
+
+
+
+class TrainingContextTests(TestCase):
+    def test_one_query(self):
+        user = User.objects.create_user(username="lifter", password="password123")
+        bench = Exercise.objects.create(name="Bench Press")
+        bench.tags.add(Tag.objects.create(name="Chest"), Tag.objects.create(name="Triceps"))
+        plank = Exercise.objects.create(name="Plank") # no tags, no record
+        ExerciseRecord.objects.create(user=user, exercise=bench, personal_record=120, date_of_pr=date(2025, 5, 1))
+        ExerciseRecord.objects.create(user=User.objects.create_user(username="other", password="password123"),
+                                      exercise=bench, personal_record=300)
+        workout = WorkoutSession.objects.create(user=user, name="Push")
+        WorkoutExercise.objects.create(workout=workout, exercise=bench, reps=5, weight=100)
+        WorkoutExercise.objects.create(workout=workout, exercise=bench, reps=5, weight=120)
+        WorkoutExercise.objects.create(workout=workout, exercise=plank, reps=1, weight=0)
+
+        with self.assertNumQueries(1):
+            context = inspect.unwrap(get_user_training_context.func)(user.id) # without the cache and the thread pool
+
+        self.assertEqual(context, {
+            "status": "success",
+            "days": 14,
+            "total_volume": 1100.0, # not doubled by bench having two tags
+            "muscle_groups": ["Chest", "Triceps"],
+            "recent_exercises": ["Bench Press", "Plank"],
+            "personal_records": [{"exercise": "Bench Press", "personal_record": 120.0, "date": "2025-05-01"}],
+        })
+
+
+# TransactionTestCase because the tools run in the pool's threads, on their own connections,
+# and those can't see data from an open test transaction.
+class ConcurrentToolTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear() # new catalog version, so the exercise search index gets rebuilt from this test's rows
+        tool_cache.clear()
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        bench = Exercise.objects.create(name="Bench Press")
+        bench.tags.add(Tag.objects.create(name="Chest"))
+        workout = WorkoutSession.objects.create(user=self.user, name="Push")
+        WorkoutExercise.objects.create(workout=workout, exercise=bench, reps=5, weight=100)
+
+    def test_tools_in_one_turn_run_at_the_same_time(self):
+        # every call waits for the other two, so this only finishes if all three are running at once
+        barrier = threading.Barrier(3, timeout=5)
+        threads = set()
+
+        @db_tool
+        def wait_for_others(n: int) -> dict:
+            threads.add(threading.current_thread().name)
+            barrier.wait()
+            return {"status": "success", "n": n}
+
+        model = StubModel(script=lambda user_id, message: [[ToolCall("wait_for_others", n=n) for n in range(3)]])
+        conversation = asyncio.run(LocalRunner(model, [wait_for_others]).run(self.user.id, "hi"))
+
+        self.assertEqual([result["n"] for result in conversation[1]["results"]], [0, 1, 2])
+        self.assertEqual(conversation[-1], {"role": "model", "content": "Looked at 3 tool results (0 errors)."})
+        self.assertEqual(len(threads), 3)
+        self.assertTrue(all(name.startswith("agent-tool") for name in threads))
+
+    def test_conversations_overlap_up_to_the_pool_size(self):
+        running = 0
+        most = 0
+        lock = threading.Lock()
+
+        @db_tool
+        def slow_tool(user_id: int) -> dict:
+            nonlocal running, most
+            with lock:
+                running += 1
+                most = max(most, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+            return {"status": "success"}
+
+        model = StubModel(script=lambda user_id, message: [[ToolCall("slow_tool", user_id=user_id)]])
+        conversations, seconds = asyncio.run(
+            LocalRunner(model, [slow_tool]).run_many(range(settings.AGENT_TOOL_WORKERS * 2), "hi", concurrency=100))
+
+        self.assertEqual(len(conversations), settings.AGENT_TOOL_WORKERS * 2)
+        self.assertGreater(most, 1)
+        self.assertLessEqual(most, settings.AGENT_TOOL_WORKERS) # bounded by the pool
+        self.assertLess(seconds, 0.05 * settings.AGENT_TOOL_WORKERS * 2) # quicker than one call after another
+
+    def test_real_tools_through_the_runner(self):
+        runner = LocalRunner(StubModel())
+        conversations, _ = asyncio.run(runner.run_many([self.user.id] * 4, "What should I train today?"))
+
+        for conversation in conversations:
+            context, chest = conversation[1]["results"]
+            self.assertEqual(context["recent_exercises"], ["Bench Press"])
+            self.assertEqual(context["total_volume"], 500.0)
+            self.assertEqual(chest, {"status": "success", "exercises": ["Bench Press"]})
+            self.assertEqual(conversation[2]["results"][0], {"status": "success", "report": ["Chest"]})
+
+    def test_tools_take_arguments_by_name(self):
+        # that's how the model passes them. Same cache entry as calling by position.
+        by_name = asyncio.run(get_user_training_context(user_id=self.user.id))
+        self.assertEqual(by_name, asyncio.run(get_user_training_context(self.user.id)))
+        self.assertEqual(len(tool_cache), 1)
+
+
+class SessionStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "sessions.sqlite3")
+
+    def store(self, max_sessions=2, idle_seconds=60):
+        store = SessionStore(self.path, max_sessions, idle_seconds, dumps=json.dumps, loads=json.loads)
+        self.addCleanup(store.db.close)
+        return store
+
+    def test_least_recently_used_goes_to_disk(self):
+        store = self.store()
+        for n in range(3):
+            store.put(("app", "1", str(n)), {"events": [n]})
+            store.get(("app", "1", "0")) # keeps session 0 hot
+
+        self.assertEqual(store.in_memory(), 2)
+        self.assertEqual(store.get(("app", "1", "1")), {"events": [1]}) # read back from sqlite
+        self.assertEqual(sorted(s["events"][0] for s in store.sessions("app", "1")), [0, 1, 2])
+
+    def test_idle_sessions_go_to_disk(self):
+        store = self.store(max_sessions=10)
+        store.put(("app", "1", "a"), {"events": []})
+        with mock.patch("agent.multi_tool_agent.session_store.time.monotonic", return_value=time.monotonic() + 61):
+            store.put(("app", "1", "b"), {"events": []})
+
+        self.assertEqual(store.in_memory(), 1)
+        self.assertEqual(store.get(("app", "1", "a")), {"events": []})
+
+    def test_idle_sessions_go_to_disk_without_requests(self):
+        store = self.store(max_sessions=10, idle_seconds=0.01)
+        store.put(("app", "1", "a"), {"events": []})
+        store.start_sweeping(0.01)
+        self.addCleanup(store.stop_sweeping)
+
+        deadline = time.monotonic() + 5
+        while store.in_memory() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(store.in_memory(), 0)
+        self.assertEqual(store.get(("app", "1", "a")), {"events": []}) # written out before it was dropped
+
+    def test_flushed_sessions_survive_a_restart(self):
+        store = self.store()
+        store.put(("app", "1", "a"), {"events": ["hi"]})
+        store.update_user_state("app", "1", {"units": "kg"})
+        store.flush()
+
+        restarted = self.store()
+        self.assertEqual(restarted.get(("app", "1", "a")), {"events": ["hi"]})
+        self.assertEqual(restarted.user_state("app", "1"), {"units": "kg"})
+        restarted.delete(("app", "1", "a"))
+        self.assertIsNone(self.store().get(("app", "1", "a")))
+
+    def test_trim_cuts_at_a_turn(self):
+        events = ["user", "call", "result", "model", "user", "call", "result", "model", "user", "model"]
+        starts_turn = lambda event: event == "user"
+
+        self.assertEqual(trim_events(events, 20, starts_turn), events)
+        self.assertEqual(trim_events(events, 5, starts_turn), ["user", "model"]) # not from the middle of a turn
+        self.assertEqual(trim_events(events, 6, starts_turn), events[4:])
+        self.assertEqual(trim_events(events[:4], 2, starts_turn), events[:4]) # one long turn is kept whole
@@ -0,0 +1,63 @@
+import copy
+import functools
+import inspect
+
+from django.conf import settings
+
+from exercise.catalog import get_catalog_version
+from main.ttl_cache import TTLCache
+from user.cache import get_data_version
+
+# Memoizes agent tool results for the length of a conversation or so. The LLM tends to call the same tool
+# with the same arguments several times in one chat, and every call is a thread hop plus ORM queries.
+#
+# per user tools are keyed with the user's data version (user/cache.py). Logging a workout, a weigh in or
+# editing the profile bumps it, so those results go stale the moment the user's data changes.
+# catalog tools (exercises by muscle group) are the same for everyone and keyed with the catalog version
+# (exercise/catalog.py), which moves whenever an exercise or tag changes.
+# the agent runs in its own process, so it only sees the web app's bumps through a shared cache (main/shared_cache.py).
+# on top of that every entry expires after AGENT_TOOL_CACHE_TTL seconds and the cache holds AGENT_TOOL_CACHE_SIZE
+# entries at most, dropping the least recently used.
+
+tool_cache = TTLCache(settings.AGENT_TOOL_CACHE_SIZE, settings.AGENT_TOOL_CACHE_TTL)
+
+
+class Uncached:
+    # wraps a fallback a tool returns when something went wrong (like 0.0 volume when the query failed).
+    # the caller gets the value, but it isn't cached, the next call tries again.
+    def __init__(self, value):
+        self.value = value
+
+
+def should_cache(result):
+    # error replies are cheap to produce again and might be a passing problem (database hiccup), so keep asking
+    return not (isinstance(result, dict) and result.get("status") == "error")
+
+
+def memoize(func, version_for):
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # the model passes arguments by name, tests and other code usually by position. Same key either way.
+        arguments = signature.bind(*args, **kwargs).arguments
+        key = (func.__name__, tuple(arguments.items()), version_for(*arguments.values()))
+        result = tool_cache.get(key)
+        if result is None:
+            result = func(*args, **kwargs)
+            if isinstance(result, Uncached):
+                return result.value
+            if should_cache(result):
+                tool_cache.set(key, result)
+        return copy.deepcopy(result) # callers get their own copy, so nothing can change the cached one
+
+    return wrapper
+
+
+def cached_user_tool(func):
+    # for tools whose first argument is the user id. Goes under @db_tool (tools.py), so the version lookup runs in the worker thread too.
+    return memoize(func, lambda user_id, *args: get_data_version(user_id))
+
+
+def cached_catalog_tool(func):
+    return memoize(func, lambda *args: get_catalog_version())
@@ -0,0 +1,251 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import FilteredRelation, Q, Sum
+from django.utils import timezone
+
+from exercise.models import Exercise, Tag
+from exercise.search import search_exercises
+from workout.models import WorkoutExercise
+from workout.rollups import SET_VOLUME
+
+from .tool_cache import Uncached, cached_catalog_tool, cached_user_tool
+
+# The agent's tools, kept apart from agent.py so they can be imported (and tested, see local_runner.py)
+# without google-adk or a model. Django has to be set up before importing this.
+#
+# a plain @sync_to_async is thread sensitive: every tool call from every conversation runs on the one shared
+# sync thread, so a slow query in one chat held up all the others. The tools run in their own bounded pool
+# instead (AGENT_TOOL_WORKERS threads), which also caps how many database connections the agent can hold.
+# when the model asks for several tools in one turn they run side by side.
+
+tool_executor = ThreadPoolExecutor(max_workers=settings.AGENT_TOOL_WORKERS, thread_name_prefix="agent-tool")
+
+
+def db_tool(func):
+    # every pool thread keeps its own connection, so drop it between calls if it's broken or past CONN_MAX_AGE,
+    # the same thing Django does at the start and end of a request.
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False, executor=tool_executor)
+
+
+@db_tool
+@cached_user_tool
+def get_workout_volume(user_id: int) -> float:
+    """
+    Gets the total workout volume (sum of reps * weight for each set) for a user
+    over the last 14 days.
+
+    Args:
+        user_id (int): The ID of the user whose workout volume is requested.
+
+    Returns:
+        float: The total workout volume, or 0.0 if no relevant workout sets or user not found.
+    """
+    try:
+        seven_days_ago = timezone.now() - timedelta(days=14)
+
+        # the database adds up reps * weight itself, one row comes back instead of every set.
+        # filtering on workout__user_id directly also saves looking the user up first (unknown ids just get 0).
+        total_volume = WorkoutExercise.objects.filter(
+            workout__user_id=user_id,
+            workout__date__gte=seven_days_ago.date()
+        ).aggregate(total=Sum(SET_VOLUME))['total']
+        return float(total_volume or 0)
+
+    except Exception as e:
+        print(f"ERROR: Failed to get workout volume for user {user_id}: {e}")
+        return Uncached(0.0) # not cached, or a database hiccup would read as no training for the whole TTL
+    
+@db_tool
+@cached_catalog_tool
+def get_exercises_by_musclegroup(muscle_group: str) -> dict:
+    """
+    Gets a list of exercise names for a given muscle group tag (e.g., 'Chest', 'Back').
+    Use this tool when the user wants to know what types of exercises exist for a
+    specific muscle, not for a personalized recommendation.
+
+    Args:
+        muscle_group (str): The name of the muscle group to search for.
+
+    Returns:
+        dict: A dictionary containing a list of exercise names or an error message.
+    """
+    try:
+        # read from the in-memory search index (exercise/search.py) instead of a tags join every time,
+        # the tag match is case-insensitive there too
+        exercises = search_exercises("", tag=muscle_group, limit=None)
+
+        if not exercises:
+            return {
+                "status": "error",
+                "error_message": f"Sorry, I couldn't find any exercises for the muscle group '{muscle_group}'. Please check the spelling or try another muscle group."
+            }
+
+        exercise_names = sorted(exercise.name for exercise in exercises)
+        return {"status": "success", "exercises": exercise_names}
+
+    except Exception as e:
+        print(f"ERROR: Failed to get exercises for muscle group {muscle_group}: {e}")
+        return {
+            "status": "error",
+            "error_message": "An unexpected error occurred while looking up exercises."
+        }
+
+@db_tool
+@cached_user_tool
+def get_workout_musclegroups(user_id: int) -> dict:
+    """
+    Returns the distinct muscle group tags (e.g., 'Back', 'Legs', 'Chest')
+    associated with exercises performed by the user in their workouts over the last week.
+    Use this tool to gather context to understand what muscle groups they have not recently
+    been hitting for a balanced recommendation.
+
+    Args:
+        user_id (int): The ID of the user whose workout muscle groups targeted is requested.
+
+    Returns:
+        dict: A dictionary containing 'status' and 'report' (list of muscle group names)
+              or 'error_message' if no relevant workouts or user not found.
+    """
+    try:
+        seven_days_ago = timezone.now() - timedelta(days=14)
+
+        # REWORKED QUERY: Using the new, cleaner relationship path.
+        # The old 'tags__workoutexercise_set__...' is now 'tags__exercise__...'
+        distinct_muscle_group_names = Tag.objects.filter(
+            tags__exercise__workout__user_id=user_id, # no separate user lookup needed
+            tags__exercise__workout__date__gte=seven_days_ago.date()
+        ).values_list('name', flat=True).distinct()
+
+        if distinct_muscle_group_names:
+            report_list = sorted(list(distinct_muscle_group_names))
+            return {"status": "success", "report": report_list}
+        else:
+            return {
+                "status": "error",
+                "error_message": (
+                    f"Sorry, I don't have recent workout muscle group information for you. "
+                    "Please log some workouts with exercises that have assigned tags (e.g., 'Back', 'Legs') for a more personalized recommendation!"
+                ),
+            }
+
+    except Exception as e:
+        print(f"ERROR: Failed to get workout muscle groups for user {user_id}: {e}")
+        return {
+            "status": "error",
+            "error_message": (
+                f"An unexpected error occurred while retrieving your workout muscle groups. Please try again later."
+            ),
+        }
+    
+@db_tool
+@cached_user_tool
+def get_recent_exercises(user_id: int):
+    """
+    Gets a list of distinct, specific exercise names performed by a user recently.
+    Use this tool when a user asks what exercises they have been doing or focusing on.
+    Do not use this for broad categories; use get_workout_musclegroups for that.
+
+    Args:
+        user_id (int): The ID of the user whose recent exercises are requested.
+        days_ago (int): The number of days to look back. Defaults to 30.
+
+    Returns:
+        dict: A dictionary containing the status and a list of exercise names.
+    """
+    try:
+        time_window = timezone.now() - timedelta(days=14)
+
+        # This query traverses from Exercise -> WorkoutExercise -> WorkoutSession -> User
+        # It leverages the related_name='exercise' you set up.
+        recent_exercise_names = Exercise.objects.filter(
+            exercise__workout__user_id=user_id,
+            exercise__workout__date__gte=time_window.date()
+        ).values_list('name', flat=True).distinct()
+
+        if not recent_exercise_names:
+            return {
+                "status": "error",
+                "error_message": f"I couldn't find any specific exercises logged for you in the last {14} days."
+            }
+
+        # Sort the list alphabetically for a clean, predictable output
+        report_list = sorted(list(recent_exercise_names))
+        return {"status": "success", "exercises": report_list}
+
+    except Exception as e:
+        print(f"Error in get_recent_exercises: {e}")
+        return {"status": "error", "error_message": "An unexpected error occurred while retrieving your recent exercises."}
+
+@db_tool
+@cached_user_tool
+def get_user_training_context(user_id: int) -> dict:
+    """
+    Gets everything about the user's recent training in one call: their total workout volume
+    over the last 14 days, the muscle groups they trained, the specific exercises they did,
+    and their personal records on those exercises.
+    Use this tool first when making a personalized recommendation, instead of calling
+    get_workout_volume, get_workout_musclegroups and get_recent_exercises one by one.
+
+    Args:
+        user_id (int): The ID of the user whose training context is requested.
+
+    Returns:
+        dict: A dictionary with 'status', 'days', 'total_volume', 'muscle_groups',
+              'recent_exercises' and 'personal_records', or 'error_message'.
+    """
+    try:
+        days = 14
+        since = (timezone.now() - timedelta(days=days)).date()
+
+        # 1 query: one row per (exercise, muscle group tag) done in the window, with the exercise's volume
+        # (grouping by the tag undoes the join repeating every set once per tag) and the user's record on it,
+        # joined in with a FilteredRelation. Exercises without tags or without a record still get their row.
+        rows = list(
+            WorkoutExercise.objects.filter(workout__user_id=user_id, workout__date__gte=since)
+            .annotate(record=FilteredRelation('exercise__exerciserecord', condition=Q(exercise__exerciserecord__user_id=user_id)))
+            .values('exercise_id', 'exercise__name', 'exercise__tags__name', 'record__personal_record', 'record__date_of_pr')
+            .annotate(volume=Sum(SET_VOLUME))
+        )
+        if not rows:
+            return {
+                "status": "error",
+                "error_message": f"I couldn't find any workouts logged for you in the last {days} days."
+            }
+
+        exercises = {row['exercise_id']: row for row in rows} # the exercise's columns are the same in each of its rows
+        records = sorted((
+            (row['exercise__name'], row['record__personal_record'], row['record__date_of_pr'])
+            for row in exercises.values() if row['record__personal_record'] is not None
+        ), key=lambda record: record[0])
+        return {
+            "status": "success",
+            "days": days,
+            "total_volume": float(sum(row['volume'] or 0 for row in exercises.values())),
+            "muscle_groups": sorted({row['exercise__tags__name'] for row in rows if row['exercise__tags__name']}),
+            "recent_exercises": sorted({row['exercise__name'] for row in rows}),
+            "personal_records": [
+                {"exercise": name, "personal_record": float(record),
+                 "date": date_of_pr.isoformat() if date_of_pr else None}
+                for name, record, date_of_pr in records
+            ],
+        }
+
+    except Exception as e:
+        print(f"ERROR: Failed to get training context for user {user_id}: {e}")
+        return {"status": "error", "error_message": "An unexpected error occurred while retrieving your training history."}
+
+
+TOOLS = [get_user_training_context, get_workout_volume, get_workout_musclegroups, get_exercises_by_musclegroup, get_recent_exercises]
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'workout',
     'exercise',
     'user',
+    'recommendation_model',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -53,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.RequestMetricsMiddleware', # first, so its timing covers everything below it
+    'main.nplusone.NPlusOneMiddleware', # only active when NPLUSONE_DETECTOR is enabled below
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -144,10 +147,59 @@ AUTH_USER_MODEL = "user.User" # use my own defined user model rather than django
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'user.authentication.CachedTokenAuthentication', # TokenAuthentication plus a short lived in-process cache
     ],
 }
 
+TOKEN_AUTH_CACHE_TTL = 60 # seconds a token lookup is reused for
+TOKEN_AUTH_CACHE_SIZE = 10000 # max cached tokens per process
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# in-process memory by default, which is only meant for development: every worker gets its own cache and doesn't see
+# the others invalidating it (main/shared_cache.py, `manage.py check --deploy` warns about it).
+# In production point these at a shared backend, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://127.0.0.1:6379
+# or CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache CACHE_LOCATION=/var/tmp/ascend_cache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'ascend'),
+    }
+}
+
+USER_RESPONSE_CACHE_TIMEOUT = 60 * 60 # seconds. entries are also invalidated whenever the users data changes.
+# with the in-process cache, version keys (user/cache.py) expire after this many seconds, so a worker that missed
+# another one's invalidation catches up. A shared cache keeps them until they're bumped.
+LOCAL_CACHE_VERSION_TIMEOUT = 30
+
+# in process memo of the agent's tool results (agent/multi_tool_agent/tool_cache.py)
+AGENT_TOOL_CACHE_TTL = 5 * 60 # seconds, roughly one conversation
+AGENT_TOOL_CACHE_SIZE = 5000
+# threads the agent's database tools run in (agent/multi_tool_agent/tools.py), also the most db connections they can hold
+AGENT_TOOL_WORKERS = int(os.environ.get('AGENT_TOOL_WORKERS', 8))
+
+# agent conversations (agent/multi_tool_agent/session_service.py): at most this many in memory, the rest in a sqlite file
+AGENT_SESSION_DB = os.environ.get('AGENT_SESSION_DB', str(BASE_DIR / 'agent' / 'agent_sessions.sqlite3'))
+AGENT_SESSION_MAX_IN_MEMORY = 500
+AGENT_SESSION_IDLE_SECONDS = 15 * 60 # written out after this long without a message
+AGENT_SESSION_SWEEP_SECONDS = 60 # how often idle sessions are looked for when no messages come in
+AGENT_SESSION_MAX_EVENTS = 60 # older turns get dropped
+
+# Prometheus metrics at /metrics (main/views.py), per process. Off by default. When on, only the addresses listed here
+# (comma separated, REMOTE_ADDR so put the scraper on the private network, not behind the proxy) and staff users get them.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '') == '1'
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1').split(',') if ip.strip()]
+
+# N+1 query detector (main/nplusone.py). NPLUSONE_DETECTOR=1 logs repeated queries, NPLUSONE_DETECTOR=raise makes them errors,
+# e.g. `NPLUSONE_DETECTOR=raise python manage.py test` fails any test that hits an endpoint with an N+1.
+NPLUSONE_DETECTOR = {
+    'ENABLED': os.environ.get('NPLUSONE_DETECTOR', '') in ('1', 'raise'),
+    'THRESHOLD': 5, # same query more than this many times in one request counts as an N+1
+    'RAISE': os.environ.get('NPLUSONE_DETECTOR') == 'raise',
+}
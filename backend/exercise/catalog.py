@@ -0,0 +1,64 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from exercise.models import Exercise
+from exercise.serializers import ExerciseSerializer
+from main.shared_cache import version_timeout
+
+# The exercise catalog (every Exercise with its tags) is the same for every user and barely ever changes,
+# so instead of serializing it on every request we keep the rendered JSON bytes in memory and hand those out.
+# A catalog version number lives in the shared cache and gets bumped whenever an Exercise or Tag changes
+# (see exercise/signals.py). Each process rebuilds its snapshot the first time it notices the version moved.
+# the search index (exercise/search.py) and the agent's tool cache, which runs in its own process, follow the same version.
+# all of that needs the cache shared between processes. With the in-process default the version key expires every
+# LOCAL_CACHE_VERSION_TIMEOUT seconds instead, so the other processes rebuild at least that often (main/shared_cache.py).
+
+CATALOG_VERSION_KEY = "exercise-catalog:version"
+
+CatalogSnapshot = namedtuple("CatalogSnapshot", ["version", "content", "etag"])
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # start from the current time rather than 1, so an evicted key can't bring back an old version number.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns() // 1000, timeout=version_timeout())
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    # returns the new version
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError: # key was never set, the next read starts a new version anyway.
+        return get_catalog_version()
+
+
+def build_catalog_snapshot(version):
+    exercises = Exercise.objects.prefetch_related('tags').order_by('id')
+    content = JSONRenderer().render(ExerciseSerializer(exercises, many=True).data)
+    etag = '"%s"' % hashlib.sha256(content).hexdigest()
+    return CatalogSnapshot(version, content, etag)
+
+
+def get_catalog_snapshot():
+    global _snapshot
+    version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _snapshot_lock:
+        # another thread may have rebuilt it while we were waiting for the lock.
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = build_catalog_snapshot(version)
+        return _snapshot
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:54
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercise', '0007_tag_and_exercise_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='difficulty',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(10)]),
+        ),
+    ]
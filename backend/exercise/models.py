@@ -1,9 +1,17 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.conf import settings
+from django.db.models.functions import Upper
 # Create your models here.
 class Tag(models.Model): # simply things like "strength/cardio/Back/Legs. things like this, categories essentially"
     name = models.CharField(max_length=50) 
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='tag_name_idx'), # name__in when saving workouts
+            models.Index(Upper('name'), name='tag_name_upper_idx'), # name__iexact, which postgres runs as UPPER(name) = UPPER(...)
+        ]
+
     def __str__(self):
         return self.name  
 
@@ -11,6 +19,12 @@ class Exercise(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     tags = models.ManyToManyField(Tag, related_name="tags")
+    difficulty = models.PositiveSmallIntegerField(null=True, blank=True, validators=[MinValueValidator(1), MaxValueValidator(10)]) # 1-10, used by the recommendation model
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='exercise_name_idx'), # name__in when saving workouts
+        ]
 
     def __str__(self):
         return self.name
@@ -23,5 +37,5 @@ class ExerciseRecord(models.Model):
     date_of_pr = models.DateField(null=True, blank=True)
 
     class Meta:
-        unique_together = ('user', 'exercise')
+        unique_together = ('user', 'exercise') # also the index for looking up a users record for an exercise
 
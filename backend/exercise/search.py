@@ -0,0 +1,311 @@
+import threading
+from bisect import bisect_left, insort
+from collections import Counter, namedtuple
+from heapq import merge
+
+from exercise.catalog import get_catalog_version
+from exercise.models import Exercise
+
+# Typeahead search over exercise names and tags, answered from memory so a keystroke never touches the database.
+# each process keeps an index of the catalog:
+#   - per word of the names (and separately of the tag names), the exercises that have it, kept sorted by rank.
+#     the distinct words are a sorted list too, so the words starting with what was typed are one bisect away.
+#     Every typed word has to start some word of the exercise, so "inc be" finds "Incline Bench Press".
+#   - trigrams of those words (like postgres pg_trgm). A typed word nothing starts with gets swapped for the most
+#     similar word there is, so "bech press" still finds "Bench Press".
+#   - exercises per tag name, for the tag filter.
+# results are ranked: names starting with the query, then the query matching the start of words in the name,
+# then matches that needed the tags, then typo corrected matches. Shorter names first within each group.
+# every list is already in rank order, so they get merged lazily and the search stops as soon as it has `limit`
+# results. A one letter query over tens of thousands of exercises doesn't look at all the ones it matches.
+#
+# the index follows the catalog version (exercise/catalog.py). When an exercise or tag changes in this process,
+# the signal handler patches just the exercises involved (apply_change below) and the index moves to the new version.
+# a version it can't account for (another process changed the catalog, the version key got evicted, or it expired
+# because the cache is in-process) means a full rebuild on the next search, which is two queries.
+
+# rank is (name length, lowercase name, id): sorting by it puts shorter names first, and it ends with the id
+Entry = namedtuple("Entry", ["id", "name", "tags", "first_word", "words", "tag_words", "rank"])
+
+MIN_SIMILARITY = 0.3 # trigram similarity a typo match needs, same default as pg_trgm
+SMALL_TAG = 2000 # a tag with fewer exercises than this gets filtered by scanning the tag instead
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+def trigrams(text):
+    found = set()
+    for word in text.split():
+        padded = f"  {word} "
+        found.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return found
+
+
+def make_entry(exercise_id, name, tags):
+    # tags is a list of (tag id, tag name)
+    lowered = normalize(name)
+    words = lowered.split()
+    tag_words = {word for _, tag_name in tags for word in normalize(tag_name).split()}
+    return Entry(exercise_id, name, tags, words[0] if words else "", set(words), tag_words,
+                 (len(lowered), lowered, exercise_id))
+
+
+def load_entries(exercise_ids=None):
+    # two queries however many exercises there are
+    exercises = Exercise.objects.all() if exercise_ids is None else Exercise.objects.filter(id__in=exercise_ids)
+    tags = {}
+    for exercise_id, tag_id, tag_name in Exercise.tags.through.objects.filter(exercise__in=exercises) \
+            .values_list('exercise_id', 'tag_id', 'tag__name').order_by('tag_id'):
+        tags.setdefault(exercise_id, []).append((tag_id, tag_name))
+    return [make_entry(exercise_id, name, tags.get(exercise_id, [])) for exercise_id, name in exercises.values_list('id', 'name')]
+
+
+def matches_all(words, query_words):
+    return all(any(word.startswith(typed) for word in words) for typed in query_words)
+
+
+class Postings:
+    # word -> ranks of the exercises that have it, in rank order, plus the sorted list of words
+    def __init__(self):
+        self.ranks = {}
+        self.words = []
+
+    def add(self, word, rank):
+        ranks = self.ranks.get(word)
+        if ranks is None:
+            ranks = self.ranks[word] = []
+            insort(self.words, word)
+        insort(ranks, rank)
+
+    def remove(self, word, rank):
+        ranks = self.ranks[word]
+        del ranks[bisect_left(ranks, rank)]
+        if not ranks:
+            del self.ranks[word]
+            del self.words[bisect_left(self.words, word)]
+
+    def sort(self):
+        # for bulk loading, where ranks and words were appended unsorted
+        self.words.sort()
+        for ranks in self.ranks.values():
+            ranks.sort()
+
+    def starting_with(self, prefix):
+        position = bisect_left(self.words, prefix)
+        while position < len(self.words) and self.words[position].startswith(prefix):
+            yield self.ranks[self.words[position]]
+            position += 1
+
+    def count(self, prefix):
+        return sum(len(ranks) for ranks in self.starting_with(prefix))
+
+
+class SearchIndex:
+    def __init__(self, version, entries):
+        self.version = version
+        self.entries = {}
+        self.first_words = Postings() # first word of the name, for names starting with the query
+        self.name_words = Postings()
+        self.tag_words = Postings()
+        self.by_tag = Postings() # whole tag name -> exercises, for the filter
+        self.by_trigram = {} # trigram -> the name and tag words that have it, for correcting typos
+        self.trigram_counts = {}
+        self.lock = threading.RLock()
+        for entry in entries:
+            self._add(entry, bulk=True)
+        for postings in (self.first_words, self.name_words, self.tag_words, self.by_tag):
+            postings.sort()
+        for word in set(self.name_words.words) | set(self.tag_words.words):
+            self._word_changed(word)
+
+    def _postings(self, entry):
+        yield self.first_words, entry.first_word
+        for word in entry.words:
+            yield self.name_words, word
+        for word in entry.tag_words:
+            yield self.tag_words, word
+        for tag_name in {normalize(tag_name) for _, tag_name in entry.tags}:
+            yield self.by_tag, tag_name
+
+    def _word_changed(self, word):
+        # keeps the typo index to the words some exercise still has
+        word_trigrams = trigrams(word)
+        if word in self.name_words.ranks or word in self.tag_words.ranks:
+            for trigram in word_trigrams:
+                self.by_trigram.setdefault(trigram, set()).add(word)
+            self.trigram_counts[word] = len(word_trigrams)
+        elif self.trigram_counts.pop(word, None) is not None:
+            for trigram in word_trigrams:
+                words = self.by_trigram[trigram]
+                words.discard(word)
+                if not words:
+                    del self.by_trigram[trigram]
+
+    def _add(self, entry, bulk=False):
+        self.entries[entry.id] = entry
+        for postings, word in self._postings(entry):
+            if bulk: # appended unsorted, sorted once at the end
+                if word not in postings.ranks:
+                    postings.ranks[word] = []
+                    postings.words.append(word)
+                postings.ranks[word].append(entry.rank)
+            else:
+                postings.add(word, entry.rank)
+        if not bulk:
+            for word in entry.words | entry.tag_words:
+                self._word_changed(word)
+
+    def remove(self, exercise_id):
+        entry = self.entries.pop(exercise_id, None)
+        if entry is None:
+            return
+        for postings, word in self._postings(entry):
+            postings.remove(word, entry.rank)
+        for word in entry.words | entry.tag_words:
+            self._word_changed(word)
+
+    def add(self, entry):
+        self.remove(entry.id)
+        self._add(entry)
+
+    def update(self, exercise_ids=(), tag_ids=()):
+        # reloads the given exercises, and every exercise that has (or had) one of the given tags
+        with self.lock:
+            exercise_ids = set(exercise_ids)
+            if tag_ids:
+                tag_ids = set(tag_ids)
+                exercise_ids |= {entry.id for entry in self.entries.values() if any(tag_id in tag_ids for tag_id, _ in entry.tags)}
+                exercise_ids |= set(Exercise.tags.through.objects.filter(tag_id__in=tag_ids).values_list('exercise_id', flat=True))
+            if not exercise_ids:
+                return
+            entries = load_entries(exercise_ids)
+            for exercise_id in exercise_ids - {entry.id for entry in entries}: # deleted
+                self.remove(exercise_id)
+            for entry in entries:
+                self.add(entry)
+
+    def search(self, query, tag=None, limit=10):
+        # limit=None returns everything, only meant for listing a tag without a query
+        query = normalize(query)
+        query_words = query.split()
+        with self.lock:
+            tagged = None
+            if tag:
+                tagged = self.by_tag.ranks.get(normalize(tag), [])
+                if not query_words:
+                    return [self.entries[rank[2]] for rank in tagged[:limit]]
+            elif not query_words:
+                return []
+
+            results = self.find(query, query_words, tagged, limit)
+            if len(results) < limit:
+                # typo matches after the real ones, with every word nothing starts with swapped for the closest real word
+                corrected = [self.correct(typed) for typed in query_words]
+                if corrected != query_words:
+                    found = {entry.id for entry in results}
+                    results += [entry for entry in self.find(" ".join(corrected), corrected, tagged, limit)
+                                if entry.id not in found][:limit - len(results)]
+            return results
+
+    def find(self, query, query_words, tagged, limit):
+        if tagged is not None and len(tagged) < SMALL_TAG:
+            return self.scan(tagged, query, query_words, limit)
+        allowed = None if tagged is None else {rank[2] for rank in tagged}
+        results = []
+        seen = set()
+
+        def collect(ranks, accept):
+            # walks ranks in order, keeping the accepted ones until there are `limit` results
+            for rank in ranks:
+                if len(results) == limit:
+                    return
+                exercise_id = rank[2]
+                if exercise_id in seen or (allowed is not None and exercise_id not in allowed):
+                    continue
+                entry = self.entries[exercise_id]
+                if accept(entry):
+                    seen.add(exercise_id)
+                    results.append(entry)
+
+        # names starting with the query
+        collect(merge(*self.first_words.starting_with(query_words[0])), lambda entry: entry.rank[1].startswith(query))
+        # every typed word starts a word of the name. Walks the typed word with the fewest matches.
+        rarest = min(query_words, key=self.name_words.count)
+        collect(merge(*self.name_words.starting_with(rarest)), lambda entry: matches_all(entry.words, query_words))
+        # same, counting the tag names as words too
+        rarest = min(query_words, key=lambda typed: self.name_words.count(typed) + self.tag_words.count(typed))
+        collect(merge(*self.name_words.starting_with(rarest), *self.tag_words.starting_with(rarest)),
+                lambda entry: matches_all(entry.words | entry.tag_words, query_words))
+        return results
+
+    def scan(self, ranks, query, query_words, limit):
+        # the plain way, for searching within a small tag: rank every exercise in it
+        scored = []
+        for rank in ranks:
+            entry = self.entries[rank[2]]
+            if rank[1].startswith(query):
+                scored.append((0, rank))
+            elif matches_all(entry.words, query_words):
+                scored.append((1, rank))
+            elif matches_all(entry.words | entry.tag_words, query_words):
+                scored.append((2, rank))
+        scored.sort()
+        return [self.entries[rank[2]] for _, rank in scored[:limit]]
+
+    def correct(self, typed):
+        # a typed word that no name or tag word starts with becomes the most similar word that exists,
+        # if one is similar enough. Only looks at the distinct words, not every exercise.
+        if len(typed) < 3 or any(self.name_words.starting_with(typed)) or any(self.tag_words.starting_with(typed)):
+            return typed
+        typed_trigrams = trigrams(typed)
+        shared = Counter()
+        for trigram in typed_trigrams:
+            shared.update(self.by_trigram.get(trigram, ()))
+        best, best_similarity = typed, 0
+        for word, count in sorted(shared.items()):
+            similarity = count / (len(typed_trigrams) + self.trigram_counts[word] - count)
+            if similarity >= MIN_SIMILARITY and similarity > best_similarity:
+                best, best_similarity = word, similarity
+        return best
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index():
+    global _index
+    version = get_catalog_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _index_lock:
+        # another thread may have rebuilt it while we were waiting for the lock.
+        if _index is None or _index.version != version:
+            _index = SearchIndex(version, load_entries())
+        return _index
+
+
+def apply_change(version, exercise_ids=(), tag_ids=()):
+    # called after a change in this process committed and moved the catalog version to `version`.
+    # only patches the index if it was exactly one version behind, i.e. this change is the only one it missed,
+    # and it's been told which exercises or tags changed. Otherwise it's dropped and the next search rebuilds it.
+    global _index
+    index = _index
+    if index is None:
+        return
+    with index.lock:
+        if index.version == version - 1 and (exercise_ids or tag_ids):
+            index.update(exercise_ids, tag_ids)
+            index.version = version
+            return
+    with _index_lock:
+        if _index is index:
+            _index = None
+
+
+def search_exercises(query, tag=None, limit=10):
+    return get_search_index().search(query, tag=tag, limit=limit)
@@ -6,20 +6,22 @@ from django.db.models import F
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from django.utils import timezone
+from main.metrics import TimedListSerializer, TimedSerializerMixin
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name']
 
-class ExerciseSerializer(serializers.ModelSerializer):
+class ExerciseSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     class Meta:
         model = Exercise
         fields = ['id', 'name', 'tags']
+        list_serializer_class = TimedListSerializer # times serializer.data for many=True too
 
 
-class ExerciseRecordSerializer(serializers.ModelSerializer):
+class ExerciseRecordSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ExerciseRecord
         fields = ['id', 'user', 'exercise', 'personal_record', 'lifetime_reps', 'date_of_pr']
\ No newline at end of file
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from exercise import search
+from exercise.catalog import bump_catalog_version
+from exercise.models import Exercise, Tag
+
+
+def catalog_changed(exercise_ids=(), tag_ids=()):
+    # wait for the transaction to commit, otherwise another process could rebuild its snapshot
+    # from the old rows and cache it under the new version.
+    # the ids are what this process's search index has to reload (exercise/search.py).
+    def bump():
+        search.apply_change(bump_catalog_version(), exercise_ids, tag_ids)
+
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+def exercise_changed(sender, instance, **kwargs):
+    catalog_changed(exercise_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    catalog_changed(tag_ids=[instance.pk])
+
+
+@receiver(m2m_changed, sender=Exercise.tags.through)
+def exercise_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # exercise.tags.add() sends the signal even when the tag was already there, pk_set is only the new ones.
+    # reverse means it came from the tag's side (tag.tags.add(exercise)), then pk_set holds exercise ids.
+    if action in ('post_add', 'post_remove') and pk_set:
+        catalog_changed(exercise_ids=pk_set if reverse else [instance.pk])
+    elif action == 'post_clear' and reverse:
+        catalog_changed(tag_ids=[instance.pk]) # the index still knows which exercises had it
+    elif action == 'post_clear':
+        catalog_changed(exercise_ids=[instance.pk])
@@ -1,3 +1,172 @@
-from django.test import TestCase
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from exercise import search
+from exercise.catalog import bump_catalog_version
+from exercise.models import Exercise, Tag
+from main.nplusone import detect_nplusone
+from user.authentication import token_cache
+from user.models import User
+
+
+class ExerciseCatalogTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chest = Tag.objects.create(name="Chest")
+            bench = Exercise.objects.create(name="Bench Press")
+            bench.tags.add(self.chest)
+
+    def test_catalog_lists_exercises_with_tags(self):
+        response = self.client.get("/api/exercises/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [
+            {"id": Exercise.objects.get().id, "name": "Bench Press", "tags": [{"id": self.chest.id, "name": "Chest"}]},
+        ])
+        self.assertTrue(response['ETag'])
+
+    def test_catalog_build_has_no_nplusone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(10):
+                Exercise.objects.create(name=f"Exercise {i}").tags.add(self.chest)
+
+        with detect_nplusone(threshold=2, label="catalog"):
+            response = self.client.get("/api/exercises/")
+        self.assertEqual(len(json.loads(response.content)), 11)
+
+    def test_matching_etag_gets_304_without_database_work(self):
+        etag = self.client.get("/api/exercises/")['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/exercises/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(len(queries), 0)
+
+    def test_catalog_change_rebuilds_snapshot(self):
+        etag = self.client.get("/api/exercises/")['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Exercise.objects.create(name="Push Ups").tags.add(self.chest)
+
+        response = self.client.get("/api/exercises/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(json.loads(response.content)), 2)
+
+    def test_adding_an_existing_tag_does_not_change_the_catalog(self):
+        etag = self.client.get("/api/exercises/")['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Exercise.objects.get().tags.add(self.chest)
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.client.get("/api/exercises/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_in_process_cache_catches_up_with_other_workers(self):
+        # an exercise added by another worker bumps the version in that worker's cache only.
+        # with locmem (the test settings) the version here runs out instead, and the catalog and search catch up.
+        self.client.get("/api/exercises/")
+        self.client.get("/api/exercises/search/?q=push")
+        Exercise.objects.create(name="Push Ups") # no on_commit here, as if it happened elsewhere
+        self.assertEqual(len(json.loads(self.client.get("/api/exercises/").content)), 1)
+
+        later = time.time() + settings.LOCAL_CACHE_VERSION_TIMEOUT + 1
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=later):
+            self.assertEqual(len(json.loads(self.client.get("/api/exercises/").content)), 2)
+            self.assertEqual([r["name"] for r in self.client.get("/api/exercises/search/?q=push").data["results"]],
+                             ["Push Ups"])
+
+
+class ExerciseSearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chest = Tag.objects.create(name="Chest")
+            self.legs = Tag.objects.create(name="Legs")
+            for name, tag in [("Bench Press", self.chest), ("Incline Bench Press", self.chest), ("Leg Press", self.legs),
+                              ("Bent Over Row", None), ("Push Ups", self.chest)]:
+                exercise = Exercise.objects.create(name=name)
+                if tag:
+                    exercise.tags.add(tag)
+
+    def names(self, query):
+        response = self.client.get(f"/api/exercises/search/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [result["name"] for result in response.data["results"]]
+
+    def test_ranks_name_prefix_before_word_prefix(self):
+        self.assertEqual(self.names("q=ben"), ["Bench Press", "Bent Over Row", "Incline Bench Press"])
+        self.assertEqual(self.names("q=inc ben"), ["Incline Bench Press"])
+        self.assertEqual(self.names("q=press&limit=2"), ["Leg Press", "Bench Press"])
+
+    def test_tag_filter_and_tag_words(self):
+        self.assertEqual(self.names("q=press&tag=chest"), ["Bench Press", "Incline Bench Press"])
+        self.assertEqual(self.names("tag=Chest"), ["Push Ups", "Bench Press", "Incline Bench Press"]) # shortest first
+        self.assertEqual(self.names("q=legs"), ["Leg Press"]) # only the tag matches
+
+    def test_typos_still_match(self):
+        self.assertEqual(self.names("q=bech press")[:1], ["Bench Press"])
+
+    def test_keystrokes_do_not_query_the_database(self):
+        self.names("q=b") # builds the index
+        with CaptureQueriesContext(connection) as queries:
+            self.names("q=be")
+            self.names("q=ben")
+        self.assertEqual(len(queries), 0)
+
+    def test_changes_patch_the_index_in_place(self):
+        index = search.get_search_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            Exercise.objects.create(name="Dumbbell Bench Press").tags.add(self.chest)
+            Exercise.objects.filter(name="Bent Over Row").get().delete()
+            self.legs.name = "Quads"
+            self.legs.save()
+
+        self.assertIs(search.get_search_index(), index) # same index, not rebuilt
+        self.assertEqual(self.names("q=ben"), ["Bench Press", "Incline Bench Press", "Dumbbell Bench Press"])
+        self.assertEqual(self.names("tag=quads"), ["Leg Press"])
+        self.assertEqual(self.names("tag=legs"), [])
+
+    def test_exercises_created_with_a_workout_are_found(self):
+        # the workout serializer bulk creates exercises, tags and their links, no signals
+        self.names("q=b") # builds the index
+        payload = {"name": "Carries", "date": "2025-05-01",
+                   "workout_sets": [{"exercise": {"name": "Zercher Carry", "tags": [{"name": "Legs"}, {"name": "Core"}]},
+                                     "reps": 1, "weight": 100},
+                                    {"exercise": {"name": "Bench Press", "tags": [{"name": "Legs"}]}, "reps": 5, "weight": 100}]}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post("/user/create-workout/", payload, format="json").status_code, 201)
+
+        self.assertEqual(self.names("q=zer"), ["Zercher Carry"])
+        self.assertEqual(self.names("tag=legs"), ["Leg Press", "Bench Press", "Zercher Carry"])
+        self.assertEqual(self.names("tag=core"), ["Zercher Carry"])
+
+    def test_change_it_cannot_patch_drops_the_index(self):
+        index = search.get_search_index()
+        search.apply_change(bump_catalog_version()) # no ids, nothing to patch with
+        self.assertIsNot(search.get_search_index(), index)
+
+    def test_needs_a_query_or_tag(self):
+        self.assertEqual(self.client.get("/api/exercises/search/?q=").status_code, 400)
+        self.assertEqual(self.client.get("/api/exercises/search/?q=ben&limit=500").status_code, 400)
@@ -4,5 +4,6 @@ from . import views
 
 urlpatterns = [
     path('api/exercises/', views.ExerciseListAPIView.as_view()),
+    path('api/exercises/search/', views.ExerciseSearchAPIView.as_view()),
     path('api/exerciseStats/<int:exercise_pk>', views.ExerciseAPIView.as_view()),
 ]
\ No newline at end of file
@@ -1,21 +1,68 @@
 from django.shortcuts import render
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from user.serializers import ExerciseSerializer
 from exercise.serializers import ExerciseSerializer, ExerciseRecordSerializer
 from exercise.models import Exercise, ExerciseRecord
-from rest_framework.authentication import TokenAuthentication
+from exercise.catalog import get_catalog_snapshot
+from exercise.search import search_exercises
+from user.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
 class ExerciseListAPIView(generics.ListAPIView):
     queryset = Exercise.objects.all()
     serializer_class = ExerciseSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        # serves the prebuilt catalog bytes from exercise/catalog.py instead of serializing every exercise again.
+        # the ETag is a hash of those bytes, so a client that already has this version sends it back in
+        # If-None-Match and gets an empty 304, no database or serializer work at all.
+        snapshot = get_catalog_snapshot()
+        if snapshot.etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(snapshot.content, content_type='application/json')
+        response['ETag'] = snapshot.etag
+        response['Cache-Control'] = 'private, no-cache' # browser can keep it, but has to check the ETag each time
+        return response
+
+class ExerciseSearchAPIView(APIView):
+    # typeahead for the workout screen: ?q=inc ben&tag=Chest&limit=10
+    # answered from the in-memory index in exercise/search.py, no database queries while the user types.
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    max_limit = 50
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        tag = request.query_params.get('tag') or None
+        if not query.strip() and not tag:
+            raise ValidationError({"q": "Type something to search for, or pass a tag."})
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({"limit": "Has to be a whole number."})
+        if not 1 <= limit <= self.max_limit:
+            raise ValidationError({"limit": f"Has to be between 1 and {self.max_limit}."})
+
+        results = search_exercises(query, tag=tag, limit=limit)
+        return Response({
+            "results": [ # same shape as the catalog entries
+                {"id": entry.id, "name": entry.name, "tags": [{"id": tag_id, "name": tag_name} for tag_id, tag_name in entry.tags]}
+                for entry in results
+            ],
+        })
+
 class ExerciseAPIView(generics.RetrieveAPIView):
     
     serializer_class = ExerciseRecordSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -0,0 +1,17 @@
+from django.core.checks import Tags, Warning, register
+
+from main.shared_cache import cache_is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # manage.py check --deploy
+    if cache_is_shared():
+        return []
+    return [Warning(
+        "The default cache is LocMemCache, which every process keeps separately.",
+        hint="Workers (and the agent process) won't see each other's cache invalidations, so cached user responses, "
+             "the exercise catalog and search index, and the agent's tool results can be stale for up to "
+             "LOCAL_CACHE_VERSION_TIMEOUT. Set CACHE_BACKEND/CACHE_LOCATION to a shared cache such as redis.",
+        id='main.W001',
+    )]
@@ -0,0 +1,144 @@
+import itertools
+import statistics
+import time
+import uuid
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from exercise.models import Exercise, ExerciseRecord
+from main import synthetic
+from user.authentication import token_cache
+from user.models import User
+from user.urls import urlpatterns
+
+
+def workout_payload(exercise_names, set_count=15):
+    return {
+        "name": "Benchmark workout",
+        "date": "2025-01-01",
+        "workout_sets": [
+            {"exercise": {"name": exercise_names[i % len(exercise_names)], "tags": [{"name": "Chest"}]}, "reps": 10, "weight": "100.0"}
+            for i in range(set_count)
+        ],
+    }
+
+
+# route in user/urls.py -> how to call it: (method, build path, build body).
+# the builders get (user, context) where context has some ids from the dataset.
+# a route without an entry here makes the benchmark fail, so new routes get benchmarked too.
+ENDPOINTS = {
+    'login/': ('post', lambda user, ctx: "/login/",
+               lambda user, ctx: {"username": user.username, "password": synthetic.SYNTHETIC_PASSWORD}),
+    'register/': ('post', lambda user, ctx: "/register/",
+                  lambda user, ctx: {"username": f"bench_{uuid.uuid4().hex[:12]}", "email": "bench@example.com",
+                                     "password": "bench-password-1", "confirm_password": "bench-password-1",
+                                     "first_name": "Bench", "last_name": "User"}),
+    'user/profile/<int:userId>/': ('get', lambda user, ctx: f"/user/profile/{user.id}/", None),
+    'api/user/<int:userId>/': ('get', lambda user, ctx: f"/api/user/{user.id}/", None),
+    'api/user/workouts/': ('get', lambda user, ctx: "/api/user/workouts/", None),
+    'api/user/volume/': ('get', lambda user, ctx: "/api/user/volume/?period=week", None),
+    'user/create-workout/': ('post', lambda user, ctx: "/user/create-workout/",
+                             lambda user, ctx: workout_payload(ctx['exercise_names'])),
+    'user/sync-workouts/': ('post', lambda user, ctx: "/user/sync-workouts/",
+                            lambda user, ctx: [dict(workout_payload(ctx['exercise_names']), idempotency_key=uuid.uuid4().hex)
+                                               for _ in range(5)]),
+    'api/exercises/': ('get', lambda user, ctx: "/api/exercises/", None),
+    'api/exercises/search/': ('get', lambda user, ctx: f"/api/exercises/search/?q={ctx['exercise_names'][user.id % len(ctx['exercise_names'])][:3]}", None),
+    'api/exerciseStats/<int:exercise_pk>': ('get', lambda user, ctx: f"/api/exerciseStats/{ctx['record_exercise'][user.id]}", None),
+    'api/user/weightData/': ('get', lambda user, ctx: "/api/user/weightData/", None),
+    'api/user/submitWeightData/': ('post', lambda user, ctx: "/api/user/submitWeightData/", lambda user, ctx: {"weight": "180.5"}),
+    'api/user/recommendations/': ('get', lambda user, ctx: f"/api/user/recommendations/?muscle=Chest&sleep={user.id % 101}&feeling=4", None),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures p50/p95/p99 latency and query counts for every route in user/urls.py, against synthetic users. "
+        "Each route is measured cold (all caches cleared before every request) and warm. "
+        "Runs in a transaction that gets rolled back, so writes and seeded data don't stick around."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="Requests per route and mode.")
+        parser.add_argument('--sample-users', type=int, default=20, help="Requests rotate over this many users.")
+        parser.add_argument('--seed-users', type=int, default=0,
+                            help="Seed this many synthetic users first. Default uses the ones from seed_synthetic.")
+        parser.add_argument('--route', action='append', dest='routes', help="Only benchmark these routes.")
+
+    def handle(self, *args, **options):
+        missing = [str(pattern.pattern) for pattern in urlpatterns if str(pattern.pattern) not in ENDPOINTS]
+        if missing:
+            raise CommandError(f"No benchmark defined for: {', '.join(missing)}")
+
+        with transaction.atomic():
+            if options['seed_users']:
+                synthetic.seed(users=options['seed_users'], stdout=self.stdout)
+
+            users = list(User.objects.filter(username__startswith="synthetic_").order_by('-id')[:options['sample_users']])
+            if not users:
+                raise CommandError("No synthetic users found, run seed_synthetic first or pass --seed-users.")
+            context = self.get_context(users)
+            tokens = {user.id: Token.objects.get_or_create(user=user)[0].key for user in users}
+
+            self.stdout.write(f"{'route':<40} {'mode':<5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+            for pattern in urlpatterns:
+                route = str(pattern.pattern)
+                if options['routes'] and route not in options['routes']:
+                    continue
+                for mode in ('cold', 'warm'):
+                    timings, query_counts = self.bench_route(route, mode, users, tokens, context, options['requests'])
+                    p50, p95, p99 = self.percentiles(timings)
+                    self.stdout.write(f"{route:<40} {mode:<5} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} {statistics.median(query_counts):>8.0f}")
+
+            transaction.set_rollback(True)
+
+    def get_context(self, users):
+        return {
+            'exercise_names': list(Exercise.objects.order_by('id').values_list('name', flat=True)[:6]) or ["Bench Press"],
+            # an exercise each user has a record for, so exerciseStats returns a 200
+            'record_exercise': {
+                user.id: ExerciseRecord.objects.filter(user=user).values_list('exercise_id', flat=True).first() or 0
+                for user in users
+            },
+        }
+
+    def bench_route(self, route, mode, users, tokens, context, request_count):
+        method, build_path, build_body = ENDPOINTS[route]
+        client = APIClient(HTTP_HOST="localhost")
+        timings = []
+        query_counts = []
+
+        def send(user):
+            client.credentials(HTTP_AUTHORIZATION=f"Token {tokens[user.id]}")
+            path = build_path(user, context)
+            body = build_body(user, context) if build_body else None
+            response = getattr(client, method)(path, body, format='json') if body is not None else getattr(client, method)(path)
+            if response.status_code >= 400:
+                raise CommandError(f"{method.upper()} {path} returned {response.status_code}: {response.content[:200]!r}")
+
+        if mode == 'warm':
+            for user in users: # one untimed request per user fills the caches
+                send(user)
+
+        for user in itertools.islice(itertools.cycle(users), request_count):
+            if mode == 'cold':
+                cache.clear()
+                token_cache.clear()
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                send(user)
+                timings.append((time.perf_counter() - started) * 1000)
+            query_counts.append(len(queries))
+        return timings, query_counts
+
+    def percentiles(self, timings):
+        if len(timings) < 2:
+            return timings[0], timings[0], timings[0]
+        cuts = statistics.quantiles(timings, n=100, method='inclusive')
+        return cuts[49], cuts[94], cuts[98]
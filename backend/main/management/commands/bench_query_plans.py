@@ -0,0 +1,128 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from exercise.models import ExerciseRecord, Tag
+from main import synthetic
+from user.models import WeightEntry
+from user.pagination import WorkoutHistoryPagination
+from workout.models import WorkoutExercise, WorkoutSession
+from workout.rollups import SET_VOLUME
+
+# the indexes added for the hot queries below. "before" numbers are taken with these dropped.
+HOT_QUERY_INDEXES = [
+    'workout_user_date_idx',
+    'weightentry_user_date_idx',
+    'tag_name_idx',
+    'tag_name_upper_idx',
+    'exercise_name_idx',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a synthetic dataset, then shows the query plan and timing of each hot query with and without "
+        "the indexes meant for it. Everything runs in a transaction that gets rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--sessions-per-user', type=int, default=60)
+        parser.add_argument('--sets-per-session', type=int, default=15)
+        parser.add_argument('--exercises', type=int, default=300)
+        # with only a dozen tags the whole table is one page and a seq scan wins with or without the index
+        parser.add_argument('--tags', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=50, help="Runs per query, the median time is reported.")
+        parser.add_argument('--skip-before', action='store_true', help="Only measure with the indexes in place.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write("Seeding...")
+            user_ids = synthetic.seed(
+                users=options['users'],
+                exercises=options['exercises'],
+                tags=options['tags'],
+                sessions_per_user=options['sessions_per_user'],
+                sets_per_session=options['sets_per_session'],
+                seed_value=options['seed'],
+                stdout=self.stdout,
+            )
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE") # fresh statistics, otherwise the planner is guessing about the new rows
+
+            # the heaviest user is the worst case for every per user query
+            heavy_user_id = (
+                WorkoutSession.objects.filter(user_id__in=user_ids).values('user_id')
+                .annotate(sessions=Count('id')).order_by('-sessions').values_list('user_id', flat=True)[0]
+            )
+            queries = self.get_hot_queries(heavy_user_id)
+
+            results = {name: {'after': self.measure(queryset, run, options['repeat'])} for name, queryset, run in queries}
+
+            if not options['skip_before']:
+                sid = transaction.savepoint()
+                self.drop_indexes()
+                for name, queryset, run in queries:
+                    results[name]['before'] = self.measure(queryset, run, options['repeat'])
+                transaction.savepoint_rollback(sid) # puts the indexes back
+
+            self.report(results)
+            # only postgres runs name__iexact as UPPER(name) = UPPER(...), sqlite uses LIKE and can't use the index
+            tag_plan = results["tag by name, case insensitive"]['after']['plan']
+            if connection.vendor == 'postgresql' and 'tag_name_upper_idx' not in tag_plan:
+                self.stdout.write(self.style.WARNING(
+                    "\nThe case insensitive tag lookup didn't use tag_name_upper_idx, try more --tags."
+                ))
+            transaction.set_rollback(True)
+
+    def get_hot_queries(self, user_id):
+        since = (timezone.now() - timedelta(days=14)).date()
+        record = ExerciseRecord.objects.filter(user_id=user_id).first()
+        return [
+            # (name, queryset to explain, how to run it)
+            # the first page exactly as the history endpoint asks for it (one extra row to know if there's a next page)
+            ("workout history page",
+             WorkoutSession.objects.filter(user_id=user_id)
+             .order_by(*WorkoutHistoryPagination.ordering)[:WorkoutHistoryPagination.page_size + 1], list),
+            ("recent volume (agent)",
+             WorkoutExercise.objects.filter(workout__user_id=user_id, workout__date__gte=since),
+             lambda queryset: queryset.aggregate(total=Sum(SET_VOLUME))),
+            ("latest weigh in",
+             WeightEntry.objects.filter(user_id=user_id).order_by('-date_recorded')[:1], list),
+            ("exercise record",
+             ExerciseRecord.objects.filter(user_id=user_id, exercise_id=record.exercise_id if record else 0), list),
+            ("tag by name, case insensitive",
+             Tag.objects.filter(name__iexact="chest"), list),
+        ]
+
+    def measure(self, queryset, run, repeat):
+        plan = queryset.explain(analyze=True) if connection.vendor == 'postgresql' else queryset.explain()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run(queryset.all())
+            timings.append((time.perf_counter() - started) * 1000)
+        return {'plan': plan, 'median_ms': statistics.median(timings)}
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for name in HOT_QUERY_INDEXES:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+            cursor.execute("ANALYZE")
+
+    def report(self, results):
+        for name, result in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name}"))
+            for label in ('before', 'after'):
+                if label not in result:
+                    continue
+                used = [index for index in HOT_QUERY_INDEXES if index in result[label]['plan']]
+                self.stdout.write(f"  {label}: {result[label]['median_ms']:.3f} ms, indexes used: {', '.join(used) or 'none'}")
+                for line in result[label]['plan'].splitlines():
+                    self.stdout.write(f"    {line}")
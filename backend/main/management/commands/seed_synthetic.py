@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from main import synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with synthetic users, exercises, tags, workouts, sets and weigh ins for benchmarking. "
+        "Per user numbers are averages, the real counts are skewed like real usage. "
+        f"Every synthetic user's password is '{synthetic.SYNTHETIC_PASSWORD}'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--exercises', type=int, default=200)
+        parser.add_argument('--tags', type=int, default=12)
+        parser.add_argument('--sessions-per-user', type=int, default=40)
+        parser.add_argument('--sets-per-session', type=int, default=15)
+        parser.add_argument('--weigh-ins-per-user', type=int, default=30)
+        parser.add_argument('--days', type=int, default=365, help="How far back the history goes.")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed, for repeatable datasets.")
+
+    def handle(self, *args, **options):
+        user_ids = synthetic.seed(
+            users=options['users'],
+            exercises=options['exercises'],
+            tags=options['tags'],
+            sessions_per_user=options['sessions_per_user'],
+            sets_per_session=options['sets_per_session'],
+            weigh_ins_per_user=options['weigh_ins_per_user'],
+            days=options['days'],
+            seed_value=options['seed'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Seeded {len(user_ids)} synthetic users."))
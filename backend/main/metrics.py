@@ -0,0 +1,123 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from rest_framework import serializers
+
+# Per request timings plus per route histograms, filled in by main.middleware.RequestMetricsMiddleware
+# and exposed in the Prometheus text format at /metrics. Histograms live in process memory,
+# so with several worker processes every worker reports its own numbers (Prometheus adds them up).
+
+
+class RequestTimings:
+    # what one request spent its time on. Stages can overlap: queries that run while serializing
+    # lazily loaded relations count towards both db and serialize.
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.stages = {}
+
+    def record_query(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook, wraps every query the request runs.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+@contextmanager
+def stage_timer(name):
+    # times a block of code as part of the current request. Does nothing outside a request.
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_stage(name, time.perf_counter() - started)
+
+
+class TimedSerializerMixin:
+    # serializer.data is where DRF turns the objects into dicts, time it as the "serialize" stage.
+    # only put this on serializers that views use at the top level, nested ones never have .data called.
+    @property
+    def data(self):
+        with stage_timer('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    # for many=True, set as Meta.list_serializer_class next to TimedSerializerMixin.
+    pass
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {} # labels -> [bucket counts..., count, sum]
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1 # stored per bucket, made cumulative when rendered
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-2]}')
+            lines.append(f"{self.name}_count{{{label_text}}} {series[-2]}")
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-1]}")
+        return "\n".join(lines)
+
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.duration = Histogram('ascend_request_duration_seconds', "Total time spent handling the request.", SECONDS_BUCKETS)
+        self.db = Histogram('ascend_request_db_seconds', "Time spent running SQL queries.", SECONDS_BUCKETS)
+        self.serialize = Histogram('ascend_request_serialize_seconds', "Time spent in serializer.data.", SECONDS_BUCKETS)
+        self.queries = Histogram('ascend_request_queries', "Number of SQL queries per request.", QUERY_BUCKETS)
+
+    def observe(self, route, method, status, total_seconds, timings):
+        labels = (('method', method), ('route', route), ('status', str(status)))
+        with self.lock:
+            self.duration.observe(labels, total_seconds)
+            self.db.observe(labels, timings.db_seconds)
+            self.serialize.observe(labels, timings.stages.get('serialize', 0.0))
+            self.queries.observe(labels, timings.queries)
+
+    def render(self):
+        with self.lock:
+            return "\n".join(histogram.render() for histogram in (self.duration, self.db, self.serialize, self.queries)) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,41 @@
+import time
+
+from django.db import connection
+
+from main.metrics import RequestTimings, current_timings, registry
+
+
+class RequestMetricsMiddleware:
+    # records how many queries each request ran, how long they took, serializer time and total time.
+    # the numbers go out with the response as a Server-Timing header (shows up in the browser devtools)
+    # and into the per route histograms served at /metrics.
+    # cheap enough to leave on: a timer around each query and one short lock per request.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        context_token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings.record_query):
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(context_token)
+        total_seconds = time.perf_counter() - started
+
+        response['Server-Timing'] = self.server_timing(timings, total_seconds)
+
+        # the route pattern ("api/user/<int:userId>/"), not the path, so every user lands in the same series.
+        match = request.resolver_match
+        route = match.route if match is not None else 'unmatched'
+        registry.observe(route, request.method, response.status_code, total_seconds, timings)
+        return response
+
+    def server_timing(self, timings, total_seconds):
+        parts = [f'db;dur={timings.db_seconds * 1000:.2f};desc="{timings.queries} queries"']
+        for name, seconds in timings.stages.items():
+            parts.append(f"{name};dur={seconds * 1000:.2f}")
+        parts.append(f"total;dur={total_seconds * 1000:.2f}")
+        return ", ".join(parts)
@@ -0,0 +1,122 @@
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from rest_framework import serializers
+
+# N+1 query detector, for development and test runs.
+# every SELECT a request runs gets reduced to a fingerprint (the SQL with the literal values taken out), so
+# "... WHERE workout_id = 1" and "... WHERE workout_id = 2" count as the same query. When one fingerprint runs more
+# than THRESHOLD times in a request, that is almost always a nested serializer loading a relation one object at a time.
+# we then report which serializer/field was running at that moment so it's clear what needs a prefetch.
+#
+# settings.NPLUSONE_DETECTOR = {'ENABLED': ..., 'THRESHOLD': 5, 'RAISE': False}
+# ENABLED turns on NPlusOneMiddleware, RAISE makes it raise NPlusOneError instead of only logging (fails the test).
+# tests can also wrap a single request in detect_nplusone().
+
+logger = logging.getLogger('ascend.nplusone')
+
+DEFAULTS = {'ENABLED': False, 'THRESHOLD': 5, 'RAISE': False}
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%s)\s*,?)+\)", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'NPLUSONE_DETECTOR', {})}
+
+
+def fingerprint(sql):
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    sql = IN_LIST.sub("IN (...)", sql) # prefetch batches of different sizes are still the same query
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+def serializer_stack():
+    # walks up the call stack and picks out the serializers and fields that are in the middle of rendering,
+    # e.g. "UserDashboardSerializer > UserDashboardSerializer.workouts > WorkoutReadSerializer.workout_sets"
+    stack = []
+    seen = set()
+    frame = sys._getframe(2)
+    while frame is not None:
+        field = frame.f_locals.get('self')
+        if isinstance(field, serializers.Field) and id(field) not in seen:
+            seen.add(id(field))
+            stack.append(field)
+        frame = frame.f_back
+
+    parts = []
+    for field in reversed(stack): # outermost first
+        if field.parent is None:
+            parts.append(type(field).__name__)
+        elif field.field_name: # items of a many=True list have no field name, the list itself already showed up
+            parts.append(f"{type(field.parent).__name__}.{field.field_name}")
+    return " > ".join(parts) or "(no serializer, called from view code)"
+
+
+class QueryTracker:
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = Counter()
+        self.stacks = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:6].upper() == "SELECT":
+            key = fingerprint(sql)
+            self.counts[key] += 1
+            if self.counts[key] == self.threshold + 1: # only walk the stack once per repeated query
+                self.stacks[key] = serializer_stack()
+        return execute(sql, params, many, context)
+
+    @property
+    def violations(self):
+        return [(key, self.counts[key], self.stacks[key]) for key in self.stacks]
+
+    def report(self, label=""):
+        lines = [f"N+1 queries detected{' in ' + label if label else ''}:"]
+        for key, count, stack in self.violations:
+            lines.append(f"  {count}x {key[:200]}")
+            lines.append(f"     from {stack}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def detect_nplusone(threshold=None, raise_error=True, label=""):
+    config = get_config()
+    tracker = QueryTracker(config['THRESHOLD'] if threshold is None else threshold)
+    with connection.execute_wrapper(tracker):
+        yield tracker
+    if tracker.violations and raise_error:
+        raise NPlusOneError(tracker.report(label))
+
+
+class NPlusOneMiddleware:
+    def __init__(self, get_response):
+        config = get_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed() # Django drops the middleware, no cost when it's off
+        self.get_response = get_response
+        self.threshold = config['THRESHOLD']
+        self.raise_error = config['RAISE']
+
+    def __call__(self, request):
+        label = f"{request.method} {request.path}"
+        with detect_nplusone(self.threshold, raise_error=False) as tracker:
+            response = self.get_response(request)
+        if tracker.violations:
+            if self.raise_error:
+                raise NPlusOneError(tracker.report(label))
+            logger.warning(tracker.report(label))
+        return response
@@ -0,0 +1,15 @@
+from django.conf import settings
+
+# Version numbers in the cache (user/cache.py, exercise/catalog.py) only work if every process reads the
+# same cache. LocMemCache is a separate cache in each process: a bump in one worker never reaches the others, and
+# they'd keep serving what they cached before it. That's fine in development, but there the version keys expire
+# after LOCAL_CACHE_VERSION_TIMEOUT, so a process that missed a bump is stale for at most that long.
+
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def version_timeout():
+    # timeout for a version key, never expires when the cache is shared
+    return None if cache_is_shared() else settings.LOCAL_CACHE_VERSION_TIMEOUT
@@ -0,0 +1,135 @@
+import random
+import secrets
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from exercise.models import Exercise, ExerciseRecord, Tag
+from user.models import User, WeightEntry
+from workout.models import WorkoutExercise, WorkoutSession
+from workout.rollups import rebuild_rollups
+
+# Fake but realistic looking data for benchmarks. Everything is written with bulk inserts.
+# the shape follows what real usage looks like: most users log a handful of workouts and a few log hundreds,
+# a few popular exercises make up most sets, and weigh ins wander around a starting weight.
+
+SYNTHETIC_PASSWORD = "synthetic-password-1"
+
+MUSCLE_GROUPS = ["Chest", "Back", "Leg", "Arm", "Shoulder", "Core", "Glutes", "Cardio"]
+MOVEMENTS = ["Press", "Row", "Squat", "Curl", "Raise", "Fly", "Pulldown", "Extension", "Lunge", "Deadlift", "Dip", "Crunch"]
+VARIATIONS = ["Barbell", "Dumbbell", "Machine", "Cable", "Incline", "Decline", "Seated", "Standing", "Single Arm", "Smith"]
+
+BATCH_SIZE = 2000
+
+
+def seed(users=100, exercises=200, tags=12, sessions_per_user=40, sets_per_session=15, weigh_ins_per_user=30,
+         days=365, seed_value=None, stdout=None):
+    # returns the ids of the users it created. Numbers per user are averages, the actual counts are skewed.
+    rng = random.Random(seed_value)
+    run = secrets.token_hex(3) # so seeding twice doesn't clash on usernames
+
+    with transaction.atomic():
+        tag_objects = create_tags(tags, run)
+        exercise_objects = create_exercises(exercises, tag_objects, rng, run)
+        user_ids = create_users(users, run)
+
+        # popular exercises get picked far more than the long tail (zipf-like weights)
+        popularity = [1 / (rank + 1) for rank in range(len(exercise_objects))]
+        today = date.today()
+
+        for start in range(0, len(user_ids), 100): # a hundred users at a time keeps memory flat
+            chunk = user_ids[start:start + 100]
+            create_history(chunk, exercise_objects, popularity, sessions_per_user, sets_per_session,
+                           weigh_ins_per_user, days, today, rng)
+            rebuild_rollups(chunk)
+            if stdout is not None:
+                stdout.write(f"  seeded {min(start + 100, len(user_ids))}/{len(user_ids)} users")
+    return user_ids
+
+
+def create_tags(count, run):
+    names = MUSCLE_GROUPS[:count] + [f"Tag {run} {i}" for i in range(count - len(MUSCLE_GROUPS))]
+    return Tag.objects.bulk_create([Tag(name=name) for name in names])
+
+
+def create_exercises(count, tags, rng, run):
+    exercises = Exercise.objects.bulk_create([
+        Exercise(name=f"{rng.choice(VARIATIONS)} {rng.choice(MOVEMENTS)} {run}-{i}")
+        for i in range(count)
+    ], batch_size=BATCH_SIZE)
+
+    ExerciseTag = Exercise.tags.through
+    links = []
+    for exercise in exercises:
+        for tag in rng.sample(tags, k=min(len(tags), rng.choice([1, 1, 2, 2, 3]))):
+            links.append(ExerciseTag(exercise_id=exercise.id, tag_id=tag.id))
+    ExerciseTag.objects.bulk_create(links, batch_size=BATCH_SIZE)
+    return exercises
+
+
+def create_users(count, run):
+    password = make_password(SYNTHETIC_PASSWORD) # hashing is slow, every synthetic user shares one hash
+    users = User.objects.bulk_create([
+        User(username=f"synthetic_{run}_{i}", password=password, user_weight=0)
+        for i in range(count)
+    ], batch_size=BATCH_SIZE)
+    return [user.id for user in users]
+
+
+def skewed_count(rng, mean):
+    # exponential around the mean: lots of small values and a long tail of heavy users
+    if mean <= 0:
+        return 0
+    return min(int(rng.expovariate(1 / mean)) + 1, mean * 10)
+
+
+def create_history(user_ids, exercises, popularity, sessions_per_user, sets_per_session, weigh_ins_per_user, days, today, rng):
+    sessions = []
+    for user_id in user_ids:
+        for _ in range(skewed_count(rng, sessions_per_user)):
+            sessions.append(WorkoutSession(
+                user_id=user_id,
+                name=rng.choice(MUSCLE_GROUPS) + " day",
+                date=today - timedelta(days=rng.randrange(days)),
+                elapsed_time=f"0{rng.randint(0, 1)}:{rng.randint(0, 59):02d}:00",
+            ))
+    sessions = WorkoutSession.objects.bulk_create(sessions, batch_size=BATCH_SIZE)
+
+    sets = []
+    records = {} # (user_id, exercise_id) -> [lifetime reps, best weight, date of best]
+    lifetime = dict.fromkeys(user_ids, Decimal(0))
+    for session in sessions:
+        set_count = max(1, int(rng.gauss(sets_per_session, sets_per_session / 3)))
+        session_exercises = rng.choices(exercises, weights=popularity, k=max(1, set_count // 3))
+        for i in range(set_count):
+            exercise = session_exercises[i % len(session_exercises)]
+            reps = rng.randint(3, 15)
+            weight = None if rng.random() < 0.05 else Decimal(rng.randrange(10, 400, 5))
+            sets.append(WorkoutExercise(workout_id=session.id, exercise_id=exercise.id, reps=reps, weight=weight))
+
+            record = records.setdefault((session.user_id, exercise.id), [0, Decimal(0), None])
+            record[0] += reps
+            if weight is not None and weight > record[1]:
+                record[1], record[2] = weight, session.date
+            lifetime[session.user_id] += reps * (weight or 0)
+    WorkoutExercise.objects.bulk_create(sets, batch_size=BATCH_SIZE)
+
+    ExerciseRecord.objects.bulk_create([
+        ExerciseRecord(user_id=user_id, exercise_id=exercise_id, lifetime_reps=reps,
+                       personal_record=best, date_of_pr=best_date)
+        for (user_id, exercise_id), (reps, best, best_date) in records.items()
+    ], batch_size=BATCH_SIZE)
+
+    entries = []
+    for user_id in user_ids:
+        weight = rng.uniform(110, 260)
+        for offset in rng.sample(range(days), k=min(days, skewed_count(rng, weigh_ins_per_user))):
+            weight += rng.gauss(0, 1.5)
+            entries.append(WeightEntry(user_id=user_id, weight=Decimal(f"{weight:.1f}"),
+                                       date_recorded=today - timedelta(days=offset)))
+    WeightEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+
+    users = [User(id=user_id, lifetime_weight_lifted=total) for user_id, total in lifetime.items()]
+    User.objects.bulk_update(users, ['lifetime_weight_lifted'], batch_size=BATCH_SIZE)
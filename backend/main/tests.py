@@ -1,3 +1,108 @@
-from django.test import TestCase
+from django.db.models import Sum
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from exercise.models import Exercise, ExerciseRecord, Tag
+from main import synthetic
+from main.checks import check_shared_cache
+from main.nplusone import NPlusOneError, detect_nplusone, fingerprint
+from user.authentication import token_cache
+from user.serializers import WorkoutReadSerializer
+from user.models import User
+from workout.models import WorkoutExercise, WorkoutSession, WorkoutVolumeRollup
+from workout.rollups import SET_VOLUME
+
+
+class SyntheticDataTests(TestCase):
+    def test_seed_creates_consistent_history(self):
+        user_ids = synthetic.seed(users=5, exercises=20, tags=4, sessions_per_user=5, sets_per_session=6,
+                                  weigh_ins_per_user=3, days=60, seed_value=1)
+
+        self.assertEqual(User.objects.filter(id__in=user_ids).count(), 5)
+        self.assertTrue(WorkoutSession.objects.filter(user_id__in=user_ids).exists())
+
+        # the precomputed totals have to match what the real write path would have produced
+        for user in User.objects.filter(id__in=user_ids):
+            volume = WorkoutExercise.objects.filter(workout__user=user).aggregate(total=Sum(SET_VOLUME))['total'] or 0
+            self.assertEqual(user.lifetime_weight_lifted, volume)
+            weekly = WorkoutVolumeRollup.objects.filter(user=user, period='week').aggregate(total=Sum('total_volume'))['total'] or 0
+            self.assertEqual(weekly, volume)
+
+        reps = WorkoutExercise.objects.filter(workout__user_id__in=user_ids).aggregate(total=Sum('reps'))['total']
+        self.assertEqual(ExerciseRecord.objects.filter(user_id__in=user_ids).aggregate(total=Sum('lifetime_reps'))['total'], reps)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(username="metrics_user", password="password")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.user).key}")
+
+    def test_server_timing_header(self):
+        response = self.client.get(f"/api/user/{self.user.id}/")
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_metrics_endpoint_reports_route(self):
+        self.client.get(f"/api/user/{self.user.id}/")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        # labelled by the route pattern, not the actual path
+        self.assertIn('ascend_request_queries_count{method="GET",route="api/user/<int:userId>/",status="200"}', body)
+        self.assertIn('# TYPE ascend_request_duration_seconds histogram', body)
+
+    def test_metrics_are_off_by_default(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_metrics_only_for_allowed_addresses_and_staff(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403) # the test client is 127.0.0.1
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+        staff = User.objects.create_user(username="admin", password="password", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+class NPlusOneDetectorTests(TestCase):
+    def test_fingerprint_ignores_literals(self):
+        self.assertEqual(fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'a'"),
+                         fingerprint("SELECT * FROM t WHERE id = 22 AND name = 'b''c'"))
+        self.assertEqual(fingerprint("SELECT * FROM t WHERE id IN (%s, %s)"), fingerprint("SELECT * FROM t WHERE id IN (%s)"))
+
+    def test_reports_serializer_stack(self):
+        user = User.objects.create_user(username="nplusone_user", password="password")
+        tag = Tag.objects.create(name="Chest")
+        exercise = Exercise.objects.create(name="Bench Press")
+        exercise.tags.add(tag)
+        for i in range(4):
+            workout = WorkoutSession.objects.create(user=user, name=f"workout {i}")
+            WorkoutExercise.objects.create(workout=workout, exercise=exercise, reps=5, weight=100)
+
+        # no eager loading, so every workout loads its own sets
+        with self.assertRaises(NPlusOneError) as error:
+            with detect_nplusone(threshold=2):
+                WorkoutReadSerializer(WorkoutSession.objects.filter(user=user), many=True).data
+        self.assertIn("WorkoutReadSerializer.workout_sets", str(error.exception))
+
+        with detect_nplusone(threshold=2):
+            WorkoutReadSerializer(WorkoutReadSerializer.setup_eager_loading(WorkoutSession.objects.filter(user=user)), many=True).data
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_warns_about_the_in_process_cache(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['main.W001'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                           'LOCATION': 'redis://127.0.0.1:6379'}})
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_shared_cache(None), [])
@@ -1,6 +1,21 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
 
+from main.metrics import registry
+
 # Create your views here.
 
 # class RegisterUserView(CreateAPIView):
-#     serializer_class = UserSerializer
\ No newline at end of file
+#     serializer_class = UserSerializer
+
+
+def metrics(request):
+    # Prometheus scrape endpoint, per route request histograms for this process only: with several workers every
+    # one has to be scraped (or sits behind its own address). Off unless METRICS_ENABLED, and then only for the
+    # scraper's addresses in METRICS_ALLOWED_IPS or a logged in staff user, routes and timings aren't public.
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
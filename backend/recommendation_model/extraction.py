@@ -0,0 +1,167 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from itertools import islice
+
+from django.db.models import F, Max, Q, Sum, Window
+
+from exercise.models import Exercise
+from recommendation_model.recommendation_engine.dataset import (
+    DB_EXPORT_DIR, DEFAULT_CACHE_DIR, EXTRACTION_STATE, cache_file, read_extraction_state,
+)
+from workout.models import WorkoutExercise, WorkoutSession
+
+# Pulls training examples for RelevanceModel out of the workout history, in the same 6 column format as data.csv:
+#   muscle, sleep score, feeling, exercise name, difficulty, relevance
+# one row per exercise done in a session (and per muscle group tag of that exercise). Sessions only count if the
+# user entered sleep score and feeling, and the exercise needs a difficulty.
+# relevance is how hard the user pushed that exercise compared to their best at the time: heaviest weight in the
+# session as a percentage of the heaviest they had lifted up to and including that session. (Their current PR would
+# leak sessions that came later into the label.) Sets without a weight don't tell us that, so they're left out.
+#
+# extraction is incremental. The state file remembers the highest session id already exported (the watermark),
+# and each run only reads sessions after it, writing them to a new csv in db_exports/ that gets parsed into the
+# training cache right away. Session ids only ever go up (offline synced workouts can have old dates, but new ids),
+# so a nightly run only touches that day's sessions.
+# ids aren't committed in order though: a session still being saved while we read can have a lower id than one that's
+# already visible. Ids below the watermark that weren't there get remembered as gaps and looked for again on the
+# next run. A gap still empty after GAP_TIMEOUT was a rollback or a deleted session and is forgotten.
+# only ids above an earlier watermark count: on the first (or a --full) run everything committed long ago, and the
+# ids below the first session are just unused. At most MAX_GAPS are kept, the newest ones.
+
+CHUNK_SIZE = 2000
+GAP_TIMEOUT = 60 * 60 # seconds, far longer than any transaction stays open
+MAX_GAPS = 1000 # more missing ids than that are deleted sessions, not open transactions
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def session_exercises(since, until, retry, chunk_size):
+    # one row per (session, exercise) with the best weight, streamed from a server side cursor.
+    # sessions after `since` up to `until`, plus the ones in `retry` (earlier gaps)
+    return (
+        WorkoutExercise.objects
+        .filter(Q(workout_id__gt=since, workout_id__lte=until) | Q(workout_id__in=retry),
+                workout__sleep_score__isnull=False, workout__feeling__isnull=False,
+                exercise__difficulty__isnull=False, weight__isnull=False)
+        .values('workout_id', 'workout__user_id', 'workout__sleep_score', 'workout__feeling',
+                'exercise_id', 'exercise__name', 'exercise__difficulty')
+        .annotate(best_weight=Max('weight'), total_reps=Sum('reps'))
+        .order_by('workout_id', 'exercise_id')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def best_so_far(user_ids, exercise_ids, workout_ids):
+    # heaviest weight each user had lifted on each exercise up to and including each of these sessions,
+    # i.e. their PR as of that session. A running max over their history, sessions in date order (undated ones
+    # last, like the history page). Ties within a session are peers in the window, so every set of it counts.
+    running_max = Window(
+        Max('weight'),
+        partition_by=[F('workout__user_id'), F('exercise_id')],
+        order_by=[F('workout__date').asc(nulls_last=True), F('workout_id').asc()],
+    )
+    rows = (
+        WorkoutExercise.objects
+        .filter(workout__user_id__in=user_ids, exercise_id__in=exercise_ids, weight__isnull=False)
+        .annotate(best=running_max)
+        .values_list('workout_id', 'exercise_id', 'best')
+    )
+    return {(workout_id, exercise_id): best for workout_id, exercise_id, best in rows if workout_id in workout_ids}
+
+
+def training_rows(chunk):
+    # two queries per chunk: the tags of every exercise in it, and the users bests at the time of each session
+    exercise_ids = {row['exercise_id'] for row in chunk}
+    user_ids = {row['workout__user_id'] for row in chunk}
+
+    tags = {}
+    for exercise_id, tag_name in Exercise.tags.through.objects.filter(exercise_id__in=exercise_ids).values_list('exercise_id', 'tag__name'):
+        tags.setdefault(exercise_id, []).append(tag_name)
+    bests = best_so_far(user_ids, exercise_ids, {row['workout_id'] for row in chunk})
+
+    for row in chunk:
+        best = bests.get((row['workout_id'], row['exercise_id']))
+        if not best:
+            continue
+        relevance = min(100, max(1, round(100 * row['best_weight'] / best)))
+        for tag_name in tags.get(row['exercise_id'], []):
+            yield [tag_name, row['workout__sleep_score'], row['workout__feeling'], row['exercise__name'],
+                   row['exercise__difficulty'], relevance]
+
+
+def find_gaps(since, until):
+    # the newest MAX_GAPS ids in (since, until] with no session behind them (yet), streamed so only the gaps
+    # are held in memory
+    gaps = deque(maxlen=MAX_GAPS)
+    expected = since + 1
+    for session_id in WorkoutSession.objects.filter(id__gt=since, id__lte=until).order_by('id').values_list('id', flat=True).iterator():
+        gaps.extend(range(max(expected, session_id - MAX_GAPS), session_id))
+        expected = session_id + 1
+    gaps.extend(range(max(expected, until + 1 - MAX_GAPS), until + 1))
+    return list(gaps)
+
+
+def write_state(export_dir, state):
+    tmp = os.path.join(export_dir, EXTRACTION_STATE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, os.path.join(export_dir, EXTRACTION_STATE))
+
+
+def extract_training_data(export_dir=DB_EXPORT_DIR, cache_dir=DEFAULT_CACHE_DIR, full=False, chunk_size=CHUNK_SIZE):
+    # returns (path of the new export or None, rows written)
+    os.makedirs(export_dir, exist_ok=True)
+    old_state = read_extraction_state(export_dir)
+    # start over, the old exports would be duplicates of the new one. They're deleted once the new state is written.
+    state = {"watermark": 0, "exports": [], "gaps": {}} if full else {"gaps": {}, **old_state}
+
+    since = state["watermark"]
+    gaps = {int(session_id): first_seen for session_id, first_seen in state["gaps"].items()}
+    # fixed upper bound, so sessions saved while we're reading get picked up by the next run instead of half of them now
+    until = max(WorkoutSession.objects.aggregate(last=Max('id'))['last'] or 0, since)
+    if until == since and not gaps:
+        return None, 0
+
+    # gaps that have a session now get exported with this run, the rest are kept until they time out
+    now = time.time()
+    found = set(WorkoutSession.objects.filter(id__in=gaps).values_list('id', flat=True))
+    retry = sorted(found)
+    new_gaps = {session_id: first_seen for session_id, first_seen in gaps.items()
+                if session_id not in found and now - first_seen < GAP_TIMEOUT}
+    if since: # see the top of the file
+        new_gaps.update((session_id, now) for session_id in find_gaps(since, until))
+        new_gaps = dict(sorted(new_gaps.items())[-MAX_GAPS:])
+
+    name = f"sessions_{since + 1}_{until}.csv" if until > since else f"sessions_gaps_{int(now)}.csv"
+    path = os.path.join(export_dir, name)
+    written = 0
+    with open(path + ".tmp", "w", newline="") as f:
+        writer = csv.writer(f)
+        for chunk in chunked(session_exercises(since, until, retry, chunk_size), chunk_size):
+            for row in training_rows(chunk):
+                writer.writerow(row)
+                written += 1
+
+    if written:
+        os.replace(path + ".tmp", path)
+        cache_file(path, cache_dir) # parse it into the training cache now, not during the next training run
+        state["exports"].append(name)
+    else:
+        os.remove(path + ".tmp")
+        path = None
+    state["watermark"] = until # only moved once the export is safely on disk
+    state["gaps"] = {str(session_id): first_seen for session_id, first_seen in sorted(new_gaps.items())}
+    write_state(export_dir, state)
+
+    if full: # a crash before this point leaves the old exports in place and in the state file
+        for old_name in set(old_state["exports"]) - set(state["exports"]):
+            if os.path.exists(os.path.join(export_dir, old_name)):
+                os.remove(os.path.join(export_dir, old_name))
+    return path, written
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from recommendation_model.extraction import CHUNK_SIZE, extract_training_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports recommendation model training examples from the workout history logged since the last run, "
+        "and adds them to the training data cache. Meant to run nightly before retraining."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Ignore the watermark and export the whole history again.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows fetched from the database at a time.")
+
+    def handle(self, *args, **options):
+        path, rows = extract_training_data(full=options['full'], chunk_size=options['chunk_size'])
+        if path is None:
+            self.stdout.write("No new training examples since the last extraction.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {rows} training examples to {path}."))
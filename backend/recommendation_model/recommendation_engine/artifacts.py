@@ -0,0 +1,55 @@
+import csv
+import json
+import os
+
+# everything inference needs besides the weights: the scaler's min/max per feature, the muscle group encoding
+# and the exercise catalog (test.csv). model.py used to refit all of that from the CSVs every time it was imported,
+# now it gets fitted once here and saved as json next to workout_model.pth.
+#
+# rebuild after retraining:  python artifacts.py   (from this folder, like the training scripts)
+
+ENGINE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACTS_PATH = os.path.join(ENGINE_DIR, "inference_artifacts.json")
+WEIGHTS_PATH = os.path.join(ENGINE_DIR, "workout_model.pth")
+
+FEATURES = ["Muscle", "Sleep Score", "Feeling", "Workout Difficulty"]
+
+
+def build_artifacts(training_paths=None, catalog_csv=os.path.join(ENGINE_DIR, "test.csv"),
+                    neurons_per_layer=16, num_layers=4):
+    # model.py runs this as a plain script next to dataset.py, inference imports it as part of the package
+    if __package__:
+        from .dataset import load_dataset, to_float
+    else:
+        from dataset import load_dataset, to_float
+
+    # the scaler is just the min and max of every feature column, muscle codes follow the sorted vocabulary
+    # exactly like LabelEncoder, so both come straight from the typed columns.
+    dataset = load_dataset(training_paths) # default: the same sources model.py trains on
+    X, _ = dataset.training_arrays()
+
+    with open(catalog_csv, newline="") as f:
+        catalog = [
+            {"muscle": muscle, "name": name, "difficulty": to_float(difficulty)}
+            for muscle, name, difficulty in csv.reader(f)
+        ]
+
+    return {
+        "features": FEATURES,
+        "scaler": {"data_min": X.min(axis=0).tolist(), "data_max": X.max(axis=0).tolist()},
+        "muscle_classes": dataset.vocabularies["muscle"], # index in this list is the encoded value
+        "model": {"in_features": len(FEATURES), "neurons_per_layer": neurons_per_layer, "num_layers": num_layers},
+        "catalog": catalog,
+    }
+
+
+def write_artifacts(path=ARTIFACTS_PATH, **kwargs):
+    artifacts = build_artifacts(**kwargs)
+    with open(path, "w") as f:
+        json.dump(artifacts, f, indent=1)
+    return artifacts
+
+
+if __name__ == "__main__":
+    write_artifacts()
+    print("wrote", ARTIFACTS_PATH)
@@ -0,0 +1,101 @@
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import torch
+
+from .artifacts import WEIGHTS_PATH
+from .export import export_model
+from .inference import Recommender
+from .lookup import FEELINGS, SLEEP_SCORES
+
+# Compares the exported models against the eager fp32 one on the test.csv candidates:
+#   latency - one recommend() call, and scoring the whole (muscle, sleep, feeling) grid in one batch
+#   memory  - size on disk and how much resident memory a fresh process gains loading it and recommending once
+#             (current RSS from /proc/self/statm, so Linux only. ru_maxrss is the peak and importing torch already set it)
+#   drift   - how far the scores move from eager fp32, and how often the top 3 changes
+#
+# run from backend/:  python -m recommendation_model.recommendation_engine.bench_export
+
+MEMORY = """
+import os, sys
+import torch
+from recommendation_model.recommendation_engine.inference import Recommender
+
+def rss_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+before = rss_kb()
+Recommender.load(model_path=sys.argv[1]).recommend("Chest", 85, 4)
+print(rss_kb() - before)
+"""
+
+
+def grid_requests(recommender):
+    muscles = [muscle for muscle in recommender.muscle_codes if muscle in recommender.candidates]
+    return [(muscle, sleep, feeling) for muscle in muscles for sleep in SLEEP_SCORES for feeling in FEELINGS]
+
+
+def grid_scores(recommender, requests):
+    features = torch.cat([recommender.features(*request) for request in requests])
+    return recommender.score(features)
+
+
+def latency(recommender, requests, single_calls=2000, batch_runs=50):
+    single = []
+    for i in range(single_calls):
+        started = time.perf_counter()
+        recommender.recommend(*requests[(i * 37) % len(requests)])
+        single.append((time.perf_counter() - started) * 1e6)
+    batch = []
+    for _ in range(batch_runs):
+        started = time.perf_counter()
+        grid_scores(recommender, requests)
+        batch.append((time.perf_counter() - started) * 1000)
+    return statistics.median(single), statistics.median(batch)
+
+
+def memory_kb(model_path):
+    if not os.path.exists("/proc/self/statm"):
+        return "n/a"
+    output = subprocess.run([sys.executable, "-c", MEMORY, model_path], capture_output=True, text=True, check=True).stdout
+    return int(output.strip())
+
+
+def top_agreement(recommender, requests, scores, reference, top_n=3):
+    sizes = [len(recommender.candidates[muscle]) for muscle, _, _ in requests]
+    same = 0
+    for request_scores, reference_scores in zip(scores.split(sizes), reference.split(sizes)):
+        k = min(top_n, len(request_scores))
+        same += set(request_scores.topk(k).indices.tolist()) == set(reference_scores.topk(k).indices.tolist())
+    return same / len(requests)
+
+
+def main(threads=1):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {
+            "eager fp32": WEIGHTS_PATH,
+            "torchscript fp32": export_model(output_path=os.path.join(directory, "fp32.ts")),
+            "torchscript int8": export_model(int8=True, output_path=os.path.join(directory, "int8.ts")),
+        }
+        recommenders = {name: Recommender.load(model_path=path, threads=threads) for name, path in paths.items()}
+        requests = grid_requests(recommenders["eager fp32"])
+        reference = grid_scores(recommenders["eager fp32"], requests)
+
+        print(f"{len(requests)} grid cells, {len(reference)} candidate rows, {threads} intra-op thread(s)")
+        print(f"{'model':<18} {'recommend us':>12} {'grid ms':>8} {'disk KB':>8} {'rss KB':>8} {'max drift':>10} {'mean drift':>10} {'top3 same':>9}")
+        for name, recommender in recommenders.items():
+            single_us, batch_ms = latency(recommender, requests)
+            scores = grid_scores(recommender, requests)
+            drift = (scores - reference).abs()
+            print(f"{name:<18} {single_us:>12.1f} {batch_ms:>8.2f} {os.path.getsize(paths[name]) / 1024:>8.1f} "
+                  f"{memory_kb(paths[name]):>8} {drift.max().item():>10.5f} {drift.mean().item():>10.5f} "
+                  f"{top_agreement(recommender, requests, scores, reference):>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
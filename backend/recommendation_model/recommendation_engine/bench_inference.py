@@ -0,0 +1,73 @@
+import statistics
+import subprocess
+import sys
+import time
+
+# Measures what recommendations cost a web worker:
+#   cold start  - a fresh python process importing inference and serving its first recommendation
+#   per request - recommend() once everything is loaded
+#   batch       - recommend_batch() scoring many requests in one forward pass, per request cost
+#
+# run from backend/:  python -m recommendation_model.recommendation_engine.bench_inference
+
+COLD_START = """
+import time
+started = time.perf_counter()
+from recommendation_model.recommendation_engine import inference
+imported = time.perf_counter()
+inference.recommend("Chest", 85, 4)
+print(imported - started, inference.load_seconds, time.perf_counter() - started)
+"""
+
+
+def cold_start(runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", COLD_START], capture_output=True, text=True, check=True).stdout
+        results.append([float(value) for value in output.split()])
+    return results
+
+
+def per_request(requests):
+    from recommendation_model.recommendation_engine import inference
+
+    inference.get_recommender()
+    groups = ["Chest", "Leg", "Arm", "Back"]
+    timings = []
+    for i in range(requests):
+        started = time.perf_counter()
+        inference.recommend(groups[i % len(groups)], sleep_score=(i * 7) % 100 + 1, feeling=i % 5 + 1)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def batched(requests, batch_size=64):
+    from recommendation_model.recommendation_engine import inference
+
+    groups = ["Chest", "Leg", "Arm", "Back"]
+    batch = [(groups[i % len(groups)], (i * 7) % 100 + 1, i % 5 + 1) for i in range(batch_size)]
+    timings = []
+    for _ in range(max(1, requests // batch_size)):
+        started = time.perf_counter()
+        inference.recommend_batch(batch)
+        timings.append((time.perf_counter() - started) * 1000 / batch_size)
+    return timings
+
+
+def main(cold_runs=5, requests=2000):
+    cold = cold_start(cold_runs)
+    print(f"cold start over {cold_runs} processes (median ms)")
+    print(f"  import inference       {statistics.median(run[0] for run in cold) * 1000:8.2f}")
+    print(f"  load weights+artifacts {statistics.median(run[1] for run in cold) * 1000:8.2f}")
+    print(f"  first recommendation   {statistics.median(run[2] for run in cold) * 1000:8.2f}  (total)")
+
+    timings = per_request(requests)
+    cuts = statistics.quantiles(timings, n=100, method="inclusive")
+    print(f"per request over {requests} calls: p50 {cuts[49]:.3f} ms  p95 {cuts[94]:.3f} ms  p99 {cuts[98]:.3f} ms")
+
+    timings = batched(requests)
+    print(f"batched, 64 requests per call: {statistics.median(timings) * 1000:.1f} us per request (median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import json
+import os
+
+import numpy as np
+
+from .lookup import ENGINE_DIR, FEELINGS, SLEEP_SCORES
+
+# Evaluates the trained model over the whole (muscle, sleep, feeling) grid and writes the tables lookup.py serves from.
+# rerun after retraining or changing the exercise catalog (artifacts.py), from backend/:
+#   python -m recommendation_model.recommendation_engine.build_lookup
+
+TOP_N = 10 # ranks kept per cell, more than any endpoint asks for
+
+
+def build_lookup(top_n=TOP_N, output_dir=ENGINE_DIR):
+    from .inference import Recommender # needs torch, only the build step does
+
+    recommender = Recommender.load()
+    torch = recommender.torch
+    muscles = [muscle for muscle in recommender.muscle_codes if muscle in recommender.candidates]
+    requests = [(muscle, sleep, feeling) for muscle in muscles for sleep in SLEEP_SCORES for feeling in FEELINGS]
+
+    # same scoring as recommend_batch: every candidate of every cell in one forward pass (~2000 cells).
+    # ranks are kept as positions in the muscle's exercise list, test.csv has a few exercises listed twice
+    # with different difficulties so the names alone aren't unique.
+    features = [recommender.features(*request) for request in requests]
+    scores = recommender.score(torch.cat(features)).split([len(rows) for rows in features])
+    results = []
+    for cell_scores in scores:
+        values, indices = torch.topk(cell_scores, min(top_n, len(cell_scores)))
+        results.append((indices.tolist(), values.tolist()))
+    write_lookup(muscles, recommender.names, requests, results, top_n, output_dir)
+
+
+def write_lookup(muscles, names, requests, results, top_n, output_dir=ENGINE_DIR):
+    # results has one (exercise positions, scores) pair per request, best first.
+    positions = {muscle: position for position, muscle in enumerate(muscles)}
+    shape = (len(muscles), len(SLEEP_SCORES), len(FEELINGS), top_n)
+    indices = np.full(shape, -1, dtype=np.int16)
+    scores = np.zeros(shape, dtype=np.float32)
+
+    for (muscle, sleep, feeling), (cell_indices, cell_scores) in zip(requests, results):
+        cell = (positions[muscle], sleep - SLEEP_SCORES.start, feeling - FEELINGS.start)
+        indices[cell][:len(cell_indices)] = cell_indices
+        scores[cell][:len(cell_scores)] = cell_scores
+
+    np.save(os.path.join(output_dir, "lookup_indices.npy"), indices)
+    np.save(os.path.join(output_dir, "lookup_scores.npy"), scores)
+    meta = {
+        "muscles": muscles,
+        "names": {muscle: names[muscle] for muscle in muscles},
+        "sleep": [SLEEP_SCORES.start, SLEEP_SCORES.stop - 1],
+        "feeling": [FEELINGS.start, FEELINGS.stop - 1],
+    }
+    with open(os.path.join(output_dir, "lookup_meta.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+
+if __name__ == "__main__":
+    build_lookup()
+    print("wrote lookup tables to", ENGINE_DIR)
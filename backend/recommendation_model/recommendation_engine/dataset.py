@@ -0,0 +1,203 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Training data layer.
+# each source csv gets parsed once into typed columns (float32 numbers, int32 codes for the text columns)
+# and saved as .npy files under dataset_cache/<hash of the file>/. After that, loading the data is just memory
+# mapping those files, no csv parsing and no type coercion. The cache key is the file's contents, so when the
+# training set grows by adding another csv only the new file gets parsed, and editing a file re-parses just that one.
+# rows get read and written in chunks, so neither building the cache nor iter_chunks() needs the whole set in memory.
+#
+# no relative imports in here on purpose: the training scripts import it as `dataset` from this folder,
+# the web side as recommendation_model.recommendation_engine.dataset.
+
+ENGINE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCES = [os.path.join(ENGINE_DIR, "data.csv")]
+DEFAULT_CACHE_DIR = os.path.join(ENGINE_DIR, "dataset_cache")
+# csv files pulled out of the production database by `manage.py extract_training_data`, listed in the state file
+DB_EXPORT_DIR = os.path.join(ENGINE_DIR, "db_exports")
+EXTRACTION_STATE = "extraction_state.json"
+
+# csv column order. "category" columns are stored as int32 codes into a sorted vocabulary
+# (the same codes LabelEncoder would give), everything else as float32 with NaN where a value didn't parse.
+COLUMNS = [
+    ("muscle", "category"),
+    ("sleep_score", "float32"),
+    ("feeling", "float32"),
+    ("workout_name", "category"),
+    ("difficulty", "float32"),
+    ("relevance", "float32"),
+]
+FEATURES = ["muscle", "sleep_score", "feeling", "difficulty"] # model inputs, in the order the model expects
+LABEL = "relevance"
+
+CHUNK_ROWS = 65536
+CACHE_FORMAT = 1 # bump when the column layout changes so old caches get ignored
+
+
+def file_hash(path):
+    digest = hashlib.sha256(f"format {CACHE_FORMAT}".encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:24]
+
+
+def read_rows(path):
+    with open(path, newline="") as csvfile:
+        for line in csv.reader(csvfile):
+            if len(line) == len(COLUMNS): # skips blank and broken lines
+                yield line
+
+
+def read_chunks(path, chunk_rows):
+    chunk = []
+    for row in read_rows(path):
+        chunk.append(row)
+        if len(chunk) == chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def build_cache(path, directory, chunk_rows=CHUNK_ROWS):
+    # two passes over the csv: count the rows so every column can be preallocated as a memory mapped file,
+    # then parse chunk by chunk straight into those files.
+    rows = sum(1 for _ in read_rows(path))
+    # a temp dir of its own, other processes (the search's workers) may be building the same file at the same time
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(directory) + ".", suffix=".tmp", dir=os.path.dirname(directory))
+
+    arrays = {}
+    vocabularies = {}
+    for name, kind in COLUMNS:
+        dtype = np.int32 if kind == "category" else np.float32
+        arrays[name] = np.lib.format.open_memmap(os.path.join(tmp, f"{name}.npy"), mode="w+", dtype=dtype, shape=(rows,))
+        if kind == "category":
+            vocabularies[name] = {}
+
+    start = 0
+    for chunk in read_chunks(path, chunk_rows):
+        end = start + len(chunk)
+        for position, (name, kind) in enumerate(COLUMNS):
+            values = [row[position] for row in chunk]
+            if kind == "category":
+                vocabulary = vocabularies[name]
+                arrays[name][start:end] = [vocabulary.setdefault(value, len(vocabulary)) for value in values]
+            else:
+                arrays[name][start:end] = [to_float(value) for value in values]
+        start = end
+
+    # codes were handed out in the order values showed up, renumber them so they follow the sorted vocabulary
+    meta = {"source": os.path.abspath(path), "rows": rows, "vocabularies": {}}
+    for name, vocabulary in vocabularies.items():
+        ordered = sorted(vocabulary)
+        renumber = np.empty(len(vocabulary), dtype=np.int32)
+        for code, value in enumerate(ordered):
+            renumber[vocabulary[value]] = code
+        column = arrays[name]
+        for chunk_start in range(0, rows, chunk_rows):
+            column[chunk_start:chunk_start + chunk_rows] = renumber[column[chunk_start:chunk_start + chunk_rows]]
+        meta["vocabularies"][name] = ordered
+
+    for array in arrays.values():
+        array.flush()
+    del arrays
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    # only a finished cache ever shows up under its real name
+    try:
+        os.replace(tmp, directory)
+    except OSError:
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            raise
+        shutil.rmtree(tmp, ignore_errors=True) # someone else finished the same cache first, theirs is just as good
+
+
+class CachedFile:
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self.vocabularies = self.meta["vocabularies"]
+        self.columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name, _ in COLUMNS}
+
+
+def cache_file(path, cache_dir=DEFAULT_CACHE_DIR):
+    directory = os.path.join(cache_dir, file_hash(path))
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        os.makedirs(cache_dir, exist_ok=True)
+        build_cache(path, directory)
+    return CachedFile(directory)
+
+
+class Dataset:
+    # several cached csv files read as one. Every file has its own vocabulary for the text columns,
+    # so codes get translated into the combined (sorted) vocabulary as chunks are read.
+
+    def __init__(self, files):
+        self.files = files
+        self.vocabularies = {}
+        self.remaps = [{} for _ in files]
+        for name, kind in COLUMNS:
+            if kind != "category":
+                continue
+            combined = sorted(set().union(*(file.vocabularies[name] for file in files)))
+            self.vocabularies[name] = combined
+            for remap, file in zip(self.remaps, files):
+                remap[name] = np.searchsorted(combined, file.vocabularies[name]).astype(np.int32)
+
+    def __len__(self):
+        return sum(file.rows for file in self.files)
+
+    def iter_chunks(self, chunk_rows=CHUNK_ROWS, columns=None):
+        # yields {column name: array} with at most chunk_rows rows, without loading more than that into memory
+        columns = columns or [name for name, _ in COLUMNS]
+        for file, remap in zip(self.files, self.remaps):
+            for start in range(0, file.rows, chunk_rows):
+                chunk = {}
+                for name in columns:
+                    values = file.columns[name][start:start + chunk_rows]
+                    chunk[name] = remap[name][values] if name in remap else np.array(values)
+                yield chunk
+
+    def column(self, name):
+        # the whole column in memory, for datasets that fit
+        return np.concatenate([chunk[name] for chunk in self.iter_chunks(columns=[name])] or [np.empty(0)])
+
+    def training_arrays(self):
+        # (features, labels) as float32, features in FEATURES order, rows with a value that didn't parse dropped
+        X = np.stack([self.column(name).astype(np.float32) for name in FEATURES], axis=1)
+        y = self.column(LABEL).astype(np.float32)
+        keep = ~(np.isnan(X).any(axis=1) | np.isnan(y))
+        return X[keep], y[keep]
+
+
+def read_extraction_state(export_dir=DB_EXPORT_DIR):
+    try:
+        with open(os.path.join(export_dir, EXTRACTION_STATE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"watermark": 0, "exports": []}
+
+
+def training_sources(export_dir=DB_EXPORT_DIR):
+    # the hand written csvs plus everything extracted from the database so far
+    return DEFAULT_SOURCES + [os.path.join(export_dir, name) for name in read_extraction_state(export_dir)["exports"]]
+
+
+def load_dataset(paths=None, cache_dir=DEFAULT_CACHE_DIR):
+    return Dataset([cache_file(path, cache_dir) for path in (paths or training_sources())])
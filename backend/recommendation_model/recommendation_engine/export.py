@@ -0,0 +1,47 @@
+import os
+
+import torch
+import torch.nn as nn
+
+from .artifacts import ENGINE_DIR, WEIGHTS_PATH
+from .inference import Recommender
+
+# Exports RelevanceModel as TorchScript for the CPU boxes, optionally with int8 dynamic quantization.
+# TorchScript runs the forward pass without going through the python nn.Module machinery, and dynamic quantization
+# stores the nn.Linear weights as int8 (activations get quantized on the fly), so the model gets smaller and the
+# matrix multiplies cheaper. Run after training, from backend/:
+#   python -m recommendation_model.recommendation_engine.export            fp32 -> workout_model.ts
+#   python -m recommendation_model.recommendation_engine.export --int8     int8 -> workout_model_int8.ts
+# then point RECOMMENDER_MODEL_PATH at the file. bench_export.py checks what it costs in accuracy.
+
+FP32_PATH = os.path.join(ENGINE_DIR, "workout_model.ts")
+INT8_PATH = os.path.join(ENGINE_DIR, "workout_model_int8.ts")
+
+
+def quantize(model):
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def export_model(int8=False, output_path=None):
+    # the eager fp32 model with the trained weights. Not whatever RECOMMENDER_MODEL_PATH points at,
+    # that may be an exported model already.
+    recommender = Recommender.load(model_path=WEIGHTS_PATH)
+    model = recommender.model
+    if int8:
+        model = quantize(model)
+
+    # trace rather than script: forward is a plain loop over the layers, so one example input records all of it,
+    # and tracing also works on the quantized layers.
+    example = next(iter(recommender.candidates.values()))
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    traced = torch.jit.freeze(traced.eval()) # folds the weights in as constants
+
+    output_path = output_path or (INT8_PATH if int8 else FP32_PATH)
+    traced.save(output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    import sys
+    print("wrote", export_model(int8="--int8" in sys.argv))
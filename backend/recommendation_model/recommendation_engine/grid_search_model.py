@@ -1,208 +1,205 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from multiprocessing import get_context
+
 import torch
-import random
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader, TensorDataset
-import sys
-
-import pandas as pd
-from sklearn.preprocessing import LabelEncoder, MinMaxScaler
-from data_reader import data
-from sklearn.model_selection import train_test_split
-
-torch.manual_seed(42)
-
-le_workout = LabelEncoder()
-scaler = MinMaxScaler()
-training_split = int(len(data) * 0.8)
-
-
-
-df = pd.DataFrame(data, columns=["Muscle", "Sleep Score", "Feeling", "Workout Name", "Workout Difficulty", "Relevance Score"])
-for col in ["Sleep Score", "Feeling", "Workout Difficulty", "Relevance Score"]:
-    df[col] = pd.to_numeric(df[col], errors="coerce")
-workout_names = df["Workout Name"].tolist()
-
-
-#df = df.sample(frac=1) # shuffle our rows so trains equally on all muscle groups.
-
-
-
-
-
-y = pd.to_numeric(df["Relevance Score"]) # labels being stored as objects so need to convert to integers.
-# scale our labels to the 0-1 range
-y_min = y.min()
-y_max = y.max()
-y_normalized = (y - y_min) / (y_max - y_min)
-
-y_tensor = torch.tensor(y_normalized.values, dtype=torch.float32).view(-1, 1)
-print(y.isna().sum()) 
-
-df["Muscle"] = le_workout.fit_transform(df["Muscle"])
-
-
-X = df[["Muscle", "Sleep Score", "Feeling", "Workout Difficulty"]]
-
-
-
-
-print(df.dtypes)
-X_scaled = scaler.fit_transform(X) # this basically changes our data from ranging from differences like 0-100, to 0-1. every one of our numbers will be within that range leading to more consistency. matches label ranegs.
 
-X_tensor = torch.tensor(X_scaled, dtype=torch.float32)
-print("head:", y.head())
-print("type", y.dtype)
+from .artifacts import ENGINE_DIR, WEIGHTS_PATH, write_artifacts
+from .dataset import load_dataset, training_sources
+from .leaderboard import Leaderboard, rung_budgets, trial_id_for
+from .relevance_model import RelevanceModel
+
+# Hyperparameter search for RelevanceModel.
+# this used to train every combination one after the other for 1000 epochs, each one overwriting workout_model.pth.
+# now trials run in a pool of worker processes and bad ones get dropped early with successive halving:
+# every trial trains for a small number of epochs, the best 1/eta of them go on to train eta times longer, and so on
+# until max_epochs. Inside a trial, training also stops once the test loss hasn't improved for `patience` evaluations.
+#
+# every trial keeps its own checkpoint and weights under <output>/<search name>/<trial id>/, and every finished
+# rung goes into a sqlite leaderboard. Running the same search again skips whatever is already in the leaderboard
+# and picks unfinished trials up from their checkpoints, so an interrupted search just resumes.
+#
+# run from backend/:
+#   python -m recommendation_model.recommendation_engine.grid_search_model --workers 4
+#   python -m recommendation_model.recommendation_engine.grid_search_model --promote   (copies the winner to workout_model.pth)
+
+DEFAULT_GRID = {
+    "learning_rate": [0.01, 0.001],
+    "neurons_per_layer": [4, 8, 16],
+    "num_layers": [2, 3, 4],
+}
+# best parameters found so far: learning_rate 0.001, neurons_per_layer 16, num_layers 4
 
+DEFAULT_OUTPUT = os.path.join(ENGINE_DIR, "search_runs")
 
 
-# X_train = X_tensor[:training_split]
-# X_test = X_tensor[training_split:]
+def load_training_data(paths=None):
+    # same preprocessing as model.py: min-max scaled features, labels scaled to 0-1, 80/20 split.
+    # the columns come typed and encoded from the dataset cache, so every worker just memory maps them.
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import MinMaxScaler
 
-# y_train = y_tensor[:training_split]
-# y_test = y_tensor[training_split:]
+    X, y = load_dataset(paths).training_arrays() # default: data.csv plus the database exports
+    y_normalized = (y - y.min()) / (y.max() - y.min())
+    X_tensor = torch.tensor(MinMaxScaler().fit_transform(X), dtype=torch.float32)
+    y_tensor = torch.tensor(y_normalized, dtype=torch.float32).view(-1, 1)
+    return train_test_split(X_tensor, y_tensor, test_size=0.2, random_state=42)
 
-# train_test split from sklearn shuffles datarows. 
-X_train, X_test, y_train, y_test = train_test_split(
-    X_tensor, y_tensor, test_size=0.2, random_state=42
-)
 
+# ---- worker side ----
 
-print(y_tensor.min(), y_tensor.max())
+_worker_data = None
 
-print("NaN in X_train:", torch.isnan(X_train).sum().item())
-print("NaN in X_test:", torch.isnan(X_test).sum().item())
-print("NaN in y_train:", torch.isnan(y_train).sum().item())
-print("NaN in y_test:", torch.isnan(y_test).sum().item())
 
-print("Rows with NaN in X:")
-print(df[df.isna().any(axis=1)])
+def init_worker(threads, data_paths):
+    # pin every worker to a few torch threads, otherwise each one tries to use every core and they all slow down.
+    global _worker_data
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    _worker_data = load_training_data(data_paths) # loaded once per worker, not once per trial
 
-rows_with_sleep_9 = df[df["Sleep Score"] == 9]
-print(rows_with_sleep_9)
 
-#grid search
-# param_grid = {
-#     "learning_rate": [0.01, 0.001],
-#     "neurons_per_layer": [4, 8, 16],
-#     "num_layers": [2, 3, 4]
-# }
-#best parameters
-param_grid = {
-    "learning_rate":[0.001],
-    "neurons_per_layer":[16],
-    "num_layers":[4]
-}
+def train_trial(trial_id, config, target_epochs, trial_dir, patience, eval_every):
+    # trains one trial up to target_epochs, continuing from its checkpoint if it has one.
+    X_train, X_test, y_train, y_test = _worker_data
+    os.makedirs(trial_dir, exist_ok=True)
+    checkpoint_path = os.path.join(trial_dir, "checkpoint.pt")
+    model_path = os.path.join(trial_dir, "model.pth")
+    started = time.perf_counter()
 
-# class RelevanceModel(nn.Module):
-#     def __init__(self):
-#         super().__init__()
-#         self.layer_1 = nn.Linear(in_features=4, out_features=8)
-#         self.layer_2 = nn.Linear(in_features=8, out_features=8)
-#         self.layer_3 = nn.Linear(in_features=8, out_features=1)
-#         self.relu = nn.ReLU()
-        
-#     def forward(self, x):
-#         x = self.relu(self.layer_1(x))
-#         x = self.relu(self.layer_2(x))
-#         x = self.layer_3(x)
-#         return x
-
-
-# optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
-
-def train_model(params, X_train, y_train, X_test, y_test, epochs=1000):
-    # Unpack parameters
-    learning_rate = params["learning_rate"]
-    neurons_per_layer = params["neurons_per_layer"]
-    num_layers = params["num_layers"]
-
-    # Define the model dynamically based on the hyperparameters
-    class RelevanceModel(nn.Module):
-        def __init__(self):
-            super().__init__()
-            self.layers = nn.ModuleList()
-            self.layers.append(nn.Linear(in_features=4, out_features=neurons_per_layer))
-            for _ in range(num_layers - 1):
-                self.layers.append(nn.Linear(in_features=neurons_per_layer, out_features=neurons_per_layer))
-            self.layers.append(nn.Linear(in_features=neurons_per_layer, out_features=1))
-            self.relu = nn.ReLU()
-        
-        def forward(self, x):
-            for layer in self.layers[:-1]:
-                x = self.relu(layer(x))
-            x = self.layers[-1](x)
-            return x
-
-    # Initialize model, loss, and optimizer
-    model = RelevanceModel().to("cpu")
+    torch.manual_seed(int(trial_id[:8], 16)) # same trial id, same starting weights
+    model = RelevanceModel(neurons_per_layer=config["neurons_per_layer"], num_layers=config["num_layers"])
+    optimizer = optim.Adam(model.parameters(), lr=config["learning_rate"])
     loss_fn = nn.MSELoss()
-    optimizer = optim.Adam(model.parameters(), lr=learning_rate)
-
-    
-    for epoch in range(epochs):
-        model.train()
-        y_probs = model(X_train)
+    state = {"epoch": 0, "best_loss": math.inf, "best_epoch": 0, "bad_evals": 0, "early_stopped": False}
 
-        loss = loss_fn(y_probs, y_train)
+    if os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, weights_only=False)
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        state = checkpoint["state"]
 
+    while state["epoch"] < target_epochs and not state["early_stopped"]:
+        model.train()
+        loss = loss_fn(model(X_train), y_train)
         optimizer.zero_grad()
-
         loss.backward()
         optimizer.step()
+        state["epoch"] += 1
 
-        model.eval()
-        with torch.no_grad():
-            y_preds = model(X_test)
-            test_loss = loss_fn(y_preds, y_test)
-        
-        if epoch % 100 == 0:
+        if state["epoch"] % eval_every == 0 or state["epoch"] == target_epochs:
+            model.eval()
             with torch.inference_mode():
-                    y_preds = model(X_test)
-                    test_loss = loss_fn(y_preds, y_test)
-
-                    # print("Predictions:", test_y_probs.squeeze().tolist())  # Print predicted values
-                    # print("True Values:", y_test.squeeze().tolist())  
-                    y_pred_denormalized = y_preds * (y_max - y_min) + y_min
-                    y_test_denormalized = y_test * (y_max - y_min) + y_min
-                    test_loss_original = torch.mean((y_pred_denormalized - y_test_denormalized) ** 2)
-                
-
-                    if epoch % 100 == 0:
-                        print(f"Epoch: {epoch} | Loss: {loss}| Test loss: {test_loss} ")
-    torch.save(model.state_dict(), "workout_model.pth")
-    return test_loss.item()
-
-   
-
-        
-    
-from itertools import product
-
-# Generate all combinations of hyperparameters
-param_combinations = list(product(*param_grid.values()))
-best_params = None
-best_loss = float("inf")
-
-# Grid search loop
-
-for param_set in param_combinations:
-    params = dict(zip(param_grid.keys(), param_set))
-    print(f"Testing parameters: {params}")
-    
-    test_loss = train_model(params, X_train, y_train, X_test, y_test)
-    print(f"Test loss: {test_loss}")
-
-    if test_loss < best_loss:
-        best_loss = test_loss
-        best_params = params
-
-
-print(f"Best parameters: {best_params}")
-print(f"Best test loss: {best_loss}")
-
-
-
-                
-
-
+                test_loss = loss_fn(model(X_test), y_test).item()
+            if test_loss < state["best_loss"]:
+                state.update(best_loss=test_loss, best_epoch=state["epoch"], bad_evals=0)
+                torch.save(model.state_dict(), model_path) # the trial's artifact is always its best weights
+            else:
+                state["bad_evals"] += 1
+                state["early_stopped"] = state["bad_evals"] >= patience
+
+    torch.save({"model": model.state_dict(), "optimizer": optimizer.state_dict(), "state": state}, checkpoint_path)
+    return {
+        "trial_id": trial_id,
+        "epochs": state["epoch"],
+        "test_loss": state["best_loss"],
+        "best_epoch": state["best_epoch"],
+        "early_stopped": state["early_stopped"],
+        "artifact_path": model_path,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+# ---- driver side ----
+
+
+def run_search(grid=DEFAULT_GRID, name=None, output=DEFAULT_OUTPUT, workers=2, threads=1, min_epochs=100, max_epochs=1000,
+               eta=3, patience=5, eval_every=25, data_paths=None):
+    configs = {}
+    for values in product(*grid.values()):
+        config = dict(zip(grid.keys(), values))
+        configs[trial_id_for(config)] = config
+
+    budgets = rung_budgets(min_epochs, max_epochs, eta)
+    # the name covers everything that changes results, so resuming with different settings starts a separate search
+    name = name or hashlib.sha1(json.dumps([grid, budgets, eta, patience, eval_every], sort_keys=True).encode()).hexdigest()[:10]
+    search_dir = os.path.join(output, name)
+    os.makedirs(search_dir, exist_ok=True)
+    leaderboard = Leaderboard(os.path.join(output, "leaderboard.sqlite3"))
+
+    # parse the csvs into the dataset cache here, once, instead of every worker racing to do it.
+    # the workers get the same list of files, even if an extraction adds one while the search runs.
+    data_paths = data_paths or training_sources()
+    load_dataset(data_paths)
+
+    alive = list(configs)
+    context = get_context("spawn") # forking a process that already started torch threads can deadlock
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker, initargs=(threads, data_paths)) as pool:
+        for rung, budget in enumerate(budgets):
+            results = leaderboard.finished(name, rung)
+            todo = [trial_id for trial_id in alive if trial_id not in results]
+            print(f"rung {rung}: {len(alive)} trials to {budget} epochs ({len(alive) - len(todo)} already in the leaderboard)")
+
+            futures = {
+                pool.submit(train_trial, trial_id, configs[trial_id], budget, os.path.join(search_dir, trial_id), patience, eval_every): trial_id
+                for trial_id in todo
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                leaderboard.record(name, rung, configs[result["trial_id"]], result)
+                results[result["trial_id"]] = result
+                print(f"  {result['trial_id']} {configs[result['trial_id']]} test loss {result['test_loss']:.5f} "
+                      f"after {result['epochs']} epochs{' (early stopped)' if result['early_stopped'] else ''}")
+
+            # successive halving: the best 1/eta carry on to the next budget. Trials that stopped early have
+            # plateaued, more epochs won't help, so they keep their score but don't get promoted.
+            ranked = sorted((results[trial_id] for trial_id in alive), key=lambda result: result["test_loss"])
+            keep = max(1, len(ranked) // eta)
+            alive = [result["trial_id"] for result in ranked[:keep] if not result["early_stopped"]]
+            if not alive:
+                break
+
+    return name, leaderboard.best(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel, resumable hyperparameter search for RelevanceModel.")
+    parser.add_argument("--name", help="search name, reuse it to resume. Defaults to a hash of the settings.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per worker")
+    parser.add_argument("--min-epochs", type=int, default=100)
+    parser.add_argument("--max-epochs", type=int, default=1000)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--patience", type=int, default=5)
+    parser.add_argument("--eval-every", type=int, default=25)
+    parser.add_argument("--promote", action="store_true", help="make the best trial the model inference.py serves")
+    args = parser.parse_args()
+
+    name, best = run_search(name=args.name, output=args.output, workers=args.workers, threads=args.threads,
+                            min_epochs=args.min_epochs, max_epochs=args.max_epochs, eta=args.eta,
+                            patience=args.patience, eval_every=args.eval_every)
+    print(f"leaderboard for search {name}:")
+    for trial_id, config, epochs, test_loss, artifact_path in best:
+        print(f"  {test_loss:.5f}  {config}  {epochs} epochs  {artifact_path}")
+
+    if args.promote and best:
+        trial_id, config, _, _, artifact_path = best[0]
+        config = json.loads(config)
+        shutil.copyfile(artifact_path, WEIGHTS_PATH)
+        # the layer sizes live in inference_artifacts.json, they have to match the promoted weights
+        write_artifacts(neurons_per_layer=config["neurons_per_layer"], num_layers=config["num_layers"])
+        print("promoted", trial_id, "to", WEIGHTS_PATH)
+
+
+if __name__ == "__main__":
+    main()
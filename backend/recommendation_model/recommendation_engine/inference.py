@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+
+from .artifacts import ARTIFACTS_PATH, WEIGHTS_PATH
+
+# Recommendation inference for the web workers.
+# nothing happens at import time: the first recommend() call in a process loads the weights and the fitted
+# scaler/encoder/catalog (see artifacts.py) once, every call after that reuses them. torch itself is only
+# imported on that first call too, so importing this module is free.
+#
+#   from recommendation_model.recommendation_engine.inference import recommend
+#   recommend("Chest", sleep_score=85, feeling=4)  ->  [("Push Ups", 0.93), ...]
+#   recommend_batch([("Chest", 85, 4), ("Leg", 60, 2)])  ->  one list like the above per request
+
+
+class Recommender:
+    def __init__(self, artifacts, model, torch):
+        self.torch = torch
+        self.model = model
+        self.muscle_codes = {name: code for code, name in enumerate(artifacts["muscle_classes"])}
+
+        # MinMaxScaler is just x * scale + offset per feature, so it's precomputed once as two tensors
+        # instead of calling scaler.transform for every candidate.
+        # (a feature that never varied gets a range of 1 instead of dividing by 0, same as sklearn)
+        scaler = artifacts["scaler"]
+        ranges = [(high - low) or 1.0 for low, high in zip(scaler["data_min"], scaler["data_max"])]
+        self.scale = torch.tensor([1 / spread for spread in ranges], dtype=torch.float32)
+        self.offset = torch.tensor([-low / spread for low, spread in zip(scaler["data_min"], ranges)], dtype=torch.float32)
+
+        # per muscle group, the candidate exercises and their feature rows with muscle and difficulty already
+        # scaled. Sleep and feeling (columns 1 and 2) change per request, they get filled in by features().
+        self.names = {}
+        self.candidates = {}
+        for muscle, exercises in self.group_catalog(artifacts["catalog"]).items():
+            code = self.muscle_codes.get(muscle)
+            if code is None:
+                continue # the model was never trained on this group
+            rows = torch.tensor([[code, 0, 0, difficulty] for _, difficulty in exercises], dtype=torch.float32)
+            self.names[muscle] = [name for name, _ in exercises]
+            self.candidates[muscle] = rows * self.scale + self.offset
+
+    @staticmethod
+    def group_catalog(catalog):
+        groups = {} # muscle group -> [(exercise name, difficulty), ...]
+        for exercise in catalog:
+            groups.setdefault(exercise["muscle"], []).append((exercise["name"], exercise["difficulty"]))
+        return groups
+
+    @classmethod
+    def load(cls, artifacts_path=ARTIFACTS_PATH, model_path=None, threads=None):
+        # model_path is either the eager state dict (workout_model.pth) or a TorchScript file from export.py,
+        # picked with RECOMMENDER_MODEL_PATH. RECOMMENDER_THREADS caps torch's intra-op threads: the model is
+        # tiny, so splitting one forward pass across cores costs more than it saves and just fights the other workers.
+        import torch
+        from .relevance_model import RelevanceModel
+
+        model_path = model_path or os.environ.get("RECOMMENDER_MODEL_PATH", WEIGHTS_PATH)
+        torch.set_num_threads(threads or int(os.environ.get("RECOMMENDER_THREADS", 1)))
+
+        with open(artifacts_path) as f:
+            artifacts = json.load(f)
+        if model_path.endswith(".ts"):
+            model = torch.jit.load(model_path, map_location="cpu") # weights (and int8 layers) are inside the file
+        else:
+            model = RelevanceModel(**artifacts["model"])
+            model.load_state_dict(torch.load(model_path, map_location="cpu", weights_only=True))
+        model.eval()
+        return cls(artifacts, model, torch)
+
+    def features(self, muscle_group, sleep_score, feeling):
+        if muscle_group not in self.muscle_codes:
+            raise ValueError(f"Unknown muscle group: {muscle_group}")
+        rows = self.candidates.get(muscle_group)
+        if rows is None:
+            return self.torch.empty((0, len(self.scale)))
+        rows = rows.clone()
+        rows[:, 1] = sleep_score * self.scale[1] + self.offset[1]
+        rows[:, 2] = feeling * self.scale[2] + self.offset[2]
+        return rows
+
+    def score(self, features):
+        # one forward pass for every row. The model is only read from here, never changed,
+        # so threads can share it without a lock.
+        with self.torch.inference_mode():
+            return self.model(features).squeeze(1)
+
+    def top(self, muscle_group, scores, top_n):
+        # best first. Candidates with the same score (same difficulty, so the same features) stay in catalog order:
+        # a stable sort, where topk breaks ties however it likes, and not the same way for a batch as for one request.
+        indices = self.torch.argsort(scores, descending=True, stable=True)[:top_n]
+        names = self.names[muscle_group]
+        return [(names[index], value) for index, value in zip(indices.tolist(), scores[indices].tolist())]
+
+    def recommend(self, muscle_group, sleep_score, feeling, top_n=3):
+        return self.top(muscle_group, self.score(self.features(muscle_group, sleep_score, feeling)), top_n)
+
+    def recommend_batch(self, requests, top_n=3):
+        # requests is a list of (muscle_group, sleep_score, feeling). Every candidate of every request
+        # goes through the model in a single forward pass, then the scores are split back up per request.
+        if not requests:
+            return []
+        features = [self.features(*request) for request in requests]
+        scores = self.score(self.torch.cat(features)).split([len(rows) for rows in features])
+        return [self.top(request[0], request_scores, top_n) for request, request_scores in zip(requests, scores)]
+
+
+_recommender = None
+_recommender_lock = threading.Lock()
+load_seconds = None # how long the first load took in this process, for the benchmark
+
+
+def get_recommender():
+    global _recommender, load_seconds
+    recommender = _recommender
+    if recommender is not None:
+        return recommender
+    with _recommender_lock:
+        if _recommender is None: # another thread might have loaded it while we waited
+            started = time.perf_counter()
+            _recommender = Recommender.load()
+            load_seconds = time.perf_counter() - started
+        return _recommender
+
+
+def recommend(muscle_group, sleep_score, feeling, top_n=3):
+    return get_recommender().recommend(muscle_group, sleep_score, feeling, top_n)
+
+
+def recommend_batch(requests, top_n=3):
+    return get_recommender().recommend_batch(requests, top_n)
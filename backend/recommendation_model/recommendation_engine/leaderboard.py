@@ -0,0 +1,53 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+# the driver side bookkeeping of the hyperparameter search (grid_search_model.py): the epoch budget of every
+# rung, trial ids, and the sqlite leaderboard the search resumes from. No torch in here, so the leaderboard
+# can be read (and this tested) without it.
+
+
+class Leaderboard:
+    # one row per trial per rung. Only the driver process writes to it.
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS trials (
+                search TEXT, trial_id TEXT, rung INTEGER, config TEXT, epochs INTEGER, test_loss REAL,
+                best_epoch INTEGER, early_stopped INTEGER, artifact_path TEXT, seconds REAL, finished_at REAL,
+                PRIMARY KEY (search, trial_id, rung)
+            )""")
+        self.db.commit()
+
+    def finished(self, search, rung):
+        rows = self.db.execute(
+            "SELECT trial_id, epochs, test_loss, best_epoch, early_stopped, artifact_path, seconds FROM trials "
+            "WHERE search = ? AND rung = ?", (search, rung))
+        keys = ["trial_id", "epochs", "test_loss", "best_epoch", "early_stopped", "artifact_path", "seconds"]
+        return {row[0]: dict(zip(keys, row)) for row in rows}
+
+    def record(self, search, rung, config, result):
+        self.db.execute(
+            "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (search, result["trial_id"], rung, json.dumps(config), result["epochs"], result["test_loss"],
+             result["best_epoch"], int(result["early_stopped"]), result["artifact_path"], result["seconds"], time.time()))
+        self.db.commit() # commit every trial, a crash loses at most the ones still running
+
+    def best(self, search, limit=10):
+        return self.db.execute(
+            "SELECT trial_id, config, MAX(epochs), MIN(test_loss), artifact_path FROM trials WHERE search = ? "
+            "GROUP BY trial_id ORDER BY MIN(test_loss) LIMIT ?", (search, limit)).fetchall()
+
+
+def trial_id_for(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def rung_budgets(min_epochs, max_epochs, eta):
+    budgets = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        budgets.append(epochs)
+        epochs *= eta
+    return budgets + [max_epochs]
@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+# Precomputed recommendations, so the web process doesn't need torch at all.
+# the model only has 4 inputs and all of them are discrete: muscle group (a handful of labels), sleep score (0-100),
+# feeling (1-5) and the difficulty of each candidate exercise. So build_lookup.py runs the model over every
+# (muscle, sleep, feeling) combination once and stores the top exercises for each. Serving a recommendation
+# is then one index into two arrays:
+#   lookup_indices.npy  int16   [muscle, sleep, feeling, rank] -> position in that muscle's exercise list (-1 = none)
+#   lookup_scores.npy   float32 [muscle, sleep, feeling, rank] -> relevance score
+#   lookup_meta.json            muscle order, exercise names per muscle, grid bounds
+# the arrays are memory mapped, so every worker on the machine shares the same pages instead of its own copy.
+
+ENGINE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SLEEP_SCORES = range(0, 101)
+FEELINGS = range(1, 6)
+
+
+class LookupTable:
+    def __init__(self, meta, indices, scores):
+        self.muscle_positions = {muscle: position for position, muscle in enumerate(meta["muscles"])}
+        self.names = meta["names"]
+        self.sleep_min, self.sleep_max = meta["sleep"]
+        self.feeling_min, self.feeling_max = meta["feeling"]
+        self.indices = indices
+        self.scores = scores
+
+    @classmethod
+    def load(cls, directory=ENGINE_DIR):
+        with open(os.path.join(directory, "lookup_meta.json")) as f:
+            meta = json.load(f)
+        indices = np.load(os.path.join(directory, "lookup_indices.npy"), mmap_mode="r")
+        scores = np.load(os.path.join(directory, "lookup_scores.npy"), mmap_mode="r")
+        return cls(meta, indices, scores)
+
+    @property
+    def top_n(self):
+        return self.indices.shape[-1]
+
+    def recommend(self, muscle_group, sleep_score, feeling, top_n=3):
+        if muscle_group not in self.muscle_positions:
+            raise ValueError(f"Unknown muscle group: {muscle_group}")
+        if not self.sleep_min <= sleep_score <= self.sleep_max:
+            raise ValueError(f"sleep_score has to be between {self.sleep_min} and {self.sleep_max}")
+        if not self.feeling_min <= feeling <= self.feeling_max:
+            raise ValueError(f"feeling has to be between {self.feeling_min} and {self.feeling_max}")
+
+        position = self.muscle_positions[muscle_group]
+        cell = (position, sleep_score - self.sleep_min, feeling - self.feeling_min)
+        names = self.names[muscle_group]
+        indices = self.indices[cell][:top_n].tolist()
+        scores = self.scores[cell][:top_n].tolist()
+        return [(names[index], score) for index, score in zip(indices, scores) if index >= 0]
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_table():
+    global _table
+    table = _table
+    if table is not None:
+        return table
+    with _table_lock:
+        if _table is None:
+            _table = LookupTable.load()
+        return _table
+
+
+def recommend(muscle_group, sleep_score, feeling, top_n=3):
+    return get_table().recommend(muscle_group, sleep_score, feeling, top_n)
@@ -0,0 +1,22 @@
+import torch.nn as nn
+
+# the network model.py trains and inference.py loads. Kept in its own file so loading the weights
+# doesn't mean importing (and running) the training script.
+# defaults are the best parameters from the grid search, which is what workout_model.pth was trained with.
+
+
+class RelevanceModel(nn.Module):
+    def __init__(self, in_features=4, neurons_per_layer=16, num_layers=4):
+        super().__init__()
+        self.layers = nn.ModuleList()
+        self.layers.append(nn.Linear(in_features=in_features, out_features=neurons_per_layer))
+        for _ in range(num_layers - 1):
+            self.layers.append(nn.Linear(in_features=neurons_per_layer, out_features=neurons_per_layer))
+        self.layers.append(nn.Linear(in_features=neurons_per_layer, out_features=1))
+        self.relu = nn.ReLU()
+
+    def forward(self, x):
+        for layer in self.layers[:-1]:
+            x = self.relu(layer(x))
+        x = self.layers[-1](x)
+        return x
@@ -1,3 +1,356 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from sklearn.preprocessing import LabelEncoder
+
+from exercise.models import Exercise, Tag
+from recommendation_model.extraction import GAP_TIMEOUT, extract_training_data
+from recommendation_model.recommendation_engine import artifacts, dataset
+from recommendation_model.recommendation_engine.inference import Recommender
+from recommendation_model.recommendation_engine.leaderboard import Leaderboard, rung_budgets, trial_id_for
+from recommendation_model.recommendation_engine.dataset import load_dataset, read_extraction_state
+from user.models import User
+from workout.models import WorkoutExercise, WorkoutSession
+
+try:
+    import torch
+except ImportError: # the inference tests need it, the rest doesn't
+    torch = None
+
+
+class ExtractTrainingDataTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.export_dir = os.path.join(tmp.name, "exports")
+        self.cache_dir = os.path.join(tmp.name, "cache")
+
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.bench = Exercise.objects.create(name="Bench Press", difficulty=7)
+        self.bench.tags.add(Tag.objects.create(name="Chest"))
+
+    def log_session(self, weights, sleep_score=80, feeling=4, date=None):
+        workout = WorkoutSession.objects.create(user=self.user, name="Push", sleep_score=sleep_score, feeling=feeling,
+                                                date=date or datetime.date(2025, 5, 1))
+        for weight in weights:
+            WorkoutExercise.objects.create(workout=workout, exercise=self.bench, reps=5, weight=weight)
+        return workout
+
+    def extract(self, **kwargs):
+        return extract_training_data(export_dir=self.export_dir, cache_dir=self.cache_dir, chunk_size=2, **kwargs)
+
+    def read(self, path):
+        with open(path, newline="") as f:
+            return list(csv.reader(f))
+
+    def test_exports_one_row_per_session_exercise(self):
+        self.log_session([200], sleep_score=None) # no sleep score, not usable, but it's still their best so far
+        self.log_session([100, 150]) # best set is 150 of 200
+
+        path, rows = self.extract()
+
+        self.assertEqual(rows, 1)
+        self.assertEqual(self.read(path), [["Chest", "80", "4", "Bench Press", "7", "75"]])
+
+    def test_relevance_only_compares_with_earlier_sessions(self):
+        # the 200 came later, the first session was their best at the time. Dates count, not the order they were logged.
+        self.log_session([150], date=datetime.date(2025, 5, 10))
+        self.log_session([100], date=datetime.date(2025, 5, 1))
+        self.log_session([200], date=datetime.date(2025, 5, 20))
+        self.log_session([50], date=datetime.date(2025, 5, 20)) # same day, later session
+
+        path, _ = self.extract()
+
+        self.assertEqual([row[5] for row in self.read(path)], ["100", "100", "100", "25"])
+
+    def test_only_new_sessions_are_read(self):
+        self.log_session([100])
+        first_path, _ = self.extract()
+        self.assertEqual(self.extract(), (None, 0)) # nothing new
+
+        last = self.log_session([200], sleep_score=30)
+        second_path, rows = self.extract()
+
+        self.assertEqual(rows, 1)
+        self.assertEqual(self.read(second_path), [["Chest", "30", "4", "Bench Press", "7", "100"]])
+        state = read_extraction_state(self.export_dir)
+        self.assertEqual(state["watermark"], last.id)
+
+        # both exports end up in the training data
+        paths = [os.path.join(self.export_dir, name) for name in state["exports"]]
+        self.assertEqual(paths, [first_path, second_path])
+        X, y = load_dataset(paths, cache_dir=self.cache_dir).training_arrays()
+        self.assertEqual(y.tolist(), [100.0, 100.0])
+
+    def test_sessions_committed_late_are_picked_up(self):
+        # a session saved in a transaction that commits after the extraction read past its id
+        self.log_session([100])
+        self.extract() # gaps only count above an earlier watermark
+        self.log_session([100])
+        late = self.log_session([150])
+        last = self.log_session([50])
+        WorkoutExercise.objects.filter(workout=late).delete()
+        late_id = late.id
+        late.delete()
+
+        _, rows = self.extract()
+        self.assertEqual(rows, 2)
+        self.assertEqual(read_extraction_state(self.export_dir)["gaps"], {str(late_id): mock.ANY})
+
+        late = self.log_session([150])
+        WorkoutSession.objects.filter(id=late.id).update(id=late_id) # now it's committed, with its original id
+        WorkoutExercise.objects.filter(workout_id=late.id).update(workout_id=late_id)
+
+        path, rows = self.extract()
+        self.assertEqual((rows, self.read(path)), (1, [["Chest", "80", "4", "Bench Press", "7", "100"]]))
+        state = read_extraction_state(self.export_dir)
+        self.assertEqual((state["watermark"], state["gaps"]), (last.id, {}))
+        self.assertEqual(self.extract(), (None, 0))
+
+    def test_gaps_that_stay_empty_are_forgotten(self):
+        self.log_session([100])
+        self.extract()
+        deleted = self.log_session([100])
+        deleted_id = deleted.id
+        deleted.delete()
+        self.log_session([100])
+        self.extract()
+        self.assertEqual(list(read_extraction_state(self.export_dir)["gaps"]), [str(deleted_id)])
+
+        with mock.patch("recommendation_model.extraction.time.time", return_value=time.time() + GAP_TIMEOUT):
+            self.assertEqual(self.extract(), (None, 0))
+        self.assertEqual(read_extraction_state(self.export_dir)["gaps"], {})
+
+    def test_first_run_has_no_gaps_and_gaps_are_capped(self):
+        self.log_session([100]).delete() # ids before the first session are nothing to wait for
+        first = self.log_session([100])
+        self.extract()
+        self.assertEqual(read_extraction_state(self.export_dir)["gaps"], {})
+
+        deleted_ids = []
+        for _ in range(3):
+            session = self.log_session([100])
+            deleted_ids.append(session.id)
+            session.delete()
+        self.log_session([100])
+        with mock.patch("recommendation_model.extraction.MAX_GAPS", 2):
+            self.extract()
+        self.assertEqual(list(read_extraction_state(self.export_dir)["gaps"]), [str(i) for i in deleted_ids[1:]]) # the newest
+        self.assertGreater(deleted_ids[0], first.id)
+
+    def test_full_extraction_replaces_old_exports(self):
+        self.log_session([100])
+        first_path, _ = self.extract()
+        self.log_session([200])
+
+        path, rows = self.extract(full=True)
+
+        self.assertEqual(rows, 2)
+        self.assertFalse(os.path.exists(first_path))
+        self.assertEqual(read_extraction_state(self.export_dir)["exports"], [os.path.basename(path)])
+
+    def test_failed_full_extraction_keeps_old_exports(self):
+        self.log_session([100])
+        first_path, _ = self.extract()
+        self.log_session([200])
+
+        with mock.patch("recommendation_model.extraction.cache_file", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.extract(full=True)
+
+        self.assertTrue(os.path.exists(first_path))
+        self.assertEqual(read_extraction_state(self.export_dir)["exports"], [os.path.basename(first_path)])
+
+
+class DatasetTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.cache_dir = os.path.join(tmp.name, "cache")
+
+    def write_csv(self, name, rows):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", newline="") as f:
+            csv.writer(f).writerows(rows)
+        return path
+
+    def test_codes_match_label_encoder(self):
+        # the model was trained on LabelEncoder codes, the cache has to give the same ones
+        with open(dataset.DEFAULT_SOURCES[0], newline="") as f:
+            rows = [row for row in csv.reader(f) if len(row) == len(dataset.COLUMNS)]
+        data = load_dataset(dataset.DEFAULT_SOURCES, cache_dir=self.cache_dir)
+
+        for position, (name, kind) in enumerate(dataset.COLUMNS):
+            if kind != "category":
+                continue
+            encoder = LabelEncoder().fit([row[position] for row in rows])
+            self.assertEqual(data.vocabularies[name], encoder.classes_.tolist())
+            self.assertEqual(data.column(name).tolist(), encoder.transform([row[position] for row in rows]).tolist())
+
+    def test_files_with_different_vocabularies(self):
+        first = self.write_csv("first.csv", [["Legs", 80, 4, "Squat", 8, 90], ["Chest", 70, 3, "Bench Press", 7, 60]])
+        second = self.write_csv("second.csv", [["Back", 60, 2, "Row", 5, 40], ["Legs", 90, 5, "Lunge", 4, "oops"]])
+
+        data = load_dataset([first, second], cache_dir=self.cache_dir)
+
+        self.assertEqual(len(data), 4)
+        self.assertEqual(data.vocabularies["muscle"], ["Back", "Chest", "Legs"])
+        self.assertEqual(data.column("muscle").tolist(), [2, 1, 0, 2]) # each file's codes moved into the shared ones
+        self.assertEqual(data.column("workout_name").tolist(), [3, 0, 2, 1])
+        X, y = data.training_arrays()
+        self.assertEqual(y.tolist(), [90, 60, 40]) # the row whose label didn't parse is dropped
+        self.assertEqual(X[2].tolist(), [0, 60, 2, 5])
+
+    def test_builders_of_the_same_cache_at_once(self):
+        # like the search's workers on a fresh checkout, all parsing the same csv
+        path = self.write_csv("data.csv", [["Legs", 80, 4, "Squat", 8, 90]] * 1000)
+        directory = os.path.join(self.cache_dir, dataset.file_hash(path))
+        os.makedirs(self.cache_dir)
+        errors = []
+
+        def build():
+            try:
+                dataset.build_cache(path, directory, chunk_rows=10)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=build) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.cache_dir), [os.path.basename(directory)]) # no temp dirs left behind
+        self.assertEqual(len(load_dataset([path], cache_dir=self.cache_dir)), 1000)
+
+    def test_unchanged_file_is_not_parsed_again(self):
+        path = self.write_csv("data.csv", [["Legs", 80, 4, "Squat", 8, 90]])
+        load_dataset([path], cache_dir=self.cache_dir)
+
+        with mock.patch.object(dataset, "build_cache", wraps=dataset.build_cache) as build_cache:
+            self.assertEqual(len(load_dataset([path], cache_dir=self.cache_dir)), 1)
+            build_cache.assert_not_called()
+
+            self.write_csv("data.csv", [["Legs", 80, 4, "Squat", 8, 90], ["Legs", 70, 4, "Squat", 8, 80]])
+            self.assertEqual(len(load_dataset([path], cache_dir=self.cache_dir)), 2)
+            build_cache.assert_called_once()
+
+
+class InferenceTests(SimpleTestCase):
+    def test_artifacts_match_the_training_data(self):
+        # runs without torch. If this fails, inference_artifacts.json is out of date: python artifacts.py
+        with open(artifacts.ARTIFACTS_PATH) as f:
+            committed = json.load(f)
+        self.assertEqual(artifacts.build_artifacts(training_paths=dataset.DEFAULT_SOURCES), committed)
+
+    @skipUnless(torch, "needs torch")
+    def test_recommend(self):
+        recommender = Recommender.load(model_path=artifacts.WEIGHTS_PATH)
+        with open(artifacts.ARTIFACTS_PATH) as f:
+            chest = [exercise["name"] for exercise in json.load(f)["catalog"] if exercise["muscle"] == "Chest"]
+
+        results = recommender.recommend("Chest", sleep_score=85, feeling=4)
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(name in chest for name, _ in results))
+        scores = [score for _, score in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(len(recommender.recommend("Chest", 85, 4, top_n=100)), len(chest))
+        with self.assertRaises(ValueError):
+            recommender.recommend("Elbows", 85, 4)
+
+    @skipUnless(torch, "needs torch")
+    def test_recommend_batch_matches_one_at_a_time(self):
+        recommender = Recommender.load(model_path=artifacts.WEIGHTS_PATH)
+        requests = [("Chest", 85, 4), ("Leg", 40, 1), ("Chest", 60, 2), ("Arm", 100, 5)]
+
+        batched = recommender.recommend_batch(requests, top_n=2)
+
+        self.assertEqual(len(batched), len(requests))
+        for request, results in zip(requests, batched):
+            expected = recommender.recommend(*request, top_n=2)
+            self.assertEqual([name for name, _ in results], [name for name, _ in expected])
+            for (_, score), (_, expected_score) in zip(results, expected):
+                self.assertAlmostEqual(score, expected_score, places=5)
+        self.assertEqual(recommender.recommend_batch([]), [])
+
+    @skipUnless(torch, "needs torch")
+    def test_ties_keep_catalog_order(self):
+        recommender = Recommender.load(model_path=artifacts.WEIGHTS_PATH)
+        names = recommender.names["Chest"]
+        scores = torch.zeros(len(names))
+        scores[-1] = 1.0
+
+        self.assertEqual(recommender.top("Chest", scores, top_n=100), [(names[-1], 1.0)] + [(name, 0.0) for name in names[:-1]])
+        self.assertEqual(recommender.top("Chest", scores[:0], top_n=3), [])
+
+    @skipUnless(torch, "needs torch")
+    def test_exported_models_load_from_recommender_model_path(self):
+        from recommendation_model.recommendation_engine.export import export_model
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        eager = Recommender.load(model_path=artifacts.WEIGHTS_PATH)
+        features = eager.features("Chest", 85, 4)
+
+        for int8, tolerance in [(False, 1e-5), (True, 0.05)]: # int8 only has to be close
+            path = export_model(int8=int8, output_path=os.path.join(tmp.name, f"model_{int8}.ts"))
+            with mock.patch.dict(os.environ, {"RECOMMENDER_MODEL_PATH": path}):
+                recommender = Recommender.load()
+
+            self.assertIsInstance(recommender.model, torch.jit.ScriptModule)
+            torch.testing.assert_close(recommender.score(features), eager.score(features), atol=tolerance, rtol=0)
+
+        # exporting while RECOMMENDER_MODEL_PATH points at the int8 export still starts from the trained weights
+        with mock.patch.dict(os.environ, {"RECOMMENDER_MODEL_PATH": path}):
+            again = export_model(output_path=os.path.join(tmp.name, "again.ts"))
+        torch.testing.assert_close(Recommender.load(model_path=again).score(features), eager.score(features), atol=1e-5, rtol=0)
+
+
+class SearchBookkeepingTests(SimpleTestCase):
+    def test_rung_budgets(self):
+        self.assertEqual(rung_budgets(100, 1000, 3), [100, 300, 900, 1000])
+        self.assertEqual(rung_budgets(100, 900, 3), [100, 300, 900])
+        self.assertEqual(rung_budgets(100, 100, 3), [100])
+        self.assertEqual(rung_budgets(500, 100, 3), [100]) # min over max just trains to max
+
+    def test_trial_id_ignores_key_order(self):
+        self.assertEqual(trial_id_for({"learning_rate": 0.01, "num_layers": 2}), trial_id_for({"num_layers": 2, "learning_rate": 0.01}))
+        self.assertNotEqual(trial_id_for({"num_layers": 2}), trial_id_for({"num_layers": 3}))
+
+    def test_leaderboard_resumes_and_ranks(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "leaderboard.sqlite3")
+
+        def result(trial_id, epochs, test_loss, early_stopped=False):
+            return {"trial_id": trial_id, "epochs": epochs, "test_loss": test_loss, "best_epoch": epochs,
+                    "early_stopped": early_stopped, "artifact_path": f"{trial_id}.pth", "seconds": 1.0}
+
+        leaderboard = Leaderboard(path)
+        leaderboard.record("search", 0, {"num_layers": 2}, result("a", 100, 0.5))
+        leaderboard.record("search", 0, {"num_layers": 3}, result("b", 100, 0.3, early_stopped=True))
+        leaderboard.record("search", 1, {"num_layers": 2}, result("a", 300, 0.2))
+        leaderboard.record("search", 1, {"num_layers": 2}, result("a", 300, 0.1)) # rerun of the same rung replaces it
+        leaderboard.record("other", 0, {"num_layers": 4}, result("c", 100, 0.01))
+        leaderboard.db.close()
+
+        reopened = Leaderboard(path)
+        self.addCleanup(reopened.db.close)
+        finished = reopened.finished("search", 0)
+        self.assertEqual(set(finished), {"a", "b"})
+        self.assertEqual(finished["b"]["early_stopped"], 1)
+        self.assertEqual(reopened.finished("search", 2), {})
+        self.assertEqual(reopened.best("search"), [
+            ("a", '{"num_layers": 2}', 300, 0.1, "a.pth"),
+            ("b", '{"num_layers": 3}', 100, 0.3, "b.pth"),
+        ])
@@ -0,0 +1,35 @@
+import copy
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from main.ttl_cache import TTLCache
+
+# token key -> (user, token). Kept for a short time so repeat requests skip the Token + User query.
+# user/signals.py drops entries when a token is deleted (logout, rotation) or the user is saved (deactivated, edited).
+# other processes don't see those signals, TOKEN_AUTH_CACHE_TTL is how long they can lag behind.
+token_cache = TTLCache(maxsize=settings.TOKEN_AUTH_CACHE_SIZE, ttl=settings.TOKEN_AUTH_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # drop-in replacement for DRF's TokenAuthentication, same "Authorization: Token <key>" header.
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            # a bad key or inactive user raises AuthenticationFailed in here, so only good tokens get cached.
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = cached
+        # every request gets its own copy of the user, so a view changing request.user can't leak into other requests.
+        return copy.copy(user), token
+
+
+def forget_token(key):
+    token_cache.pop(key)
+
+
+def forget_user(user_id):
+    for key, (user, token) in token_cache.items():
+        if user.pk == user_id:
+            token_cache.pop(key)
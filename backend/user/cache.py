@@ -0,0 +1,69 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from main.shared_cache import version_timeout
+
+# Per user response cache.
+# every user has a data version number stored in the cache. Cached responses have the version in their key,
+# so bumping the version (when the user logs a workout, a weigh in, or edits their profile) makes all of their
+# old cached responses unreachable at once, without having to know which keys to delete. The old entries just expire.
+
+
+def get_version_key(user_id):
+    return f"user:{user_id}:data-version"
+
+
+def new_version():
+    # if the version key gets evicted we start again from the current time instead of 1,
+    # so we never land back on a version that old responses are still cached under.
+    return time.time_ns() // 1000
+
+
+def get_data_version(user_id):
+    key = get_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # add() doesn't overwrite if another request beat us to it.
+        # the timeout is only set with an in-process cache, see main/shared_cache.py
+        cache.add(key, new_version(), timeout=version_timeout())
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(user_id):
+    try:
+        cache.incr(get_version_key(user_id))
+    except ValueError: # incr raises if the key isnt there, nothing cached for this user anyway.
+        get_data_version(user_id)
+
+
+def invalidate_users(user_ids):
+    # for bulk jobs (backfills, recomputes). Deleting the version keys is one cache call for the whole batch,
+    # and the next read for each user starts a fresh version.
+    cache.delete_many([get_version_key(user_id) for user_id in user_ids])
+
+
+class UserResponseCacheMixin:
+    # for GET views that only return the requesting users own data.
+    # the serialized response is stored under the users current data version plus the full path, so query params
+    # like ?recent=5 or a pagination cursor get their own entry.
+
+    def get_response_cache_key(self, request):
+        user_id = request.user.pk
+        path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+        return f"user:{user_id}:v{get_data_version(user_id)}:{type(self).__name__}:{path}"
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=settings.USER_RESPONSE_CACHE_TIMEOUT)
+        return response
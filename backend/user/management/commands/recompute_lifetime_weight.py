@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db.models import DecimalField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from user.cache import invalidate_users
+from user.models import User
+from workout.models import WorkoutExercise
+from workout.rollups import SET_VOLUME
+
+
+class Command(BaseCommand):
+    help = "Recomputes User.lifetime_weight_lifted from every logged set."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="How many users to load and update at a time.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        user_ids = User.objects.order_by('id').values_list('id', flat=True)
+
+        chunk = []
+        updated = 0
+        # iterator() streams ids from the database instead of loading the whole table,
+        # and each chunk costs one UPDATE.
+        for user_id in user_ids.iterator(chunk_size=chunk_size):
+            chunk.append(user_id)
+            if len(chunk) == chunk_size:
+                updated += self.recompute(chunk)
+                chunk = []
+        if chunk:
+            updated += self.recompute(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Recomputed lifetime weight lifted for {updated} users."))
+
+    def recompute(self, user_ids):
+        total = (
+            WorkoutExercise.objects
+            .filter(workout__user_id=OuterRef('pk'))
+            .values('workout__user_id')
+            .annotate(total=Sum(SET_VOLUME))
+            .order_by()
+            .values('total')
+        )
+        # the sum is computed inside the UPDATE. Reading totals first and bulk_update-ing them later
+        # overwrote the F() increment of any workout saved in between.
+        output_field = DecimalField(max_digits=14, decimal_places=2)
+        updated = User.objects.filter(id__in=user_ids).update(
+            lifetime_weight_lifted=Coalesce(Subquery(total, output_field=output_field), 0, output_field=output_field),
+        )
+        invalidate_users(user_ids)
+        return updated
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_alter_weightentry_date_recorded'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='weightentry',
+            index=models.Index(fields=['user', '-date_recorded'], name='weightentry_user_date_idx'),
+        ),
+    ]
@@ -22,6 +22,9 @@ class WeightEntry(models.Model):
 
     class Meta:
         ordering = ['-date_recorded']
+        indexes = [
+            models.Index(fields=['user', '-date_recorded'], name='weightentry_user_date_idx'), # weight history and ?latest=true
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.weight} lbs on {self.date_recorded.strftime('%Y-%m-%d')}"
@@ -0,0 +1,93 @@
+import base64
+import json
+from datetime import date
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class WorkoutHistoryPagination(BasePagination):
+    # keyset (a.k.a. seek) pagination over WorkoutSession, newest first, ordered by (date, id).
+    # Instead of OFFSET, which makes the database walk over every row it skips, the cursor
+    # remembers the (date, id) of the last workout on the page and the next page starts right after it.
+    # That way page 1 and page 500 cost the same.
+    # the cursor is base64 encoded so the frontend treats it as an opaque token and just sends it back.
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    # workouts without a date sort after all the dated ones. workout_user_date_idx is declared in this order.
+    ordering = (F('date').desc(nulls_last=True), F('id').desc())
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            cursor_date, cursor_id = cursor
+            if cursor_date is None:
+                queryset = queryset.filter(date__isnull=True, id__lt=cursor_id)
+            else:
+                queryset = queryset.filter(
+                    Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id) | Q(date__isnull=True)
+                )
+
+        # grab one extra row so we know if there is another page without running a count query.
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.last_item = results[-1] if results else None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            cursor_date = date.fromisoformat(position['d']) if position['d'] is not None else None
+            return cursor_date, int(position['i'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, workout):
+        position = {'d': workout.date.isoformat() if workout.date else None, 'i': workout.id}
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.last_item)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -1,12 +1,17 @@
 
 from user.models import User, WeightEntry
-from workout.models import WorkoutSession, WorkoutExercise
+from workout.models import WorkoutSession, WorkoutExercise, WorkoutVolumeRollup
+from workout.rollups import add_workout_to_rollups, get_total_volume
 from exercise.models import Exercise, Tag, ExerciseRecord
-from django.db.models import F
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Prefetch, Value, When, Window, prefetch_related_objects
+from django.db.models.functions import Greatest, RowNumber
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from django.utils import timezone
 from exercise.serializers import ExerciseSerializer
+from exercise.signals import catalog_changed
+from main.metrics import TimedListSerializer, TimedSerializerMixin
 
 
 # for get requests, the view queries a certain object from the database, and the serializer will turn that model into a dictionary, which DRF turns into JSON
@@ -66,79 +71,186 @@ class WorkoutSetSerializer(serializers.ModelSerializer):
         fields = ['id','exercise', 'reps', 'weight']
 
 
-class WorkoutReadSerializer(serializers.ModelSerializer):
+class WorkoutReadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     workout_sets = WorkoutSetSerializer(many=True)
 
     class Meta:
         model = WorkoutSession
         fields = ['id', 'name', 'date', 'workout_sets', 'elapsed_time', 'comment']
+        list_serializer_class = TimedListSerializer # times serializer.data for many=True too
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # loads the sets, their exercise and the exercise tags in 3 queries total, for however many workouts are in the queryset.
+        return queryset.prefetch_related(
+            Prefetch(
+                'workout_sets',
+                queryset=WorkoutExercise.objects.select_related('exercise').prefetch_related('exercise__tags'),
+            )
+        )
 
 
-class CreateWorkoutSerializer(serializers.ModelSerializer):
+class CreateWorkoutSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     workout_sets = WorkoutSetSerializer(many=True, required=False)
 
     class Meta:
         model = WorkoutSession
-        fields = ['id', 'name', 'date', 'workout_sets', 'elapsed_time', 'comment']
+        fields = ['id', 'name', 'date', 'workout_sets', 'elapsed_time', 'comment', 'sleep_score', 'feeling']
     
     def create(self, validated_data): # we need to override create because we are saving the workout at 
         # the very end of the users workout. but we need to do nested writes
         # i.e. we need to write WorkoutSets within the Workout creation. 
-        workout_sets_data = validated_data.pop('workout_sets')
-        print("Workout Sets Data:", workout_sets_data)
+        # everything is done in batches, a handful of queries for the whole workout instead of several per set,
+        # so saving a 30 set session costs about the same as saving a 3 set one.
+        workout_sets_data = validated_data.pop('workout_sets', [])
 
         user = self.context['request'].user # because were in serializers, we dont have access to request,
         # but views will send over context, and we can access it there.
-        workout = WorkoutSession.objects.create(user=user, **validated_data) # create main workout instance
-        print("Workout Created:", workout)
-        for set_data in workout_sets_data:
-            print("setdata:", set_data)
-
-            exercise_data = set_data.pop('exercise')
-            tags_data = exercise_data.pop('tags', [])
-            print("Exercise Data:", exercise_data, "Tags Data:", tags_data)
-
-            exercise, created = Exercise.objects.get_or_create(**exercise_data)
-            # the ** basically unpacks the dictionary, within we might have like 'name': 'bench press', and it just unpacks this.
-            # exercise will hold the object we found or created, while created is a boolean, True if we created a new object.
-
-            print(f"Exercise {'Created' if created else 'Retrieved'}:", exercise)
-            
-            for tag_data in tags_data:
-                print("tag data:", tag_data)
-                tag, created = Tag.objects.get_or_create(**tag_data)
-                print(f"Tag {'Created' if created else 'Retrieved'}:", tag)
-                exercise.tags.add(tag)
-            WorkoutExercise.objects.create(workout=workout,
-                                      exercise=exercise,
-                                      reps=set_data['reps'],
-                                      weight=set_data['weight'],
-                                      )
-            
-            record, created = ExerciseRecord.objects.get_or_create(
-                user=user,
-                exercise=exercise
-            )
 
-            # Update the lifetime reps safely to avoid race conditions
-            record.lifetime_reps = F('lifetime_reps') + set_data['reps']
-            
-            # Check for a new personal record
-            if set_data['weight'] > record.personal_record:
-                record.personal_record = set_data['weight']
-                record.date_of_pr = timezone.now().date()
-            
-            # Save the updated record
-            record.save()
-            
-        print("validated Data for workout,", validated_data)
-        
+        with transaction.atomic(): # either the whole workout gets saved or none of it does
+            workout = WorkoutSession.objects.create(user=user, **validated_data) # create main workout instance
 
-        return workout
+            exercises = self.get_or_create_exercises(workout_sets_data)
+
+            workout_sets = WorkoutExercise.objects.bulk_create([
+                WorkoutExercise(workout=workout,
+                                exercise=exercises[set_data['exercise']['name']],
+                                reps=set_data['reps'],
+                                weight=set_data.get('weight'),
+                                )
+                for set_data in workout_sets_data
+            ])
+
+            self.update_exercise_records(user, workout_sets)
 
+            add_workout_to_rollups(workout, workout_sets) # keeps the weekly/monthly volume chart data up to date
 
+            # F() so the database does the addition, two workouts saved at once can't overwrite each others total.
+            User.objects.filter(pk=user.pk).update(
+                lifetime_weight_lifted=F('lifetime_weight_lifted') + get_total_volume(workout_sets)
+            )
+
+        # the response shows the sets with their exercise and tags, load those in 3 queries instead of per set.
+        prefetch_related_objects(
+            [workout],
+            Prefetch('workout_sets', queryset=WorkoutExercise.objects.select_related('exercise').prefetch_related('exercise__tags')),
+        )
+        return workout
 
-class UserProfileSerializer(serializers.ModelSerializer):
+    def get_or_create_exercises(self, workout_sets_data):
+        # returns {exercise name: Exercise} for every exercise in the workout. Exercises and tags are matched by name
+        # like get_or_create would, the ones we dont have yet are created with one bulk insert each.
+        tag_names_by_exercise = {}
+        for set_data in workout_sets_data:
+            exercise_data = set_data['exercise']
+            tag_names = tag_names_by_exercise.setdefault(exercise_data['name'], set())
+            tag_names.update(tag_data['name'] for tag_data in exercise_data.get('tags', []))
+
+        exercises = get_or_create_by_name(Exercise, tag_names_by_exercise.keys())
+        all_tag_names = set().union(*tag_names_by_exercise.values())
+        tags = get_or_create_by_name(Tag, all_tag_names)
+
+        # link any exercise/tag pairs that arent linked yet, one query to find the existing ones, one to insert the rest.
+        ExerciseTag = Exercise.tags.through
+        wanted_links = {
+            (exercises[exercise_name].id, tags[tag_name].id)
+            for exercise_name, tag_names in tag_names_by_exercise.items()
+            for tag_name in tag_names
+        }
+        if wanted_links:
+            existing_links = set(
+                ExerciseTag.objects.filter(
+                    exercise_id__in={exercise_id for exercise_id, _ in wanted_links},
+                    tag_id__in={tag_id for _, tag_id in wanted_links},
+                ).values_list('exercise_id', 'tag_id')
+            )
+            new_links = wanted_links - existing_links
+            if new_links:
+                ExerciseTag.objects.bulk_create(
+                    [ExerciseTag(exercise_id=exercise_id, tag_id=tag_id) for exercise_id, tag_id in new_links],
+                    ignore_conflicts=True,
+                )
+                # bulk_create skips the m2m_changed signal, so tell the catalog ourselves
+                catalog_changed(exercise_ids={exercise_id for exercise_id, _ in new_links})
+        return exercises
+
+    def update_exercise_records(self, user, workout_sets):
+        # one update per exercise for the whole workout: add up the reps, and take the heaviest set as the new PR
+        # if it beats the old one. Exercises the user has never done before get their record in one bulk insert.
+        reps_by_exercise = {}
+        max_weight_by_exercise = {}
+        for workout_set in workout_sets:
+            exercise_id = workout_set.exercise_id
+            reps_by_exercise[exercise_id] = reps_by_exercise.get(exercise_id, 0) + workout_set.reps
+            if workout_set.weight is not None:
+                max_weight_by_exercise[exercise_id] = max(workout_set.weight, max_weight_by_exercise.get(exercise_id, workout_set.weight))
+
+        today = timezone.now().date()
+        new_records = []
+        for exercise_id, reps in reps_by_exercise.items():
+            max_weight = max_weight_by_exercise.get(exercise_id)
+            if not self.add_to_record(user, exercise_id, reps, max_weight, today):
+                new_pr = max_weight is not None and max_weight > 0
+                new_records.append(ExerciseRecord(
+                    user=user,
+                    exercise_id=exercise_id,
+                    lifetime_reps=reps,
+                    personal_record=max_weight if new_pr else 0,
+                    date_of_pr=today if new_pr else None,
+                ))
+        if not new_records:
+            return
+        try:
+            with transaction.atomic(): # savepoint, a conflict here mustn't roll back the whole workout
+                ExerciseRecord.objects.bulk_create(new_records)
+        except IntegrityError:
+            # another request created some of these records after our update found nothing (two first workouts
+            # with the same exercise saved at once). Those exist now, so they get the update; the rest get inserted.
+            for record in new_records:
+                max_weight = max_weight_by_exercise.get(record.exercise_id)
+                if not self.add_to_record(user, record.exercise_id, record.lifetime_reps, max_weight, today):
+                    record.save()
+
+    def add_to_record(self, user, exercise_id, reps, max_weight, today):
+        # adds a workout's reps and best weight to an existing record, False if the user has no record yet
+        # Update the lifetime reps safely to avoid race conditions
+        changes = {'lifetime_reps': F('lifetime_reps') + reps}
+        if max_weight is not None:
+            # Check for a new personal record, both sides are evaluated against the old personal_record
+            changes['date_of_pr'] = Case(When(personal_record__lt=max_weight, then=Value(today)), default=F('date_of_pr'))
+            changes['personal_record'] = Greatest('personal_record', Value(max_weight))
+        return ExerciseRecord.objects.filter(user=user, exercise_id=exercise_id).update(**changes) > 0
+
+
+class SyncWorkoutSerializer(CreateWorkoutSerializer):
+    # one workout from an offline sync batch. Same as CreateWorkoutSerializer but the device has to send
+    # the idempotency key it generated for the workout.
+    idempotency_key = serializers.CharField(max_length=64)
+
+    class Meta(CreateWorkoutSerializer.Meta):
+        fields = CreateWorkoutSerializer.Meta.fields + ['idempotency_key']
+
+
+def get_or_create_by_name(model, names):
+    # {name: object} for the given names, creating the missing ones with a single bulk insert.
+    # if there are duplicate names in the table we use the oldest one, same row get_or_create would have grabbed first.
+    objects_by_name = {}
+    for obj in model.objects.filter(name__in=names).order_by('id'):
+        objects_by_name.setdefault(obj.name, obj)
+
+    missing = [model(name=name) for name in names if name not in objects_by_name]
+    if missing:
+        created = model.objects.bulk_create(missing)
+        for obj in created:
+            objects_by_name[obj.name] = obj
+        # bulk_create doesnt send post_save. The ids tell the search index what to load.
+        ids = [obj.id for obj in created]
+        catalog_changed(**{'exercise_ids' if model is Exercise else 'tag_ids': ids})
+    return objects_by_name
+
+
+
+class UserProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'email', 'is_staff', 'date_joined', 
@@ -148,14 +260,21 @@ class basicUserProfileSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'first_name']
 
-class WeightEntrySerializer(serializers.ModelSerializer):
+class WeightEntrySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = WeightEntry
         fields = ['id', 'date_recorded', 'weight', 'user']
+        list_serializer_class = TimedListSerializer # times serializer.data for many=True too
         read_only_fields = ['id', 'date_recorded', 'user'] # both user and date_recorded not sent over the POST request
         # date_recorded has a default within the model, so it will just be automatically set to that default when the object is created.
 
-class UserDashboardSerializer(serializers.ModelSerializer):
+class VolumeRollupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = WorkoutVolumeRollup
+        fields = ['period', 'period_start', 'total_volume', 'set_count', 'session_count']
+        list_serializer_class = TimedListSerializer # times serializer.data for many=True too
+
+class UserDashboardSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # these 3 things right here, workout, 
     workouts = WorkoutReadSerializer(many=True) # not in the user model, so we need to add this here.
     favorite_exercises = ExerciseSerializer(many=True) # by default we would just get the keys to the exercise objects, so we would like to do a nested serialization.
@@ -165,5 +284,27 @@ class UserDashboardSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'workouts', 'favorite_exercises', 'weight_entries']
 
+    @staticmethod
+    def setup_eager_loading(queryset, recent=None):
+        # every nested serializer above would otherwise run its own query per object,
+        # (one for each workout's sets, one per set for the exercise, one per exercise for its tags...)
+        # so we load each level of the tree in a single query up front. The number of queries
+        # stays the same no matter how many workouts the user has logged.
+        # if recent is given, only the `recent` newest workouts get embedded, the rest of the history
+        # is available page by page from the workout history endpoint.
+        workouts = WorkoutReadSerializer.setup_eager_loading(WorkoutSession.objects.all())
+        if recent is not None:
+            # a prefetch queryset can't be sliced unless it uses to_attr, so we number each users workouts
+            # newest first with a window function and keep the first `recent` of them.
+            newest_first = [F('date').desc(nulls_last=True), F('id').desc()]
+            workouts = workouts.annotate(
+                recency=Window(RowNumber(), partition_by=F('user'), order_by=newest_first)
+            ).filter(recency__lte=recent).order_by(*newest_first)
+        return queryset.prefetch_related(
+            Prefetch('workouts', queryset=workouts),
+            Prefetch('favorite_exercises', queryset=Exercise.objects.prefetch_related('tags')),
+            'weight_entries',
+        )
+
         
 
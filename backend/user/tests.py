@@ -1,3 +1,464 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from exercise.models import Exercise, ExerciseRecord, Tag
+from main.nplusone import detect_nplusone
+from user.authentication import token_cache
+from user.cache import bump_data_version
+from user.models import User, WeightEntry
+from user.serializers import CreateWorkoutSerializer, SyncWorkoutSerializer
+from workout.models import WorkoutSession, WorkoutExercise
+
+
+def create_history(user, num_workouts, sets_per_workout=3):
+    # gives the user a workout history where every set points at its own exercise with its own tag,
+    # so any query that runs per object shows up in the query count.
+    for i in range(num_workouts):
+        workout = WorkoutSession.objects.create(user=user, name=f"workout {i}", date=date(2025, 1, 1) + timedelta(days=i))
+        for j in range(sets_per_workout):
+            tag = Tag.objects.create(name=f"tag {i}-{j}")
+            exercise = Exercise.objects.create(name=f"exercise {i}-{j}")
+            exercise.tags.add(tag)
+            WorkoutExercise.objects.create(workout=workout, exercise=exercise, reps=10, weight=100)
+        user.favorite_exercises.add(exercise)
+        WeightEntry.objects.create(user=user, weight=180, date_recorded=date(2025, 1, 1) + timedelta(days=i))
+
+
+class UserDashboardTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/api/user/{self.user.id}/")
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_dashboard_returns_nested_history(self):
+        create_history(self.user, 2)
+        response, _ = self.get_dashboard()
+
+        self.assertEqual(len(response.data['workouts']), 2)
+        self.assertEqual(len(response.data['workouts'][0]['workout_sets']), 3)
+        self.assertEqual(len(response.data['workouts'][0]['workout_sets'][0]['exercise']['tags']), 1)
+        self.assertEqual(len(response.data['favorite_exercises']), 2)
+        self.assertEqual(len(response.data['weight_entries']), 2)
+
+    def test_dashboard_query_count_does_not_grow_with_history(self):
+        create_history(self.user, 1)
+        _, small_history_queries = self.get_dashboard()
+
+        create_history(self.user, 20)
+        cache.clear() # create_history writes straight to the database, so the cached dashboard has to be dropped by hand
+        token_cache.clear() # and the first request cached the token lookup, put it back the way it was
+        _, large_history_queries = self.get_dashboard()
+
+        self.assertEqual(small_history_queries, large_history_queries)
+
+    def test_dashboard_has_no_nplusone(self):
+        create_history(self.user, 10)
+        with detect_nplusone(threshold=2, label="dashboard"):
+            self.get_dashboard()
+
+    def test_dashboard_recent_only_embeds_newest_workouts(self):
+        create_history(self.user, 5)
+        response = self.client.get(f"/api/user/{self.user.id}/?recent=2")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([workout['name'] for workout in response.data['workouts']], ["workout 4", "workout 3"])
+
+    def test_dashboard_rejects_bad_recent(self):
+        response = self.client.get(f"/api/user/{self.user.id}/?recent=abc")
+        self.assertEqual(response.status_code, 400)
+
+
+class WorkoutHistoryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+    def test_cursor_walks_whole_history_newest_first(self):
+        create_history(self.user, 7, sets_per_workout=1)
+        # two workouts on the same day, so the id has to break the tie
+        WorkoutSession.objects.create(user=self.user, name="same day", date=date(2025, 1, 7))
+        WorkoutSession.objects.create(user=self.user, name="no date", date=None)
+
+        names = []
+        url = "/api/user/workouts/?page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            names += [workout['name'] for workout in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(names, ["same day", "workout 6", "workout 5", "workout 4", "workout 3",
+                                 "workout 2", "workout 1", "workout 0", "no date"])
+
+    def test_page_size_is_capped(self):
+        create_history(self.user, 3, sets_per_workout=1)
+        response = self.client.get("/api/user/workouts/?page_size=100000")
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/user/workouts/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_only_returns_own_workouts(self):
+        other = User.objects.create_user(username="other", password="password123")
+        create_history(other, 2, sets_per_workout=1)
+        response = self.client.get("/api/user/workouts/")
+        self.assertEqual(response.data['results'], [])
+
+
+class LifetimeWeightLiftedTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+    def test_creating_a_workout_adds_its_volume(self):
+        payload = {
+            "name": "Leg day",
+            "date": "2025-05-01",
+            "workout_sets": [
+                {"exercise": {"name": "Squat", "tags": [{"name": "Leg"}]}, "reps": 5, "weight": 200},
+                {"exercise": {"name": "Squat", "tags": [{"name": "Leg"}]}, "reps": 5, "weight": 210},
+            ],
+        }
+        self.client.post("/user/create-workout/", payload, format="json")
+        self.client.post("/user/create-workout/", payload, format="json")
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.lifetime_weight_lifted, Decimal("4100.0"))
+
+    def test_recompute_command_matches_logged_sets(self):
+        create_history(self.user, 3) # 9 sets of 10 x 100
+        other = User.objects.create_user(username="other", password="password123", lifetime_weight_lifted=55)
+
+        call_command('recompute_lifetime_weight', chunk_size=1, stdout=StringIO())
+
+        self.user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.user.lifetime_weight_lifted, Decimal("9000.0"))
+        self.assertEqual(other.lifetime_weight_lifted, Decimal("0"))
+
+    def test_recompute_command_is_a_single_update_per_chunk(self):
+        create_history(self.user, 1)
+        User.objects.create_user(username="other", password="password123")
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('recompute_lifetime_weight', chunk_size=10, stdout=StringIO())
+
+        self.assertEqual([query['sql'].split()[0] for query in queries].count('UPDATE'), 1)
+        self.assertFalse(any('CASE WHEN' in query['sql'] for query in queries)) # no bulk_update of totals read earlier
+
+
+class UserResponseCacheTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+    def test_repeat_dashboard_load_only_authenticates(self):
+        create_history(self.user, 3)
+        first = self.client.get(f"/api/user/{self.user.id}/")
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(f"/api/user/{self.user.id}/")
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(len(queries), 0) # token lookup and response both come from cache
+
+    def test_logging_a_workout_invalidates_cached_reads(self):
+        self.assertEqual(self.client.get(f"/api/user/{self.user.id}/").data['workouts'], [])
+
+        payload = {"name": "Pull day", "date": "2025-05-01",
+                   "workout_sets": [{"exercise": {"name": "Row", "tags": [{"name": "Back"}]}, "reps": 10, "weight": 90}]}
+        self.client.post("/user/create-workout/", payload, format="json")
+
+        self.assertEqual(len(self.client.get(f"/api/user/{self.user.id}/").data['workouts']), 1)
+
+    def test_weigh_in_and_profile_update_invalidate_cached_reads(self):
+        self.assertEqual(len(self.client.get("/api/user/weightData/").data), 0)
+        self.client.post("/api/user/submitWeightData/", {"weight": 180}, format="json")
+        self.assertEqual(len(self.client.get("/api/user/weightData/").data), 1)
+
+        self.assertEqual(self.client.get(f"/user/profile/{self.user.id}/").data['first_name'], "")
+        self.client.patch(f"/user/profile/{self.user.id}/", {"first_name": "Sam"}, format="json")
+        self.assertEqual(self.client.get(f"/user/profile/{self.user.id}/").data['first_name'], "Sam")
+
+    def test_users_do_not_share_cached_responses(self):
+        other = User.objects.create_user(username="other", password="password123")
+        WeightEntry.objects.create(user=other, weight=150)
+        self.assertEqual(len(self.client.get("/api/user/weightData/").data), 0)
+
+        other_token = Token.objects.create(user=other)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {other_token.key}")
+        self.assertEqual(len(self.client.get("/api/user/weightData/").data), 1)
+
+    def test_in_process_cache_catches_up_with_other_workers(self):
+        # a weigh in saved by another worker bumps that worker's version, not this one's.
+        # with locmem (the test settings) this worker's version key runs out instead.
+        self.assertEqual(len(self.client.get("/api/user/weightData/").data), 0)
+        WeightEntry.objects.create(user=self.user, weight=180)
+        self.assertEqual(len(self.client.get("/api/user/weightData/").data), 0) # still cached
+
+        later = time.time() + settings.LOCAL_CACHE_VERSION_TIMEOUT + 1
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=later):
+            self.assertEqual(len(self.client.get("/api/user/weightData/").data), 1)
+
+
+class CreateWorkoutTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+    def post_workout(self, sets, workout_date="2025-05-01"):
+        payload = {
+            "name": "Push day",
+            "date": workout_date,
+            "workout_sets": [
+                {"exercise": {"name": name, "tags": [{"name": tag} for tag in tags]}, "reps": reps, "weight": weight}
+                for name, tags, reps, weight in sets
+            ],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/user/create-workout/", payload, format="json")
+        self.assertEqual(response.status_code, 201)
+        return response, len(queries)
+
+    def test_creates_sets_exercises_and_tags(self):
+        response, _ = self.post_workout([
+            ("Bench Press", ["Chest", "Arm"], 10, 100),
+            ("Bench Press", ["Chest"], 8, 110),
+            ("Dips", ["Chest"], 12, None),
+        ])
+
+        self.assertEqual(len(response.data['workout_sets']), 3)
+        self.assertEqual(Exercise.objects.count(), 2)
+        self.assertEqual(Tag.objects.count(), 2)
+        bench = Exercise.objects.get(name="Bench Press")
+        self.assertEqual(sorted(bench.tags.values_list('name', flat=True)), ["Arm", "Chest"])
+        self.assertEqual(list(Exercise.objects.get(name="Dips").tags.values_list('name', flat=True)), ["Chest"])
+
+    def test_reuses_existing_exercises_and_tags(self):
+        chest = Tag.objects.create(name="Chest")
+        bench = Exercise.objects.create(name="Bench Press")
+        bench.tags.add(chest)
+
+        self.post_workout([("Bench Press", ["Chest"], 10, 100)])
+
+        self.assertEqual(Exercise.objects.count(), 1)
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertEqual(WorkoutExercise.objects.get().exercise, bench)
+
+    def test_exercise_records_sum_reps_and_keep_best_weight(self):
+        self.post_workout([("Bench Press", ["Chest"], 10, 100), ("Bench Press", ["Chest"], 5, 120)], "2025-05-01")
+        record = ExerciseRecord.objects.get(user=self.user)
+        self.assertEqual((record.lifetime_reps, record.personal_record), (15, Decimal("120")))
+        self.assertIsNotNone(record.date_of_pr)
+
+        # a lighter workout adds reps but keeps the old PR and its date
+        ExerciseRecord.objects.update(date_of_pr=date(2020, 1, 1))
+        self.post_workout([("Bench Press", ["Chest"], 10, 90)], "2025-05-02")
+        record.refresh_from_db()
+        self.assertEqual((record.lifetime_reps, record.personal_record, record.date_of_pr), (25, Decimal("120"), date(2020, 1, 1)))
+
+        self.post_workout([("Bench Press", ["Chest"], 1, 130)], "2025-05-03")
+        record.refresh_from_db()
+        self.assertEqual((record.lifetime_reps, record.personal_record), (26, Decimal("130")))
+        self.assertNotEqual(record.date_of_pr, date(2020, 1, 1))
+
+    def test_record_created_by_a_concurrent_first_workout(self):
+        # the other request's insert lands right after our update found no bench press record
+        bench = Exercise.objects.create(name="Bench Press")
+        squat = Exercise.objects.create(name="Squat")
+        add_to_record = CreateWorkoutSerializer.add_to_record
+        raced = []
+
+        def racing_add_to_record(serializer, user, exercise_id, *args):
+            updated = add_to_record(serializer, user, exercise_id, *args)
+            if exercise_id == bench.id and not raced:
+                raced.append(True)
+                ExerciseRecord.objects.create(user=user, exercise=bench, lifetime_reps=10, personal_record=150)
+            return updated
+
+        with mock.patch.object(CreateWorkoutSerializer, 'add_to_record', autospec=True, side_effect=racing_add_to_record):
+            self.post_workout([("Bench Press", ["Chest"], 5, 100), ("Squat", ["Leg"], 3, 200)])
+
+        records = {record.exercise_id: record for record in ExerciseRecord.objects.filter(user=self.user)}
+        self.assertEqual((records[bench.id].lifetime_reps, records[bench.id].personal_record), (15, Decimal("150")))
+        self.assertEqual((records[squat.id].lifetime_reps, records[squat.id].personal_record), (3, Decimal("200")))
+        self.assertEqual(WorkoutSession.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_number_of_sets(self):
+        exercises = [("Bench Press", ["Chest"]), ("Squat", ["Leg"]), ("Curl", ["Arm"])]
+        self.post_workout([(name, tags, 10, 100) for name, tags in exercises]) # creates the catalog entries
+
+        _, few_sets_queries = self.post_workout([(name, tags, 10, 100) for name, tags in exercises])
+        _, many_sets_queries = self.post_workout([(name, tags, 10, 100) for name, tags in exercises * 10])
+
+        self.assertEqual(few_sets_queries, many_sets_queries)
+
+
+class SyncWorkoutsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+    def session(self, key, name="Offline workout"):
+        return {
+            "idempotency_key": key,
+            "name": name,
+            "date": "2025-05-01",
+            "workout_sets": [{"exercise": {"name": "Squat", "tags": [{"name": "Leg"}]}, "reps": 5, "weight": 200}],
+        }
+
+    def test_batch_creates_each_session_and_reports_results(self):
+        response = self.client.post("/user/sync-workouts/", [self.session("a"), self.session("b"), {"name": "no key"}], format="json")
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ["created", "created", "invalid"])
+        self.assertIn('idempotency_key', response.data['results'][2]['errors'])
+        self.assertEqual(WorkoutSession.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(WorkoutExercise.objects.count(), 2)
+
+    def test_replayed_batch_is_a_no_op(self):
+        first = self.client.post("/user/sync-workouts/", [self.session("a"), self.session("b")], format="json")
+        replay = self.client.post("/user/sync-workouts/", [self.session("a"), self.session("b"), self.session("c")], format="json")
+
+        self.assertEqual([result['status'] for result in replay.data['results']], ["duplicate", "duplicate", "created"])
+        self.assertEqual(replay.data['results'][0]['id'], first.data['results'][0]['id'])
+        self.assertEqual(WorkoutSession.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(ExerciseRecord.objects.get().lifetime_reps, 15) # duplicates didn't count their reps again
+
+    def test_duplicate_key_within_one_batch(self):
+        response = self.client.post("/user/sync-workouts/", [self.session("a"), self.session("a")], format="json")
+        self.assertEqual([result['status'] for result in response.data['results']], ["created", "duplicate"])
+
+    def test_keys_are_per_user(self):
+        other = User.objects.create_user(username="other", password="password123")
+        WorkoutSession.objects.create(user=other, name="theirs", idempotency_key="a")
+
+        response = self.client.post("/user/sync-workouts/", [self.session("a")], format="json")
+        self.assertEqual(response.data['results'][0]['status'], "created")
+
+    def test_non_string_keys_are_invalid(self):
+        response = self.client.post("/user/sync-workouts/",
+                                    [dict(self.session("a"), idempotency_key=["x"]), dict(self.session("b"), idempotency_key={"a": 1})],
+                                    format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data['results']], ["invalid", "invalid"])
+        self.assertEqual(WorkoutSession.objects.count(), 0)
+
+    def test_other_integrity_errors_are_not_reported_as_duplicates(self):
+        with mock.patch.object(SyncWorkoutSerializer, 'save', side_effect=IntegrityError("some other constraint")):
+            with self.assertRaises(IntegrityError):
+                self.client.post("/user/sync-workouts/", [self.session("a")], format="json")
+
+    def test_rejects_oversized_batch(self):
+        response = self.client.post("/user/sync-workouts/", [self.session(str(i)) for i in range(201)], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(WorkoutSession.objects.count(), 0)
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+    def weight_data_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/user/weightData/?latest=true")
+        return response.status_code, [query['sql'] for query in queries]
+
+    def test_token_lookup_is_cached(self):
+        _, first_queries = self.weight_data_queries()
+        bump_data_version(self.user.pk) # so the response itself isn't served from cache
+        _, second_queries = self.weight_data_queries()
+
+        self.assertEqual(len(second_queries), len(first_queries) - 1)
+        self.assertFalse(any('authtoken_token' in sql for sql in second_queries))
+
+    def test_deleting_token_logs_out_immediately(self):
+        self.assertEqual(self.weight_data_queries()[0], 200)
+        self.token.delete()
+        self.assertEqual(self.weight_data_queries()[0], 401)
+
+    def test_deactivating_user_logs_out_immediately(self):
+        self.assertEqual(self.weight_data_queries()[0], 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.weight_data_queries()[0], 401)
+
+    def test_invalid_token_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Token not-a-real-token")
+        self.assertEqual(self.weight_data_queries()[0], 401)
+
+    def test_profile_shows_fresh_lifetime_weight_lifted(self):
+        self.client.get(f"/user/profile/{self.user.id}/") # caches the token lookup with lifetime_weight_lifted = 0
+        payload = {"name": "Leg day", "date": "2025-05-01",
+                   "workout_sets": [{"exercise": {"name": "Squat", "tags": []}, "reps": 5, "weight": 200}]}
+        self.client.post("/user/create-workout/", payload, format="json")
+
+        response = self.client.get(f"/user/profile/{self.user.id}/")
+        self.assertEqual(Decimal(response.data['lifetime_weight_lifted']), Decimal("1000"))
+
+
+class WorkoutRecommendationsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+    def test_recommendations_come_from_lookup_table(self):
+        response = self.client.get("/api/user/recommendations/?muscle=Chest&sleep=85&feeling=4&limit=4")
+
+        self.assertEqual(response.status_code, 200)
+        recs = response.data['recommendations']
+        self.assertEqual(len(recs), 4)
+        scores = [rec['relevance'] for rec in recs]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_recommendations_validate_params(self):
+        self.assertEqual(self.client.get("/api/user/recommendations/?sleep=85&feeling=4").status_code, 400)
+        self.assertEqual(self.client.get("/api/user/recommendations/?muscle=Toes&sleep=85&feeling=4").status_code, 400)
+        self.assertEqual(self.client.get("/api/user/recommendations/?muscle=Chest&sleep=101&feeling=4").status_code, 400)
+        self.assertEqual(self.client.get("/api/user/recommendations/?muscle=Chest&sleep=high&feeling=4").status_code, 400)
@@ -7,9 +7,14 @@ urlpatterns = [
     path('register/', views.UserCreationAPIView.as_view()),
     path('user/profile/<int:userId>/', views.UserProfileAPIView.as_view()),
     path('api/user/<int:userId>/', views.UserDashboardAPIView.as_view()),
+    path('api/user/workouts/', views.WorkoutHistoryAPIView.as_view()),
+    path('api/user/volume/', views.VolumeRollupAPIView.as_view()),
     path('user/create-workout/', views.CreateWorkoutAPIView.as_view()),
+    path('user/sync-workouts/', views.SyncWorkoutsAPIView.as_view()),
     path('api/exercises/', views.ExerciseListAPIView.as_view()),
+    path('api/exercises/search/', views.ExerciseSearchAPIView.as_view()),
     path('api/exerciseStats/<int:exercise_pk>', views.ExerciseAPIView.as_view()),
     path('api/user/weightData/', views.WeightEntryView.as_view()),
     path('api/user/submitWeightData/', views.SubmitWeightEntry.as_view()),
+    path('api/user/recommendations/', views.GetWorkoutRecommendationsAPIView.as_view()),
 ]
\ No newline at end of file
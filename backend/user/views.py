@@ -3,20 +3,28 @@ from django.shortcuts import render
 # Create your views here.
 from rest_framework import generics, permissions, authentication
 from rest_framework.generics import GenericAPIView
-from user.serializers import UserLoginSerializer, UserRegistrationSerializer, UserDashboardSerializer, UserProfileSerializer, basicUserProfileSerializer, CreateWorkoutSerializer, WeightEntrySerializer
+from user.serializers import UserLoginSerializer, UserRegistrationSerializer, UserDashboardSerializer, UserProfileSerializer, basicUserProfileSerializer, CreateWorkoutSerializer, WeightEntrySerializer, WorkoutReadSerializer, VolumeRollupSerializer, SyncWorkoutSerializer
+from user.pagination import WorkoutHistoryPagination
+from user.cache import UserResponseCacheMixin, bump_data_version
 
 from exercise.serializers import ExerciseSerializer, ExerciseRecordSerializer
+from exercise.views import ExerciseListAPIView, ExerciseSearchAPIView # the catalog endpoints live with the exercise app, routed from user/urls.py
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework import status
 from .models import User, WeightEntry
 from exercise.models import Exercise, ExerciseRecord
-from rest_framework.authentication import TokenAuthentication
+from workout.models import WorkoutSession, WorkoutVolumeRollup
+from datetime import date, timedelta
+from rest_framework.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from user.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
 from rest_framework.views import APIView
 #from agent.multi_tool_agent.agent import workout_recommendation_agent
+from recommendation_model.recommendation_engine import lookup as recommendation_lookup
 
 # Typical journey for these APIViews
 
@@ -54,7 +62,7 @@ class UserLoginAPIView(GenericAPIView):
 class UserCreationAPIView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserRegistrationSerializer
-    authentication_classes = [authentication.SessionAuthentication, TokenAuthentication]
+    authentication_classes = [authentication.SessionAuthentication, CachedTokenAuthentication]
 
     def create(self, request, *args, **kwargs):
 
@@ -79,44 +87,169 @@ class UserCreationAPIView(generics.CreateAPIView):
     # But i also need to send with them a token so that the program knows they are authenticated, and that is not part of the object by default
     # thus we need to override.
 
-class UserDashboardAPIView(generics.RetrieveAPIView):
+class UserDashboardAPIView(UserResponseCacheMixin, generics.RetrieveAPIView):
     # standard behavior of RetrieveAPIView if we don't redefine get_object, is that it would use the pk/slug that it expects to find in the URL.
     # in this standard case, we would need to define a queryset, typically queryset = User.objects.all(), but since we override, and we have it in self.request.user
     # we dont need this line.
     # queryset = User.objects.all(), we don't need this here, because we manually defined the get_object. 
 
     serializer_class = UserDashboardSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated] # only uses who have been authenticated via token authentication have access to this api view
 
+    max_recent_workouts = 50
+
+    def get_queryset(self):
+        return UserDashboardSerializer.setup_eager_loading(User.objects.all(), recent=self.get_recent())
+
+    def get_recent(self):
+        # ?recent=N only embeds the N newest workouts instead of the whole history,
+        # older workouts can be paged through with WorkoutHistoryAPIView.
+        recent = self.request.query_params.get('recent')
+        if recent is None:
+            return None
+        try:
+            recent = int(recent)
+        except ValueError:
+            raise ValidationError({"recent": "recent must be a positive integer."})
+        if recent <= 0:
+            raise ValidationError({"recent": "recent must be a positive integer."})
+        return min(recent, self.max_recent_workouts)
+
     def get_object(self):
-        return self.request.user
+        # self.request.user has nothing prefetched on it, so we re-fetch the same user through the eager loading queryset.
+        return self.get_queryset().get(pk=self.request.user.pk)
+
+class WorkoutHistoryAPIView(UserResponseCacheMixin, generics.ListAPIView):
+    # the users workouts newest first, one page at a time. The response has a 'next' link with an opaque cursor,
+    # the frontend just follows it until it comes back null.
+    serializer_class = WorkoutReadSerializer
+    pagination_class = WorkoutHistoryPagination
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
 
-class UserProfileAPIView(generics.RetrieveUpdateAPIView):
+    def get_queryset(self):
+        return WorkoutReadSerializer.setup_eager_loading(WorkoutSession.objects.filter(user=self.request.user))
+
+class VolumeRollupAPIView(UserResponseCacheMixin, generics.ListAPIView):
+    # weekly or monthly training volume for the volume chart, read straight from the rollup table.
+    # ?period=week|month (default week), ?start=YYYY-MM-DD and ?end=YYYY-MM-DD (default the last year).
+    serializer_class = VolumeRollupSerializer
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        params = self.request.query_params
+        period = params.get('period', WorkoutVolumeRollup.WEEK)
+        if period not in (WorkoutVolumeRollup.WEEK, WorkoutVolumeRollup.MONTH):
+            raise ValidationError({"period": "period must be 'week' or 'month'."})
+        try:
+            end = date.fromisoformat(params['end']) if 'end' in params else date.today()
+            start = date.fromisoformat(params['start']) if 'start' in params else end - timedelta(days=365)
+        except ValueError:
+            raise ValidationError({"date": "start and end must be dates formatted as YYYY-MM-DD."})
+
+        return WorkoutVolumeRollup.objects.filter(
+            user=self.request.user,
+            period=period,
+            period_start__range=(start, end),
+        ).order_by('period_start')
+
+class UserProfileAPIView(UserResponseCacheMixin, generics.RetrieveUpdateAPIView):
     # queryset = User.objects.all() again we dont need this line for the same reason as in userdashboard.
     serializer_class = UserProfileSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user # dont need to look up a user, authenticated user is available in self.request.user, so thats what we return.
+        # request.user can be a copy from the token cache that's up to a minute old (lifetime_weight_lifted is
+        # updated with a bulk update that doesn't go through the user object), so read the row fresh.
+        # the response cache means this only runs after the users data actually changed.
+        return User.objects.get(pk=self.request.user.pk)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        bump_data_version(self.request.user.pk) # profile changed, so any cached dashboard/profile response is stale now.
 
 class CreateWorkoutAPIView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = CreateWorkoutSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
-class ExerciseListAPIView(generics.ListAPIView):
-    queryset = Exercise.objects.all()
-    serializer_class = ExerciseSerializer
-    authentication_classes = [TokenAuthentication]
+    def perform_create(self, serializer):
+        serializer.save()
+        bump_data_version(self.request.user.pk) # new workout, so the users cached reads are stale now.
+
+class SyncWorkoutsAPIView(APIView):
+    # offline sync: the app queues workouts while there's no signal and uploads them all at once here.
+    # every workout carries an idempotency_key made up by the device, so if an upload times out and the app
+    # sends the same batch again, workouts we already have are reported as duplicates instead of saved twice.
+    # the body is a list of workouts, and the response has one result per workout in the same order:
+    # {"idempotency_key": ..., "status": "created" | "duplicate" | "invalid", "id": ..., "errors": ...}
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    max_batch_size = 200
+    chunk_size = 20 # workouts saved per transaction, so one big upload doesn't hold locks for its whole duration
+
+    def post(self, request, *args, **kwargs):
+        sessions = request.data
+        if not isinstance(sessions, list):
+            return Response({"error": "expected a list of workouts"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(sessions) > self.max_batch_size:
+            return Response({"error": f"at most {self.max_batch_size} workouts per batch"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        seen_keys = {}
+        for start in range(0, len(sessions), self.chunk_size):
+            results += self.sync_chunk(sessions[start:start + self.chunk_size], seen_keys)
+
+        if any(result['status'] == 'created' for result in results):
+            bump_data_version(request.user.pk)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    def sync_chunk(self, sessions, seen_keys):
+        # seen_keys maps idempotency key -> workout id for everything earlier in this batch,
+        # plus whatever this chunk finds already in the database (one query per chunk).
+        keys = [session.get('idempotency_key') for session in sessions if isinstance(session, dict)]
+        seen_keys.update(
+            WorkoutSession.objects.filter(user=self.request.user, idempotency_key__in=[key for key in keys if key and isinstance(key, str)])
+            .values_list('idempotency_key', 'id')
+        )
+
+        results = []
+        with transaction.atomic():
+            for session in sessions:
+                key = session.get('idempotency_key') if isinstance(session, dict) else None
+                # anything but a string (a list, an object) can't be looked up, the serializer reports it as invalid
+                if isinstance(key, str) and key in seen_keys:
+                    results.append({"idempotency_key": key, "status": "duplicate", "id": seen_keys[key]})
+                    continue
+
+                serializer = SyncWorkoutSerializer(data=session, context={'request': self.request})
+                if not serializer.is_valid():
+                    results.append({"idempotency_key": key, "status": "invalid", "errors": serializer.errors})
+                    continue
+
+                try:
+                    with transaction.atomic(): # savepoint, so a conflicting workout doesn't undo the rest of the chunk
+                        workout = serializer.save()
+                except IntegrityError:
+                    # another upload of the same workout got saved between our lookup and now.
+                    # if there's no such workout the conflict was about something else, that's a real error
+                    workout = WorkoutSession.objects.filter(user=self.request.user, idempotency_key=key).first()
+                    if workout is None:
+                        raise
+                    results.append({"idempotency_key": key, "status": "duplicate", "id": workout.id})
+                else:
+                    results.append({"idempotency_key": key, "status": "created", "id": workout.id})
+                seen_keys[key] = workout.id
+        return results
 
 class ExerciseAPIView(generics.RetrieveAPIView):
     
     serializer_class = ExerciseRecordSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -133,9 +266,9 @@ class ExerciseAPIView(generics.RetrieveAPIView):
             # We explicitly raise the exception so DRF can handle it.
             raise
 
-class WeightEntryView(generics.ListAPIView):
+class WeightEntryView(UserResponseCacheMixin, generics.ListAPIView):
     serializer_class = WeightEntrySerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -150,11 +283,12 @@ class WeightEntryView(generics.ListAPIView):
 class SubmitWeightEntry(generics.CreateAPIView):
     queryset = WeightEntry.objects.all() # have to be able to map it to any user.
     serializer_class = WeightEntrySerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer): # because we need to set the foreign key, we need this perform_create
         serializer.save(user=self.request.user)
+        bump_data_version(self.request.user.pk)
         # perform_create is essentially a method to save the object to the database,
         # so at this point, a serializer object has been created,
         # its holding raw data from axios,
@@ -165,32 +299,33 @@ class SubmitWeightEntry(generics.CreateAPIView):
         # now we just save the object, but we also pass in user=self.request.user, filling in that user field
 
 class GetWorkoutRecommendationsAPIView(APIView):
+    # top exercises for a muscle group given how the user slept and feels.
+    # served from the precomputed lookup table (recommendation_engine/lookup.py), so this is one array index
+    # and the web process never imports torch. The table gets rebuilt with build_lookup.py after retraining.
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    max_limit = 10
 
     def get(self, request, *args, **kwargs):
-        user_id = request.user.id
-        agent = workout_recommendation_agent(user_id)
-
-
-
-
-
-
-
-
-
-
-    
-    
-
-
-
-    
-    
-
-
-
-
-
+        params = request.query_params
+        muscle_group = params.get('muscle')
+        if not muscle_group:
+            raise ValidationError({"muscle": "This query parameter is required."})
+        try:
+            sleep_score = int(params.get('sleep', ''))
+            feeling = int(params.get('feeling', ''))
+            limit = int(params.get('limit', 3))
+        except ValueError:
+            raise ValidationError({"detail": "sleep, feeling and limit have to be whole numbers."})
+        if not 1 <= limit <= self.max_limit:
+            raise ValidationError({"limit": f"Has to be between 1 and {self.max_limit}."})
 
+        try:
+            recs = recommendation_lookup.recommend(muscle_group, sleep_score, feeling, top_n=limit)
+        except ValueError as e: # unknown muscle group or a score outside the table
+            raise ValidationError({"detail": str(e)})
 
+        return Response({
+            "muscle_group": muscle_group,
+            "recommendations": [{"exercise": name, "relevance": score} for name, score in recs],
+        })
@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import WorkoutSession, WorkoutExercise
+from .models import WorkoutSession, WorkoutExercise, WorkoutVolumeRollup
 
 admin.site.register(WorkoutSession)
-admin.site.register(WorkoutExercise)
\ No newline at end of file
+admin.site.register(WorkoutExercise)
+admin.site.register(WorkoutVolumeRollup)
\ No newline at end of file
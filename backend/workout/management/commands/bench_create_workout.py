@@ -0,0 +1,67 @@
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from user.models import User
+from user.serializers import CreateWorkoutSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures how many queries and how long CreateWorkoutSerializer takes to save a workout, "
+        "for different numbers of sets. Everything runs in a transaction that gets rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sets', type=int, nargs='+', default=[1, 5, 10, 30, 60],
+                            help="Set counts to benchmark.")
+        parser.add_argument('--exercises', type=int, default=6,
+                            help="How many different exercises the sets are spread over.")
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="Saves per set count, the median time is reported.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'sets':>6} {'queries':>8} {'median ms':>10} {'p95 ms':>8}")
+        with transaction.atomic():
+            user = User.objects.create_user(username="bench_create_workout", password="bench-password-1")
+            request = SimpleNamespace(user=user)
+
+            for set_count in options['sets']:
+                payload = self.build_payload(set_count, options['exercises'])
+                self.save_workout(payload, request) # first save creates the exercises and tags, dont count it
+
+                timings = []
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        self.save_workout(payload, request)
+                        timings.append((time.perf_counter() - started) * 1000)
+
+                p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+                self.stdout.write(f"{set_count:>6} {len(queries):>8} {statistics.median(timings):>10.2f} {p95:>8.2f}")
+
+            transaction.set_rollback(True) # leave the database how we found it
+
+    def build_payload(self, set_count, exercise_count):
+        return {
+            "name": "Benchmark workout",
+            "date": "2025-01-01",
+            "workout_sets": [
+                {
+                    "exercise": {"name": f"Benchmark Exercise {i % exercise_count}", "tags": [{"name": f"Benchmark Tag {i % 3}"}]},
+                    "reps": 10,
+                    "weight": "100.0",
+                }
+                for i in range(set_count)
+            ],
+        }
+
+    def save_workout(self, payload, request):
+        serializer = CreateWorkoutSerializer(data=payload, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return serializer.data
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from user.models import User
+from workout.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the weekly and monthly volume rollups from the logged workout sets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help="Only rebuild this user id. Can be given more than once. Defaults to every user.")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="How many users to rebuild per transaction.")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id').values_list('id', flat=True)
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+
+        chunk_size = options['chunk_size']
+        chunk = []
+        total_users = 0
+        total_rollups = 0
+        # users are rebuilt a chunk at a time so a backfill never holds the whole table in memory or in one transaction
+        for user_id in users.iterator(chunk_size=chunk_size):
+            chunk.append(user_id)
+            if len(chunk) == chunk_size:
+                total_rollups += rebuild_rollups(chunk)
+                total_users += len(chunk)
+                chunk = []
+        if chunk:
+            total_rollups += rebuild_rollups(chunk)
+            total_users += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total_rollups} rollups for {total_users} users."))
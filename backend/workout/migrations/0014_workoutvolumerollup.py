@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout', '0013_alter_workoutexercise_exercise'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkoutVolumeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('total_volume', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('set_count', models.PositiveIntegerField(default=0)),
+                ('session_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='volume_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['period_start'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'period', 'period_start'), name='unique_user_period_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout', '0014_workoutvolumerollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutsession',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='workoutsession',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='unique_user_workout_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercise', '0007_tag_and_exercise_name_indexes'),
+        ('workout', '0015_workoutsession_idempotency_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workoutexercise',
+            index=models.Index(fields=['workout'], include=('exercise', 'reps', 'weight'), name='workoutset_workout_cover_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutsession',
+            index=models.Index(fields=['user', '-date', '-id'], name='workout_user_date_idx'),
+        ),
+    ]
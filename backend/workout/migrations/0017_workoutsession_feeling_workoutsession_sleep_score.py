@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:54
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout', '0016_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutsession',
+            name='feeling',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.AddField(
+            model_name='workoutsession',
+            name='sleep_score',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MaxValueValidator(100)]),
+        ),
+    ]
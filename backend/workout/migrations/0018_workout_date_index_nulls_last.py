@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workout', '0017_workoutsession_feeling_workoutsession_sleep_score'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='workoutexercise',
+            name='workoutset_workout_cover_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='workoutsession',
+            name='workout_user_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='workoutsession',
+            index=models.Index(models.F('user'), models.OrderBy(models.F('date'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='workout_user_date_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import F
 from exercise.models import Exercise
 from user.models import User
 import datetime
@@ -13,6 +15,23 @@ class WorkoutSession(models.Model):
     user = models.ForeignKey(User, related_name='workouts', on_delete=models.CASCADE)
     date = models.DateField(default=timezone.now, null=True, blank=True)
     elapsed_time = models.TimeField(default="00:00:00")
+    # generated on the device for workouts uploaded through the offline sync endpoint, so a retried upload
+    # can be recognised instead of saved twice. Workouts created the normal way leave it empty.
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+    # how the user slept (0-100, from their sleep tracker) and felt (1-5) going into the workout, both optional.
+    # these are the inputs of the recommendation model, sessions that have them become training data (recommendation_model/extraction.py)
+    sleep_score = models.PositiveSmallIntegerField(null=True, blank=True, validators=[MaxValueValidator(100)])
+    feeling = models.PositiveSmallIntegerField(null=True, blank=True, validators=[MinValueValidator(1), MaxValueValidator(5)])
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_user_workout_idempotency_key'),
+        ]
+        indexes = [
+            # a users workouts newest first: history pages, the dashboard ?recent=N, and date >= filters in the agent tools.
+            # same order as those queries, NULL dates last, or postgres won't walk the index for them.
+            models.Index(F('user'), F('date').desc(nulls_last=True), F('id').desc(), name='workout_user_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} created by {self.user.username}"
@@ -28,4 +47,28 @@ class WorkoutExercise(models.Model):
             return self.reps * self.weight
         else:
             return 0
-    
\ No newline at end of file
+    
+class WorkoutVolumeRollup(models.Model):
+    # running totals for each users week and month, so charts dont have to add up every set the user has ever done.
+    # rows get updated every time a workout is created (see workout/rollups.py), and can be rebuilt from scratch
+    # with `python manage.py rebuild_volume_rollups`.
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = [(WEEK, 'Week'), (MONTH, 'Month')]
+
+    user = models.ForeignKey(User, related_name='volume_rollups', on_delete=models.CASCADE)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField() # monday of the week, or the 1st of the month.
+    total_volume = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    set_count = models.PositiveIntegerField(default=0)
+    session_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # the unique constraint doubles as the index for reading a users chart: (user, period, period_start range)
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'period_start'], name='unique_user_period_rollup'),
+        ]
+        ordering = ['period_start']
+
+    def __str__(self):
+        return f"{self.user.username} - {self.period} of {self.period_start}: {self.total_volume}"
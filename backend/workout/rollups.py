@@ -0,0 +1,87 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from user.cache import invalidate_users
+from workout.models import WorkoutExercise, WorkoutVolumeRollup
+
+# helpers for keeping WorkoutVolumeRollup in sync with the workouts people log.
+
+PERIOD_TRUNCS = {
+    WorkoutVolumeRollup.WEEK: TruncWeek,
+    WorkoutVolumeRollup.MONTH: TruncMonth,
+}
+
+# reps * weight done in the database, same thing as WorkoutExercise.calculate_volume().
+# a set without a weight gives NULL, which SUM skips, same as calculate_volume returning 0.
+SET_VOLUME = ExpressionWrapper(F('reps') * F('weight'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def get_period_start(day, period):
+    if period == WorkoutVolumeRollup.WEEK:
+        return day - timedelta(days=day.weekday()) # monday, same as d3.timeMonday on the frontend
+    return day.replace(day=1)
+
+
+def get_total_volume(workout_sets):
+    return sum((Decimal(workout_set.calculate_volume()) for workout_set in workout_sets), Decimal(0))
+
+
+def add_workout_to_rollups(workout, workout_sets):
+    # called right after a workout and its sets are saved. workout_sets are the WorkoutExercise objects
+    # that were just created, so we don't need to query them back.
+    if workout.date is None:
+        return
+
+    volume = get_total_volume(workout_sets)
+    set_count = len(workout_sets)
+
+    for period in PERIOD_TRUNCS:
+        rollup, created = WorkoutVolumeRollup.objects.get_or_create(
+            user=workout.user,
+            period=period,
+            period_start=get_period_start(workout.date, period),
+        )
+        # F() expressions so two workouts saved at the same time both get counted.
+        WorkoutVolumeRollup.objects.filter(pk=rollup.pk).update(
+            total_volume=F('total_volume') + volume,
+            set_count=F('set_count') + set_count,
+            session_count=F('session_count') + 1,
+        )
+
+
+def rebuild_rollups(user_ids):
+    # recomputes every rollup for the given users straight from their sets, one aggregate query per period.
+    # used for backfills, or if the rollups ever drift from the real data.
+    with transaction.atomic():
+        WorkoutVolumeRollup.objects.filter(user_id__in=user_ids).delete()
+
+        rollups = []
+        for period, trunc in PERIOD_TRUNCS.items():
+            rows = (
+                WorkoutExercise.objects
+                .filter(workout__user_id__in=user_ids, workout__date__isnull=False)
+                .annotate(period_start=trunc('workout__date'))
+                .values('workout__user_id', 'period_start')
+                .annotate(
+                    total_volume=Sum(SET_VOLUME),
+                    set_count=Count('id'),
+                    session_count=Count('workout', distinct=True),
+                )
+                .order_by()
+            )
+            for row in rows:
+                rollups.append(WorkoutVolumeRollup(
+                    user_id=row['workout__user_id'],
+                    period=period,
+                    period_start=row['period_start'],
+                    total_volume=row['total_volume'] or 0,
+                    set_count=row['set_count'],
+                    session_count=row['session_count'],
+                ))
+        WorkoutVolumeRollup.objects.bulk_create(rollups)
+    invalidate_users(user_ids) # their cached volume charts are out of date now
+    return len(rollups)
@@ -1,3 +1,79 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from user.authentication import token_cache
+from user.models import User
+from workout.models import WorkoutVolumeRollup
+
+
+def workout_payload(workout_date, sets):
+    return {
+        "name": "Push day",
+        "date": workout_date.isoformat(),
+        "elapsed_time": "01:00:00",
+        "comment": "",
+        "workout_sets": [
+            {"exercise": {"name": name, "tags": [{"name": "Chest"}]}, "reps": reps, "weight": weight}
+            for name, reps, weight in sets
+        ],
+    }
+
+
+class VolumeRollupTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lifter", password="password123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        cache.clear()
+        token_cache.clear()
+
+    def log_workout(self, workout_date, sets):
+        response = self.client.post("/user/create-workout/", workout_payload(workout_date, sets), format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def rollups(self):
+        return list(
+            WorkoutVolumeRollup.objects.filter(user=self.user)
+            .order_by('period', 'period_start')
+            .values_list('period', 'period_start', 'total_volume', 'set_count', 'session_count')
+        )
+
+    def test_creating_workouts_updates_rollups(self):
+        # 2025-03-04 and 2025-03-06 are in the same week, 2025-03-10 starts the next one.
+        self.log_workout(date(2025, 3, 4), [("Bench Press", 10, 100), ("Bench Press", 8, 120)])
+        self.log_workout(date(2025, 3, 6), [("Push Ups", 20, 0)])
+        self.log_workout(date(2025, 3, 10), [("Bench Press", 5, 150)])
+
+        self.assertEqual(self.rollups(), [
+            ('month', date(2025, 3, 1), Decimal('2710.00'), 4, 3),
+            ('week', date(2025, 3, 3), Decimal('1960.00'), 3, 2),
+            ('week', date(2025, 3, 10), Decimal('750.00'), 1, 1),
+        ])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.log_workout(date(2025, 3, 4), [("Bench Press", 10, 100), ("Bench Press", 8, 120)])
+        self.log_workout(date(2025, 3, 31), [("Push Ups", 20, 0)])
+        self.log_workout(date(2025, 4, 1), [("Bench Press", 5, 150)])
+        incremental = self.rollups()
+
+        WorkoutVolumeRollup.objects.all().delete()
+        call_command('rebuild_volume_rollups', stdout=StringIO())
+
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_volume_endpoint_reads_requested_range(self):
+        self.log_workout(date(2025, 1, 6), [("Bench Press", 10, 100)])
+        self.log_workout(date(2025, 3, 4), [("Bench Press", 10, 100)])
+
+        response = self.client.get("/api/user/volume/?period=week&start=2025-02-01&end=2025-12-31")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['period_start'] for row in response.data], ["2025-03-03"])
+
+        response = self.client.get("/api/user/volume/?period=year")
+        self.assertEqual(response.status_code, 400)